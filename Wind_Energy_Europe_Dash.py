@@ -6,15 +6,40 @@ from dash.dependencies import Input, Output, State
 import dash_core_components as dcc
 import dash_html_components as html
 
+from flask import Response, g, jsonify, request
+from flask_compress import Compress
+
 import folium
 
 import pandas as pd
 import numpy as np
-import plotly
-import plotly.graph_objs as go
+import plotly.io as pio
+from plotly.colors import DEFAULT_PLOTLY_COLORS, get_colorscale
+from plotly.io.json import to_json_plotly
 import datetime
-from urllib.parse import quote
+import base64
+from urllib.parse import quote, unquote
+from collections import OrderedDict
+import hashlib
+import io
+import itertools
+import json
+import math
+import multiprocessing
 import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+# Arrow exports are only available when pyarrow is installed
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
 ########################################################################################################################
 # Initialization
@@ -27,29 +52,462 @@ server.secret_key = os.environ.get('secret_key', 'secret')
 app.css.append_css({
     "external_url": [css_dash, css_url],
 })
-layout_ini = go.Layout(paper_bgcolor='#01053c', plot_bgcolor='#01053c', font=dict(color='#ffffff'), height=700)
+# Responses are compressed with brotli (or gzip for older browsers)
+server.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+server.config['COMPRESS_MIN_SIZE'] = 500
+Compress(server)
 map_ini = folium.Map(location=(55, 15), zoom_start=3)
+str_map_ini = map_ini.get_root().render()
+
+
+########################################################################################################################
+# Figure Templates
+########################################################################################################################
+# Figures are plain dicts which skip the plotly validators. Each figure type patches the data and titles of a
+# precomputed layout. Values are converted as plotly would do: arrays are sent as typed arrays, titles become title
+# objects, texts strings, colorscale names their colors, and None values are dropped. Templates are shared, layouts are
+# therefore only changed at their top level
+def get_plotly_value(value):
+    if isinstance(value, dict):
+        dict_value = {}
+        for key, item in value.items():
+            if item is None:
+                continue
+            if key == 'title' and isinstance(item, str):
+                item = {'text': item}
+            elif key == 'text' and not isinstance(item, np.ndarray):
+                item = [str(text) for text in item] if isinstance(item, (list, pd.Index)) else str(item)
+            elif key == 'colorscale' and isinstance(item, str):
+                item = get_colorscale(item)
+            item = get_plotly_value(item)
+            # Empty objects are dropped, empty arrays of annotations or shapes as well
+            if not (isinstance(item, dict) and not item or key in ['annotations', 'shapes'] and isinstance(item, list)
+                    and not item):
+                dict_value[key] = item
+
+        return dict_value
+    if isinstance(value, (pd.Series, pd.Index)):
+        value = value.values
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'iuf':
+        return get_typed_array(value)
+    if isinstance(value, list) and value and isinstance(value[0], (dict, list)):
+        return [get_plotly_value(item) for item in value]
+
+    return value
+
+
+def get_typed_array(value):
+    # plotly.js has no 64 bits integers
+    if value.dtype.kind in 'iu' and value.dtype.itemsize == 8:
+        value = value.astype(np.int32 if not len(value) or np.abs(value).max() < 2 ** 31 else np.float64)
+    value = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder('<'))
+
+    dict_array = {'dtype': value.dtype.str[1:], 'bdata': base64.b64encode(value.tobytes()).decode()}
+    if value.ndim > 1:
+        dict_array['shape'] = ', '.join(str(size) for size in value.shape)
+
+    return dict_array
+
+
+def get_layout(layout_base, **kwargs):
+
+    return dict(layout_base, **get_plotly_value(kwargs))
+
+
+def get_figure(data, layout):
+
+    return {'data': [get_plotly_value(trace) for trace in data], 'layout': layout}
+
+
+def get_layout_download(layout):
+    # White variant of a layout for the downloaded figures
+    return dict(layout, paper_bgcolor='#ffffff', plot_bgcolor='#ffffff', font=dict(layout['font'], color='#000000'))
+
+
+layout_theme = get_layout({}, template=pio.templates[pio.templates.default].to_plotly_json(), paper_bgcolor='#01053c',
+                          plot_bgcolor='#01053c', font=dict(color='#ffffff'))
+layout_heatmap = get_layout(layout_theme, plot_bgcolor='#ffffff', height=700, margin=dict(l=50, r=0))
+layout_graph = get_layout(layout_theme, legend=dict(x=.35, y=1.1, orientation="h"), margin=dict(l=40, r=0), height=650)
+layout_country = get_layout(layout_graph, height=500)
+layout_ini = get_layout(layout_theme, height=700)
+# Annotations pointing at a point, and boxes at the corners of the graph
+ann_arrow = dict(xref='x', yref='y', showarrow=True, align='center', font=dict(color='#ffffff'), arrowhead=2,
+                 arrowsize=1, arrowwidth=2, arrowcolor='#000000', ax=-30, ay=-30, bordercolor='#c7c7c7', borderwidth=2,
+                 borderpad=4, bgcolor='#000000', opacity=0.8)
+ann_box = dict(xref='paper', yref='paper', showarrow=False, align='center', font=dict(color='#ffffff'),
+               bordercolor='#c7c7c7', borderwidth=2, borderpad=4, bgcolor='#000000', opacity=0.8)
+
+
+########################################################################################################################
+# Cache
+########################################################################################################################
+class LruCache:
+    # In-process cache bounded by the size of its values, least recently used values are evicted first
+    def __init__(self, max_mb):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.items = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key][0]
+            self.misses += 1
+
+            return None
+
+    def set(self, key, value, size=None):
+        if size is None:
+            size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.bytes -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self.items.popitem(last=False)[1][1]
+
+    def discard(self, func):
+        # Removes the values whose key is matching the given function
+        with self.lock:
+            for key in [key for key in self.items if func(key)]:
+                self.bytes -= self.items.pop(key)[1]
+
+    def clear(self):
+        self.discard(lambda key: True)
+
+    def stats(self):
+        with self.lock:
+            calls = self.hits + self.misses
+
+            return {'items': len(self.items), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': self.hits / calls if calls else 0}
+
+
+class DiskCache:
+    # SQLite cache shared by every worker of the host, kept between restarts. Access times are written by batches and
+    # the total size is kept in a meta row, so that reads never take the write lock and writes never scan the table
+    def __init__(self, path, max_mb, access_batch=64, access_delay=60):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.access_batch = access_batch
+        self.access_delay = access_delay
+        self.local = threading.local()
+        conn = self.connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, value BLOB, size INTEGER, access REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_access ON cache (access)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+            # Caches written before the meta row start from the size of their entries
+            conn.execute("INSERT OR IGNORE INTO meta SELECT 'size', COALESCE(SUM(size), 0) FROM cache")
+
+    def connect(self):
+        # Connections and pending access times are never shared between threads or forked processes
+        if getattr(self.local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.local.conn = sqlite3.connect(self.path, timeout=30)
+            self.local.conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.pid = os.getpid()
+            self.local.access = {}
+            self.local.access_time = time.time()
+
+        return self.local.conn
+
+    def write_access(self, conn):
+        # Within the transaction of the caller
+        conn.executemany('UPDATE cache SET access = ? WHERE key = ?',
+                         [(access, key) for key, access in self.local.access.items()])
+        self.local.access = {}
+        self.local.access_time = time.time()
+
+    def contains(self, key):
+        try:
+            return self.connect().execute('SELECT 1 FROM cache WHERE key = ?', (key,)).fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def get(self, key):
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.local.access[key] = time.time()
+            if len(self.local.access) >= self.access_batch or \
+                    time.time() - self.local.access_time > self.access_delay:
+                with conn:
+                    self.write_access(conn)
+
+            return pickle.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        conn = self.connect()
+        try:
+            # One transaction per write, readers never see a partial entry. The size row is updated first, so that
+            # the write lock is taken before anything is read
+            with conn:
+                conn.execute("UPDATE meta SET value = value + ? - COALESCE((SELECT size FROM cache WHERE key = ?), 0) "
+                             "WHERE name = 'size'", (len(data), key))
+                conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                             (key, sqlite3.Binary(data), len(data), time.time()))
+                self.write_access(conn)
+                size = conn.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+                if size > self.max_bytes:
+                    # Oldest entries are removed until 90% of the budget is reached
+                    rows = conn.execute('SELECT key, size FROM cache ORDER BY access').fetchall()
+                    list_key = []
+                    for row in rows:
+                        if size <= 0.9 * self.max_bytes:
+                            break
+                        list_key.append((row[0],))
+                        size -= row[1]
+                    conn.executemany('DELETE FROM cache WHERE key = ?', list_key)
+                    conn.execute("UPDATE meta SET value = ? WHERE name = 'size'", (size,))
+        except sqlite3.Error:
+            pass
+
+
+class Prefetcher:
+    # Computes outputs likely to be requested next in a low priority thread, while the worker is idle
+    def __init__(self, cpu_budget):
+        # Share of a core, 0 or less disabling it and more than 1 meaning no pause between tasks
+        self.cpu_budget = min(cpu_budget, 1)
+        self.tasks = OrderedDict()
+        self.cond = threading.Condition()
+        self.load = 0
+        self.pid = None
+
+    def add(self, name, list_task, func):
+        if self.cpu_budget <= 0:
+            return
+        with self.cond:
+            # Pending tasks of the same callback are outdated by the new request
+            for key in [key for key, task in self.tasks.items() if task[0] == name]:
+                del self.tasks[key]
+            for args, years in list_task:
+                self.tasks[get_cache_key(name, args, years)] = (name, args, years, func)
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                threading.Thread(target=self.run, daemon=True).start()
+            self.cond.notify()
+
+    def start_request(self):
+        with self.cond:
+            self.load += 1
+
+    def end_request(self):
+        with self.cond:
+            self.load -= 1
+            self.cond.notify()
+
+    def run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self.cond:
+                while not self.tasks or self.load > 0:
+                    self.cond.wait()
+                name, args, years, func = self.tasks.popitem(last=False)[1]
+            # Tasks are dropped when the host is already busy
+            if hasattr(os, 'getloadavg') and os.getloadavg()[0] > os.cpu_count():
+                continue
+            # Key of the data at execution time, which may have been reloaded since the task was added
+            key = get_cache_key(name, args, years)
+            if cache_disk.contains(key):
+                continue
+            time_start = time.time()
+            try:
+                output = func(*args)
+                # Outputs computed during a reload are dropped, as their data may not match the key
+                if get_cache_key(name, args, years) == key:
+                    cache_disk.set(key, output)
+            except Exception:
+                pass
+            time.sleep((time.time() - time_start) * (1 - self.cpu_budget) / self.cpu_budget)
+
+
+cache_graph = LruCache(float(os.environ.get('cache_graph_mb', 32)))
+cache_response = LruCache(float(os.environ.get('cache_response_mb', 64)))
+cache_disk = DiskCache(os.path.join(os.environ.get('cache_dir', 'cache'), 'cache.sqlite'),
+                       float(os.environ.get('cache_disk_mb', 512)))
+prefetcher = Prefetcher(float(os.environ.get('prefetch_cpu', 0.5)))
+
+
+########################################################################################################################
+# Partitioned Data
+########################################################################################################################
+class PartitionedData:
+    # Hourly data stored as one matrix per year. Matrices are column-major and memory-mapped, so only the
+    # pages of the selected countries (or regions) of the selected years are read
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.hash = meta['hash']
+        self.columns = meta['columns']
+        self.years = meta['years']
+        self.year_hash = meta['year_hash']
+        self.col_idx = {col: idx for idx, col in enumerate(self.columns)}
+
+    def load(self, years, columns, mask=None):
+        list_df = []
+        for year in years:
+            if year not in self.years:
+                continue
+            path_year = os.path.join(self.path, str(year))
+            time_year = np.load(os.path.join(path_year, 'time.npy')).astype(np.int64)
+            values = np.load(os.path.join(path_year, 'data.npy'), mmap_mode='r')
+            dict_col = {name: time_year[:, idx] for idx, name in enumerate(list_time)}
+            for col in columns:
+                if mask is None or mask(year, col):
+                    dict_col[col] = np.array(values[:, self.col_idx[col]])
+                else:
+                    dict_col[col] = np.full(len(time_year), np.nan)
+            list_df.append(pd.DataFrame(dict_col))
+        if not list_df:
+            return pd.DataFrame(columns=list_time + list(columns))
+
+        return pd.concat(list_df, ignore_index=True)
+
+
+list_time = ['Year', 'Month', 'Day', 'Hour']
+
+
+def get_file_hash(file):
+    file_hash = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def write_years(file, path):
+    # The csv file is read by chunks, peak memory is about one year of data
+    columns = None
+    dict_chunk = {}
+    dict_hash = {}
+
+    def write_year(year):
+        df_year = pd.concat(dict_chunk.pop(year))
+        path_year = os.path.join(path, str(year))
+        time_year = df_year[list_time].values.astype(np.int16)
+        data_year = df_year[columns].values.astype(np.float64)
+        if str(year) in dict_hash:
+            # Rows of a year were not contiguous in the csv file
+            time_year = np.concatenate([np.load(os.path.join(path_year, 'time.npy')), time_year])
+            data_year = np.concatenate([np.load(os.path.join(path_year, 'data.npy')), data_year])
+        else:
+            os.makedirs(path_year)
+        np.save(os.path.join(path_year, 'time.npy'), time_year)
+        np.save(os.path.join(path_year, 'data.npy'), np.asfortranarray(data_year))
+        dict_hash[str(year)] = hashlib.sha1(time_year.tobytes() + data_year.tobytes()).hexdigest()
+
+    for chunk in pd.read_csv(file, chunksize=100000, low_memory=False):
+        if columns is None:
+            columns = [col for col in chunk.columns if col not in list_time]
+        for df_gr in chunk.groupby('Year'):
+            dict_chunk.setdefault(df_gr[0], []).append(df_gr[1])
+        for year in [year for year in dict_chunk if year < chunk['Year'].max()]:
+            write_year(year)
+    for year in list(dict_chunk):
+        write_year(year)
+
+    return columns, dict_hash
+
+
+def write_meta(path, meta):
+    # Readers either see the previous or the new metadata
+    path_tmp = os.path.join(path, 'meta.json.tmp{}'.format(os.getpid()))
+    with open(path_tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(path_tmp, os.path.join(path, 'meta.json'))
+
+
+def write_partitions(file, path, file_hash):
+    path_tmp = '{}.tmp{}'.format(path, os.getpid())
+    shutil.rmtree(path_tmp, ignore_errors=True)
+    os.makedirs(path_tmp)
+
+    columns, dict_hash = write_years(file, path_tmp)
+    write_meta(path_tmp, {'hash': file_hash, 'columns': columns, 'years': sorted(int(year) for year in dict_hash),
+                          'year_hash': dict_hash})
+    try:
+        os.rename(path_tmp, path)
+    except OSError:
+        # Another worker has written the same partitions
+        shutil.rmtree(path_tmp, ignore_errors=True)
+
+
+def append_partitions(file, path):
+    # New years are written aside, then moved into the store before its metadata is replaced
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    path_tmp = os.path.join(path, 'tmp{}'.format(os.getpid()))
+    shutil.rmtree(path_tmp, ignore_errors=True)
+    os.makedirs(path_tmp)
+
+    try:
+        columns, dict_hash = write_years(file, path_tmp)
+        if columns != meta['columns']:
+            raise ValueError('Columns of {} are not the stored ones'.format(file))
+        for year in dict_hash:
+            if int(year) in meta['years']:
+                raise ValueError('Year {} is already stored'.format(year))
+        for year in dict_hash:
+            os.rename(os.path.join(path_tmp, year), os.path.join(path, year))
+        meta['years'] = sorted(meta['years'] + [int(year) for year in dict_hash])
+        meta['year_hash'].update(dict_hash)
+        write_meta(path, meta)
+    finally:
+        shutil.rmtree(path_tmp, ignore_errors=True)
+
+    return sorted(int(year) for year in dict_hash)
+
+
+def read_capacity(file):
+    df_capacity = pd.read_csv(file, low_memory=False)
+    df_capacity.set_index('GEO/TIME', inplace=True)
+    df_capacity.columns = pd.to_numeric(df_capacity.columns)
+
+    return df_capacity
+
+
+def open_partitions(file, root):
+    file_hash = get_file_hash(file)
+    path = os.path.join(root, file_hash)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        write_partitions(file, path, file_hash)
+
+    return PartitionedData(path)
 
 
 ########################################################################################################################
 # Import Data
 ########################################################################################################################
-# Load Factor Data
-df_data = pd.read_csv('Load_Factor_Europe_Wind.csv', low_memory=False)
-list_country = df_data.columns[4:]
-list_country = list_country.sort_values()
+# Load Factor Data, per country or per region (NUTS-2) depending on the given file
+data_store = open_partitions(os.environ.get('data_file', 'Load_Factor_Europe_Wind.csv'),
+                             os.path.join(os.environ.get('cache_dir', 'cache'), 'data'))
+list_country = pd.Index(data_store.columns).sort_values()
+list_year = data_store.years
 # Capacity Data
-df_cap = pd.read_csv('Capacity_EU_Wind.csv', low_memory=False)
-df_cap.set_index('GEO/TIME', inplace=True)
-df_cap.columns = pd.to_numeric(df_cap.columns)
-# Cleans the load factor file
-for year in list(set(df_data['Year'])):
-    for country in list_country:
-        if country in df_cap.index:
-            if year not in df_cap.columns or np.isnan(df_cap[year][country]):
-                df_data.loc[df_data['Year'] == year, country] = np.nan
-        else:
-            df_data.loc[df_data['Year'] == year, country] = np.nan
+df_cap = read_capacity('Capacity_EU_Wind.csv')
 # GeoJson for the map
 europe_geo = pd.read_json(open('Europe_Geojson.txt'))
 # Get properties from the GeoJson
@@ -57,91 +515,699 @@ df_euro = pd.DataFrame()
 for feature in europe_geo['features']:
     df_euro.loc[feature['properties']['iso_a2'], 'Code'] = feature['properties']['iso_a2']
     df_euro.loc[feature['properties']['iso_a2'], 'Name'] = feature['properties']['name']
-# Get country location
+# Get country location, regions take the name and location of their country
 df_pos = pd.read_json('Europe_Location_Geojson.json')
 for country in list_country:
-    pos = df_pos.loc[df_pos['cca2'] == country, 'latlng'].item()
+    if country not in df_euro.index:
+        df_euro.loc[country, 'Code'] = country
+        df_euro.loc[country, 'Name'] = '{} {}'.format(df_euro.loc[country[:2], 'Name'], country)
+    pos = df_pos.loc[df_pos['cca2'] == country[:2], 'latlng'].item()
     df_euro.loc[country, 'Lat'] = pos[0]
     df_euro.loc[country, 'Lon'] = pos[1]
 # Country list
 drop_country = []
 for country in list_country:
     drop_country.append(df_euro.loc[df_euro['Code'] == country, 'Name'].item())
+# Custom graph types
+list_type = ['Scatter', 'Versus', 'LF Rep.', 'LF Percentiles', 'Time Rep.', 'Stacked', 'Lag Corr.', 'Correlation',
+             'Corr. Distance', 'Anomaly', 'Ramp Rep.', 'Ramp Extremes', 'Ramp Div.', 'Production', 'Prod. Share',
+             'Optimal Mix']
+# Static files hash, this file is included so that a new release never serves outdated figures
+static_hash = hashlib.sha1()
+for file in ['Europe_Geojson.txt', 'Europe_Location_Geojson.json', __file__]:
+    static_hash.update(get_file_hash(file).encode())
+static_hash = static_hash.hexdigest()
 
 
 ########################################################################################################################
 # Global Functions
 ########################################################################################################################
-def create_fig_load_year():
-    df_data_y = pd.DataFrame()
-    for df_gr in df_data.groupby('Year'):
-        for country in df_gr[1][list_country]:
-            df_data_y.loc[df_gr[0], country] = df_gr[1][country].mean()
+def get_capacity_mask(df_capacity):
+    # Load factors are removed when the capacity of the country is unknown
+    def has_capacity(year, column):
+        country = column[:2]
+
+        return country in df_capacity.index and year in df_capacity.columns and \
+            not np.isnan(df_capacity[year][country])
+
+    return has_capacity
+
+
+def get_year_hash(store, df_capacity):
+    # Outputs of a year only change with its load factors and capacities
+    dict_hash = {}
+    for year in sorted(set(store.years) | set(df_capacity.columns)):
+        data = store.year_hash.get(str(year), '')
+        cap = df_capacity[year].to_json() if year in df_capacity.columns else ''
+        dict_hash[year] = hashlib.sha1((data + cap + static_hash).encode()).hexdigest()
+
+    return dict_hash
+
+
+def get_data_hash(year_hash):
+    # Identity of the whole data, the same in every worker and across restarts
+    return hashlib.sha1(json.dumps(year_hash, sort_keys=True).encode()).hexdigest()
+
+
+def get_year_stats(year):
+    # Pairwise statistics of a year, 12 x 4 x N x N, built on first use so that only the years asked for are kept in
+    # memory. Years without data have none
+    stats = dict_year_stats.get(year)
+    if stats is None and year in list_year:
+        with lazy_lock:
+            stats = dict_year_stats.get(year)
+            if stats is None:
+                stats = build_year_stats(year, data_store, has_capacity)
+                dict_year_stats[year] = stats
+
+    return stats
+
+
+def build_year_stats(year, store, mask):
+    # Count, sums, sums of squares and cross-products per month, for every pair of countries over the hours where
+    # both are known. Statistics of any period are then the sum of its months
+    df_year = store.load([year], list_country, mask)
+    stats = np.zeros((12, 4, len(list_country), len(list_country)))
+    for df_gr in df_year.groupby('Month'):
+        values = df_gr[1][list_country].values
+        valid = (~np.isnan(values)).astype(float)
+        values = np.nan_to_num(values)
+        stats[df_gr[0] - 1] = [valid.T @ valid, values.T @ valid, (values ** 2).T @ valid, values.T @ values]
+
+    return stats
+
+
+def build_year_mean(year, store, mask):
+    # Count and sum of every country per month, 12 x 2 x N, enough for the means of every year kept at start
+    df_year = store.load([year], list_country, mask)
+    mean = np.zeros((12, 2, len(list_country)))
+    for df_gr in df_year.groupby('Month'):
+        values = df_gr[1][list_country].values
+        mean[df_gr[0] - 1] = [(~np.isnan(values)).sum(axis=0), np.nansum(values, axis=0)]
+
+    return mean
+
+
+def get_mean_year(year_mean):
+    df_data_y = pd.DataFrame(columns=list_country, dtype=float)
+    for year in sorted(year_mean):
+        mean = year_mean[year].sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df_data_y.loc[year] = mean[1] / mean[0]
+
+    return df_data_y
+
+
+def get_month_mean(year):
+    # Mean load factor of every country per month, from the year counts and sums
+    mean = dict_year_mean[year]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame(mean[:, 1] / mean[:, 0], index=range(1, 13), columns=list_country)
+
+
+def get_sum_stats(years, months=range(1, 13)):
+    stats = np.zeros((4, len(list_country), len(list_country)))
+    for year in years:
+        year_stats = get_year_stats(year)
+        if year_stats is not None:
+            for month in months:
+                stats += year_stats[month - 1]
+
+    return stats
+
+
+def get_corr(years, months=range(1, 13)):
+    # Correlation matrix of the given years and months, same as pandas .corr() on the hourly data
+    count, sum_x, sum_xx, sum_xy = get_sum_stats(years, months)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = count * sum_xx - sum_x ** 2
+        corr = (count * sum_xy - sum_x * sum_x.T) / np.sqrt(var * var.T)
+
+    return pd.DataFrame(corr, index=list_country, columns=list_country)
+
+
+def get_joint_low(year):
+    # Percentage of the hours where both countries are below each of joint_low_per, over the hours where both are
+    # known. Low hours of every threshold are one boolean matrix, joint counts of all pairs one matrix product. Kept
+    # per year hash
+    key = (year, dict_year_hash[year])
+    joint_low = dict_joint_low.get(key)
+    if joint_low is None:
+        values = get_data([year])[list_country].values
+        low = np.stack([values < per / 100 for per in joint_low_per]).astype(np.float32)
+        count = get_year_stats(year)[:, 0].sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            joint_low = 100 * np.matmul(low.transpose(0, 2, 1), low) / count
+        dict_joint_low[key] = joint_low
+
+    return joint_low
+
+
+def get_distance(columns):
+    # Great-circle distances between the centroids of the countries [km]
+    lat = np.radians(df_euro.loc[columns, 'Lat'].values.astype(float))
+    lon = np.radians(df_euro.loc[columns, 'Lon'].values.astype(float))
+    hav = np.sin((lat[:, None] - lat) / 2) ** 2 + \
+        np.cos(lat[:, None]) * np.cos(lat) * np.sin((lon[:, None] - lon) / 2) ** 2
+
+    return 2 * 6371 * np.arcsin(np.sqrt(hav))
+
+
+def get_corr_distance(df_data_corr):
+    # Correlation and distance of each pair of countries having data
+    idx_i, idx_j = np.triu_indices(len(list_country), k=1)
+    corr = df_data_corr.values[idx_i, idx_j]
+    valid = ~np.isnan(corr)
+
+    return arr_distance[idx_i, idx_j][valid], corr[valid]
+
+
+def get_decay_length(distance, corr):
+    # Least squares fit of corr = exp(-distance / length) on the log of the positive correlations
+    valid = (corr > 0) & (distance > 0)
+    log_corr = np.log(corr[valid])
+    if log_corr.sum() >= 0:
+        return np.nan
+
+    return -(distance[valid] ** 2).sum() / (distance[valid] * log_corr).sum()
+
+
+def get_moments(years, months=range(1, 13)):
+    # Mean load factors and pairwise covariance matrix of the countries having data in the given years and months
+    count, sum_x, sum_xx, sum_xy = get_sum_stats(years, months)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.diagonal(sum_x) / np.diagonal(count)
+        cov = (count * sum_xy - sum_x * sum_x.T) / count ** 2
+    list_country_m = list_country[~np.isnan(mean)]
+    df_cov = pd.DataFrame(cov, index=list_country, columns=list_country).loc[list_country_m, list_country_m]
+
+    return pd.Series(mean, index=list_country)[list_country_m], df_cov.fillna(0)
+
+
+def get_min_quad(cov, vec_a):
+    # Minimizes y.cov.y subject to vec_a.y = 1 and y >= 0 with a primal active set method, small enough to be solved
+    # in a few milliseconds for every country
+    cov = cov + 1e-9 * np.trace(cov) * np.eye(len(cov))
+    idx_ini = np.argmax(vec_a)
+    y = np.zeros(len(cov))
+    y[idx_ini] = 1 / vec_a[idx_ini]
+    free = np.zeros(len(cov), dtype=bool)
+    free[idx_ini] = True
+    for _ in range(10 * len(cov)):
+        # Optimum of the equality problem on the free countries
+        z = np.zeros(len(cov))
+        inv_a = np.linalg.solve(cov[np.ix_(free, free)], vec_a[free])
+        z[free] = inv_a / (vec_a[free] @ inv_a)
+        if (z[free] >= 0).all():
+            y = z
+            grad = 2 * cov @ y - 2 / (vec_a[free] @ inv_a) * vec_a
+            grad[free] = 0
+            if grad.min() >= -1e-12:
+                break
+            free[np.argmin(grad)] = True
+        else:
+            # Move towards it until a country leaves the mix
+            neg = free & (z < 0)
+            step = y[neg] / (y[neg] - z[neg])
+            y = y + step.min() * (z - y)
+            y[np.flatnonzero(neg)[np.argmin(step)]] = 0
+            free = free & (y > 0)
+
+    return y
+
+
+def get_optimal_mix(years, lf_min=None):
+    # Capacity shares minimizing the variance of the aggregate load factor, or maximizing its distance to lf_min in
+    # standard deviations, which minimizes the time below lf_min for a normal distribution
+    mean, df_cov = get_moments(years)
+    # No country with data, or no covariance, filled with zeros when missing
+    if mean.empty or not df_cov.values.any():
+        return pd.Series(dtype=float)
+    if lf_min is None:
+        vec_a = np.ones(len(mean))
+    else:
+        vec_a = mean.values - lf_min
+    if vec_a.max() <= 0:
+        y = (mean.values == mean.max()).astype(float)
+    else:
+        y = get_min_quad(df_cov.values, vec_a)
+
+    return pd.Series(y / y.sum(), index=mean.index)
+
+
+def get_mix_stats(mix, mean, df_cov, lf_min):
+    mix = mix[mix.index.isin(mean.index)]
+    mix = mix / mix.sum()
+    mean_mix = mean[mix.index] @ mix
+    std_mix = np.sqrt(max(mix @ df_cov.loc[mix.index, mix.index] @ mix, 0))
+    if std_mix > 0:
+        below = 50 * (1 + math.erf((lf_min - mean_mix) / std_mix / np.sqrt(2)))
+    else:
+        below = 100 * float(mean_mix < lf_min)
+
+    return mean_mix, std_mix, below
+
+
+def get_lf_matrix():
+    # All hourly load factors as one float32 matrix whatever the historical capacities, valid_cap keeping the hours of
+    # known capacities as get_data. Built on first use
+    global lf_matrix
+    matrix = lf_matrix
+    if matrix is None:
+        # Threads asking for it meanwhile wait for the first one
+        with lazy_lock:
+            matrix = lf_matrix
+            if matrix is None:
+                matrix = build_lf_matrix()
+                lf_matrix = matrix
+
+    return matrix
+
+
+def build_lf_matrix():
+    df_all = data_store.load(list_year, list_country)
+    day, idx_day = np.unique(df_all['Year'].values * 10000 + df_all['Month'].values * 100 + df_all['Day'].values,
+                             return_inverse=True)
+    values = df_all[list_country].values.astype(np.float32)
+    idx_year = np.searchsorted(list_year, df_all['Year'].values)
+    # Hours the rest of the dashboard shows, where the capacity of the country is known as in get_data
+    has_cap = np.array([[has_capacity(year, country) for country in list_country] for year in list_year])
+    matrix = {'values': np.nan_to_num(values),
+              'valid': ~np.isnan(values),
+              'valid_cap': ~np.isnan(values) & has_cap[idx_year],
+              'idx_year': idx_year,
+              'month': df_all['Month'].values - 1,
+              'time': pd.DatetimeIndex(pd.to_datetime(df_all[list_time].rename(columns=str.lower))),
+              'day': pd.to_datetime(day.astype(str), format='%Y%m%d'),
+              'idx_day': idx_day}
+    matrix['eu'] = get_lf_eu(matrix)
+
+    return matrix
+
+
+def get_lf_eu(matrix):
+    # European load factor with the capacities of each year, NaN for years without capacities
+    cap_year = np.array([get_base_capacity(year).values if year in df_cap.columns else np.zeros(len(list_country))
+                         for year in list_year])
+    weights = cap_year[matrix['idx_year']] * matrix['valid']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lf_eu = (matrix['values'] * weights).sum(axis=1) / weights.sum(axis=1)
+
+    return lf_eu
+
+
+def get_climatology():
+    # Mean and percentiles of every country per day of year and hour over all years, with the hourly anomalies to the
+    # mean stored as int16 hundredths of percent, over the hours of known capacities. Computed once per data and
+    # capacities version and saved next to the partitions
+    global climatology
+    clim = climatology
+    if clim is None:
+        with lazy_lock:
+            clim = climatology
+            if clim is None:
+                clim = build_climatology()
+                climatology = clim
+
+    return clim
+
+
+def build_climatology():
+    matrix = get_lf_matrix()
+    day_start = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+    group = (day_start[matrix['month']] + matrix['time'].day.values - 1) * 24 + matrix['time'].hour.values
+    clim_key = hashlib.sha1(json.dumps(dict_year_hash, sort_keys=True).encode()).hexdigest()
+    file = os.path.join(data_store.path, 'climatology_{}.npz'.format(clim_key))
+    clim = None
+    try:
+        with np.load(file) as npz:
+            clim = dict(npz)
+    except Exception:
+        # Not computed yet, removed by an ingest meanwhile or unreadable, it is computed again
+        pass
+    if clim is None:
+        # Values of each group are sorted in a cube padded with NaN, so that percentiles are taken from the valid ones
+        order = np.argsort(group, kind='stable')
+        group_start = np.searchsorted(group[order], np.arange(366 * 24))
+        rank = np.arange(len(order)) - group_start[group[order]]
+        cube = np.full((366 * 24, rank.max() + 1, len(list_country)), np.nan, dtype=np.float32)
+        cube[group[order], rank] = np.where(matrix['valid_cap'], matrix['values'], np.nan)[order]
+        cube.sort(axis=1)
+        count = (~np.isnan(cube)).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.nansum(cube, axis=1) / count
+        list_per = []
+        for per in clim_per:
+            pos = np.maximum(count - 1, 0) * per / 100
+            low = np.take_along_axis(cube, np.floor(pos).astype(int)[:, None], axis=1)[:, 0]
+            high = np.take_along_axis(cube, np.ceil(pos).astype(int)[:, None], axis=1)[:, 0]
+            list_per.append(low + (high - low) * (pos - np.floor(pos)))
+
+        anomaly = np.where(matrix['valid_cap'], np.round(10000 * (matrix['values'] - mean[group])), -32768)
+        anomaly = anomaly.astype(np.int16)
+        valid_year = np.add.reduceat(matrix['valid_cap'], np.searchsorted(matrix['idx_year'], range(len(list_year))))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            year = np.add.reduceat(np.where(matrix['valid_cap'], anomaly, 0).astype(float),
+                                   np.searchsorted(matrix['idx_year'], range(len(list_year)))) / valid_year / 10000
+        clim = {'mean': mean.astype(np.float32), 'per': np.array(list_per, dtype=np.float32), 'anomaly': anomaly,
+                'year': year}
+
+        # Readers either see no file or the whole one, other workers writing the same file meanwhile
+        path_tmp = '{}.tmp{}.npz'.format(file[:-4], os.getpid())
+        np.savez(path_tmp, **clim)
+        os.replace(path_tmp, file)
+    clim['group'] = group
+
+    return clim
+
+
+def get_base_capacity(year):
+    # Capacities of a country are split evenly between its regions
+    list_code = pd.Series([column[:2] for column in list_country])
+    cap = df_cap[year].reindex(list_code).fillna(0).values / list_code.map(list_code.value_counts()).values
+
+    return pd.Series(cap, index=list_country)
+
+
+def get_scenario_stats(cap):
+    # Aggregate load factor of the given capacities as a single matrix-vector product, then its daily means, monthly
+    # means and cumulative repartition. Hours where a country of the mix is missing are left out rather than counted
+    # as no production
+    matrix = get_lf_matrix()
+    weights = (cap[list_country].values / cap.sum()).astype(np.float32)
+    keep = ~((~matrix['valid']) @ (weights > 0))
+    lf_eu = (matrix['values'] @ weights)[keep]
+    idx_day = matrix['idx_day'][keep]
+    month = matrix['month'][keep]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lf_day = np.bincount(idx_day, weights=lf_eu, minlength=len(matrix['day'])) / \
+            np.bincount(idx_day, minlength=len(matrix['day']))
+        lf_month = np.bincount(month, weights=lf_eu, minlength=12) / np.bincount(month, minlength=12)
+    list_per = np.linspace(10, 100, num=10)
+    rep_per = 100 * np.searchsorted(np.sort(100 * lf_eu), list_per, side='right') / max(len(lf_eu), 1)
+
+    return {'day': pd.Series(100 * lf_day, index=matrix['day']), 'month': 100 * lf_month,
+            'per': pd.Series(rep_per, index=list_per), 'mean': 100 * lf_eu.mean() if len(lf_eu) else np.nan}
+
+
+def get_event_index(threshold):
+    # Every period of at least event_min_duration hours where a country, or Europe with the capacities of the year,
+    # stays below the threshold over the hours of known capacities. Runs are found for all columns at once from the
+    # edges of the below-threshold matrix
+    matrix = get_lf_matrix()
+    event_index = dict_event_index.get(threshold)
+    if event_index is not None and event_index['matrix'] is matrix:
+        return event_index['events']
+
+    lf_eu = matrix['eu']
+    values = np.column_stack([matrix['values'], np.nan_to_num(lf_eu)]).T
+    below = np.zeros((len(values), values.shape[1] + 2), dtype=np.int8)
+    below[:, 1:-1] = (values < threshold) & np.column_stack([matrix['valid_cap'], ~np.isnan(lf_eu)]).T
+    edge = np.diff(below, axis=1)
+    idx_col, start = np.nonzero(edge == 1)
+    end = np.nonzero(edge == -1)[1]
+    keep = end - start >= event_min_duration
+    idx_col, start, end = idx_col[keep], start[keep], end[keep]
+
+    # Mean and min load factor of each event, a zero is added so that the last event can end the matrix
+    flat = np.append(values.ravel(), 0)
+    bounds = np.column_stack([idx_col * values.shape[1] + start, idx_col * values.shape[1] + end]).ravel()
+    df_event = pd.DataFrame({'Country': np.append(list_country, 'EU')[idx_col],
+                             'Start': matrix['time'][start].values,
+                             'Year': np.array(list_year)[matrix['idx_year'][start]],
+                             'Duration': end - start,
+                             'Mean': 100 * np.add.reduceat(flat, bounds)[::2] / (end - start),
+                             'Min': 100 * np.minimum.reduceat(flat, bounds)[::2]})
+    events = {df_gr[0]: df_gr[1].reset_index(drop=True) for df_gr in df_event.groupby('Country')}
+    dict_event_index[threshold] = {'matrix': matrix, 'events': events}
+
+    return events
+
+
+def get_ramp_hist():
+    # Histogram of the hour to hour changes of every country and Europe per year and month, from a single difference
+    # over the whole matrix. Distributions, extreme counts and percentiles of any period are sums of it
+    global ramp_hist
+    hist = ramp_hist
+    if hist is None:
+        with lazy_lock:
+            hist = ramp_hist
+            if hist is None:
+                hist = build_ramp_hist()
+                ramp_hist = hist
+
+    return hist
+
+
+def build_ramp_hist():
+    matrix = get_lf_matrix()
+    values = np.column_stack([matrix['values'], matrix['eu']])
+    valid = np.column_stack([matrix['valid_cap'], ~np.isnan(matrix['eu'])])
+    ramp = np.diff(values, axis=0)
+    # Changes between hours which are not consecutive, at missing years, or touching an hour without known capacity
+    # are left out of the counts
+    valid = valid[1:] & valid[:-1] & (np.diff(matrix['time'].values) == np.timedelta64(1, 'h'))[:, None]
+    idx_bin = np.clip(np.floor((ramp[valid] + ramp_max) / ramp_step), 0, len(ramp_bins) - 2).astype(np.int64)
+    idx_row = (matrix['idx_year'][1:] * 12 + matrix['month'][1:])[:, None] * values.shape[1] + \
+        np.arange(values.shape[1])
+    hist = np.bincount(idx_row[valid] * (len(ramp_bins) - 1) + idx_bin,
+                       minlength=len(list_year) * 12 * values.shape[1] * (len(ramp_bins) - 1))
+    hist = hist.reshape((len(list_year), 12, values.shape[1], len(ramp_bins) - 1))
+
+    return hist
+
+
+def get_ramp_stats(years, columns):
+    # Histograms of the given years summed per month for the given columns, EU being the European load factor
+    idx_year = [list_year.index(year) for year in years if year in list_year]
+    idx_col = [len(list_country) if column == 'EU' else list_country.get_loc(column) for column in columns]
+
+    return get_ramp_hist()[idx_year][:, :, idx_col].sum(axis=0)
+
+
+def get_ramp_percentile(hist, per):
+    # Percentile of the absolute changes
+    half = hist.shape[-1] // 2
+
+    return ramp_step * get_hist_percentile(hist[..., half:] + hist[..., :half][..., ::-1], per)
+
+
+def get_hist_percentile(hist, per):
+    # Percentile of histograms along their last axis in bins, interpolated inside the bins
+    cum = np.cumsum(hist, axis=-1)
+    target = cum[..., -1:] * per / 100
+    idx = np.minimum((cum < target).sum(axis=-1), hist.shape[-1] - 1)
+    cum_before = np.where(idx > 0, np.take_along_axis(cum, np.maximum(idx - 1, 0)[..., None], axis=-1)[..., 0], 0)
+    in_bin = np.take_along_axis(hist, idx[..., None], axis=-1)[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return idx + (target[..., 0] - cum_before) / in_bin
+
+
+def get_lf_hist():
+    # Histogram of the load factor of every country and Europe per year and month. As a sketch, the histograms of any
+    # period are summed into percentiles and time shares, exact to a bin width of load factor
+    global lf_hist
+    hist = lf_hist
+    if hist is None:
+        with lazy_lock:
+            hist = lf_hist
+            if hist is None:
+                hist = build_lf_hist()
+                lf_hist = hist
+
+    return hist
+
+
+def build_lf_hist():
+    matrix = get_lf_matrix()
+    values = np.column_stack([matrix['values'], matrix['eu']])
+    valid = np.column_stack([matrix['valid_cap'], ~np.isnan(matrix['eu'])])
+    idx_bin = np.clip(np.floor(np.nan_to_num(values) / lf_step), 0, len(lf_bins) - 2).astype(np.int64)
+    idx_row = (matrix['idx_year'] * 12 + matrix['month'])[:, None] * values.shape[1] + np.arange(values.shape[1])
+    hist = np.bincount((idx_row * (len(lf_bins) - 1) + idx_bin)[valid],
+                       minlength=len(list_year) * 12 * values.shape[1] * (len(lf_bins) - 1))
+    hist = hist.astype(np.int32).reshape((len(list_year), 12, values.shape[1], len(lf_bins) - 1))
+
+    return hist
+
+
+def get_lf_stats(years, columns):
+    # Histograms of the given years per month for the given columns, EU being the European load factor
+    idx_year = [list_year.index(year) for year in years if year in list_year]
+    idx_col = [len(list_country) if column == 'EU' else list_country.get_loc(column) for column in columns]
+
+    return get_lf_hist()[idx_year][:, :, idx_col]
+
+
+def get_lf_percentile(hist, per):
+
+    return lf_step * get_hist_percentile(hist, per)
+
+
+def get_lf_share(hist, lf):
+    # Percentage of the time with a load factor below lf, the bin of lf being split linearly
+    pos = min(lf / lf_step, hist.shape[-1])
+    idx = int(pos)
+    count = hist[..., :idx].sum(axis=-1)
+    if idx < hist.shape[-1]:
+        count = count + hist[..., idx] * (pos - idx)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * count / hist.sum(axis=-1)
+
+
+def get_prod_matrix():
+    # Hourly production of every country in MW as float32, the load factor being multiplied by the capacity
+    # interpolated between the ends of the previous and current years. NaN for missing hours and years without
+    # capacities, with the European total
+    global prod_matrix
+    prod = prod_matrix
+    if prod is None:
+        with lazy_lock:
+            prod = prod_matrix
+            if prod is None:
+                prod = build_prod_matrix()
+                prod_matrix = prod
+
+    return prod
+
+
+def build_prod_matrix():
+    matrix = get_lf_matrix()
+    cap_end = np.array([get_base_capacity(year).values if year in df_cap.columns else np.full(len(list_country), np.nan)
+                        for year in list_year], dtype=np.float32)
+    # Capacities are constant over the first year with capacities
+    cap_start = np.array([get_base_capacity(year - 1).values if year - 1 in df_cap.columns else cap_end[idx]
+                          for idx, year in enumerate(list_year)], dtype=np.float32)
+
+    time = matrix['time'].values
+    year_start = time.astype('M8[Y]')
+    frac = ((time - year_start.astype('M8[h]')) / ((year_start + 1) - year_start).astype('m8[h]')).astype(np.float32)
+    idx_year = matrix['idx_year']
+    values = matrix['values'] * (cap_start[idx_year] + (cap_end[idx_year] - cap_start[idx_year]) * frac[:, None])
+    values[~matrix['valid']] = np.nan
+    eu = np.where(np.isnan(cap_end[idx_year, 0]), np.nan, np.nansum(values, axis=1)).astype(np.float32)
+
+    return {'values': values, 'eu': eu}
+
+
+def get_events(threshold, country, years, min_duration):
+    df_event = get_event_index(threshold).get(country)
+    if df_event is None:
+        return pd.DataFrame(columns=['Country', 'Start', 'Year', 'Duration', 'Mean', 'Min'])
+
+    return df_event.loc[(df_event['Year'] >= years[0]) & (df_event['Year'] <= years[-1]) &
+                        (df_event['Duration'] >= min_duration)]
+
+
+def get_data(years, columns=None):
+    if columns is None:
+        columns = list_country
+
+    return data_store.load(years, columns, has_capacity)
+
+
+def get_lag_corr(years, columns, max_lag, pairs=None):
+    # Correlation between every pair of columns, or only the given pairs of column indexes, for lags from -max_lag to
+    # +max_lag hours. All cross-correlations come from one FFT of the standardized columns, missing hours are counted
+    # out with a second FFT of the valid hours
+    values = get_data(years, columns)[columns].values
+    valid = ~np.isnan(values)
+    has_valid = valid.any(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values[:, has_valid] = (values[:, has_valid] - np.nanmean(values[:, has_valid], axis=0)) / \
+            np.nanstd(values[:, has_valid], axis=0)
+    values[~valid] = 0
+
+    n_fft = get_fft_len(len(values) + max_lag)
+    list_xcorr = []
+    for arr in [values, valid.astype(float)]:
+        fft = np.fft.rfft(arr, n=n_fft, axis=0)
+        if pairs is None:
+            xcorr = np.fft.irfft(np.conj(fft)[:, :, None] * fft[:, None, :], n=n_fft, axis=0)
+        else:
+            idx_i, idx_j = np.array(pairs).T
+            xcorr = np.fft.irfft(np.conj(fft[:, idx_i]) * fft[:, idx_j], n=n_fft, axis=0)
+        list_xcorr.append(np.concatenate([xcorr[n_fft - max_lag:], xcorr[:max_lag + 1]]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lag_corr = list_xcorr[0] / list_xcorr[1]
+    lag_corr[list_xcorr[1] < 1] = np.nan
 
+    return lag_corr
+
+
+def get_fft_len(length):
+    # Smallest length above the given one with only 2, 3 and 5 as factors, for which FFTs are fast
+    list_len = [2 ** i * 3 ** j * 5 ** k for i in range(int(np.log2(length)) + 2) for j in range(12) for k in range(8)]
+
+    return min(fft_len for fft_len in list_len if fft_len >= length)
+
+
+lag_max = 72
+
+
+def create_fig_load_year(df_data_y):
     data = []
     for country in df_data_y.columns:
-        trace = go.Scattergl(
+        trace = dict(
+            type='scattergl',
             x=df_data_y.index,
             y=100 * df_data_y[country],
             name=df_euro.loc[df_euro['Code'] == country, 'Name'].item()
         )
         data.append(trace)
 
-    layout = go.Layout(
+    layout = get_layout(
+        layout_theme,
         title='<b>Mean Load Factor per Country for 30 years</b>',
         xaxis=dict(
             title='Year'
         ),
         yaxis=dict(
             title='Load Factor [%]'
-        ),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+        )
     )
 
-    fig_load_year = go.Figure(data=data, layout=layout)
+    fig_load_year = get_figure(data, layout)
 
     return fig_load_year
 
 
-def create_fig_cap_year():
+def create_fig_cap_year(df_capacity):
     data = []
-    for country in list_country:
-        if country in df_cap.index:
-            if not np.isnan(df_cap.loc[country, :].mean()):
-                trace = go.Scattergl(
-                    x=df_cap.columns,
-                    y=df_cap.loc[country, :],
+    # Capacities are given per country, also for the region dataset
+    for country in sorted(set(country[:2] for country in list_country)):
+        if country in df_capacity.index:
+            if not np.isnan(df_capacity.loc[country, :].mean()):
+                trace = dict(
+                    type='scattergl',
+                    x=df_capacity.columns,
+                    y=df_capacity.loc[country, :],
                     name=df_euro.loc[df_euro['Code'] == country, 'Name'].item()
                 )
                 data.append(trace)
 
-    layout = go.Layout(
+    layout = get_layout(
+        layout_theme,
         title='<b>Installed Wind Capacity per Country for 27 years</b>',
         xaxis=dict(
             title='Year'
         ),
         yaxis=dict(
             title='Installed Wind Capactiy [MW]'
-        ),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+        )
     )
 
-    fig_cap_year = go.Figure(data=data, layout=layout)
+    fig_cap_year = get_figure(data, layout)
 
     return fig_cap_year
 
 
 def template_download_plotly(fig):
     if 'data' in fig:
-        fig_json = fig.to_plotly_json()
-        fig_json['layout']['paper_bgcolor'] = '#ffffff'
-        fig_json['layout']['plot_bgcolor'] = '#ffffff'
-        fig_json['layout']['font']['color'] = '#000000'
-        html_body = plotly.offline.plot(fig_json, include_plotlyjs=False, output_type='div')
+        # The figure is already plotly JSON, only its layout is replaced
+        html_body = '<div id="fig"></div><script>Plotly.newPlot("fig", {}, {})</script>'.format(
+            *[to_json_plotly(value).replace('</', '<\\/')
+              for value in [fig['data'], get_layout_download(fig['layout'])]])
         html_str = '''<html>
              <head>
                  <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
@@ -161,8 +1227,68 @@ def template_download_map(map_):
     return "data:text/html;charset=utf-8," + quote(map_)
 
 
-fig_load_year = create_fig_load_year()
-fig_cap_year = create_fig_cap_year()
+def get_map_geojson(dict_properties, properties_default):
+    # GeoJson with the properties of the request added to copies of the features, the shared one is never modified
+    list_feature = []
+    for feature in europe_geo['features']:
+        properties = dict(feature['properties'])
+        properties.update(dict_properties.get(properties['iso_a2'], properties_default))
+        properties['Country'] = properties['name']
+        list_feature.append(dict(feature, properties=properties))
+
+    return '{"type":"FeatureCollection","features":' + pd.Series(list_feature).to_json(orient='records') + '}'
+
+
+def get_cache_key(name, args, years):
+    # Keys only change with the data of the given years
+    list_hash = [dict_year_hash.get(year) for year in years]
+
+    return hashlib.sha1(json.dumps([name, list(args), list_hash, static_hash]).encode()).hexdigest()
+
+
+def get_cached(name, args, years, func):
+    # Outputs are shared by all workers through the disk cache
+    key = get_cache_key(name, args, years)
+    output = cache_disk.get(key)
+    if output is None:
+        output = func(*args)
+        cache_disk.set(key, output)
+
+    return output
+
+
+has_capacity = get_capacity_mask(df_cap)
+dict_year_hash = get_year_hash(data_store, df_cap)
+data_hash = get_data_hash(dict_year_hash)
+dict_year_mean = {year: build_year_mean(year, data_store, has_capacity) for year in list_year}
+dict_year_stats = {}
+df_mean_year = get_mean_year(dict_year_mean)
+fig_load_year = create_fig_load_year(df_mean_year)
+fig_cap_year = create_fig_cap_year(df_cap)
+html_fig_load_year = template_download_plotly(fig_load_year)
+html_fig_cap_year = template_download_plotly(fig_cap_year)
+arr_distance = get_distance(list_country)
+dict_season = OrderedDict([('Winter', [12, 1, 2]), ('Spring', [3, 4, 5]), ('Summer', [6, 7, 8]),
+                           ('Autumn', [9, 10, 11])])
+lf_matrix = None
+climatology = None
+lazy_lock = threading.RLock()
+clim_per = [10, 50, 90]
+ramp_hist = None
+ramp_max = 0.5
+ramp_step = 0.0025
+ramp_bins = np.linspace(-ramp_max, ramp_max, num=int(round(2 * ramp_max / ramp_step)) + 1)
+ramp_extreme = 0.05
+lf_hist = None
+lf_step = 0.0025
+lf_bins = np.linspace(0, 1, num=int(round(1 / lf_step)) + 1)
+band_per = [5, 25, 50, 75, 95]
+band_low = 0.1
+prod_matrix = None
+joint_low_per = [10, 20, 30]
+dict_joint_low = {}
+dict_event_index = {}
+event_min_duration = 6
 
 
 ########################################################################################################################
@@ -212,7 +1338,19 @@ Nevertheless, good correlation factor here show evey time same load factor value
 rare that its neighbours have a high one.
 
 Mediterraneans countries like Italy, Greece and Croatia seem to have the highest differences comparing to others european 
-countries.'''
+countries.
+
+Correlation does not tell how often two countries produce little at the same time. The 'Both LF <' options replace it by
+the percentage of the hours where both load factors are below the threshold, the diagonal being the time each country is
+below it. Low values point to pairs whose interconnection would need less storage.'''
+
+md_lag = '''This matrix represents for each pair of countries the time lag giving the highest correlation factor, lags 
+from -72h to +72h being studied. A positive lag means that the load factor of the country in ordinate follows the one
+of the country in abscissa. Correlation factor at this lag is given on hover.
+
+Weather systems mostly cross Europe from west to east: load factors in eastern countries are expected to follow the 
+western ones by a few hours. Correlation for every lag between 2 countries is available in the last part of this 
+application ('Lag Corr.' graph mode).'''
 
 md_map_corr = '''This map presents the correlation factor between the selected country and the rest of Europe.
 The lightest is the green, the less load factors are correlated. 
@@ -267,1377 +1405,2975 @@ In the bottom right, the selected country may export electricity while on the to
 
 Annotations provide the percentage of points in the given areas.'''
 
+md_event = '''Low wind events are periods where the load factor of the selected country, or of Europe with the 
+installed capacities of each year, stays below the threshold for at least the given duration. The graph places every 
+event in time, colored by its mean load factor, and the table lists the longest ones.'''
+
+md_scenario = '''Starting from the installed capacities of a given year, capacities of each country can be set or scaled, 
+and countries without wind turbines can be added. Load factors of the whole period are then weighted by the new 
+capacities, to compare the European load factor of the scenario with the one of the reference year.'''
+
 ########################################################################################################################
 # Layout
 ########################################################################################################################
-app.layout = html.Div([
-    html.Div(
-        className='section',
-        children=[
-            html.H1('WIND ENERGY in EUROPE (1986 - 2015)', className='main_title')
-        ]
-    ),
-    dcc.Markdown('---'),
-    dcc.Markdown(
-        md_ini,
-        id='c_ini',
-        className='main_comments',
-    ),
-    dcc.Markdown(
-        'Overview',
-        className='sub_title',
-    ),
-    dcc.Markdown(
-        md_load_30,
-        className='h_comments'
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_load_year',
-                figure=fig_load_year
-            )
-        ]
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_fig_load_year',
-                download="Graph_Load_Year.html",
-                href=template_download_plotly(fig_load_year),
-                target="_blank"
-            )
-        ],
-        style={'margin-left': '87%'}
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_cap_year',
-                figure=fig_cap_year
-            )
-        ]
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_fig_cap_year',
-                download="Graph_Cap_Year.html",
-                href=template_download_plotly(fig_cap_year),
-                target="_blank"
-            )
-        ],
-        style={'margin-left': '87%'}
-    ),
-    html.Div(
-        children=[
-            dcc.Slider(
-                id='sl_year',
-                min=min(df_data['Year']),
-                max=max(df_data['Year']),
-                step=1,
-                marks={i: '{}'.format(i) for i in range(min(df_data['Year']), max(df_data['Year']) + 1)},
-                value=max(df_data['Year'])
-            )
-        ],
-        style={'width': '95%', 'margin': 'auto'}
-    ),
-    html.Div(
-        children=[
-            html.Div(
-                children=[
-                    dcc.Markdown(
-                        id='c_map_load',
-                        children=[md_map_load],
-                        className='comments'
-                    )
-                ],
-                style={'width': '30%', 'display': 'inline-block', 'float': 'left', 'margin-left': '2.5%',
-                       'margin-right': '2%'}
-            ),
-            html.Div(
-                children=[
-                    html.Iframe(
-                        id='map_load',
-                        srcDoc=map_ini.get_root().render(),
-                        width='100%',
-                        height='500'
-                    )
-                ],
-                style={'width': '60%', 'display': 'inline-block', 'margin-left': '3%', 'margin-right': '2.5%'}
-            )
-        ]
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Map',
-                id='dl_map_load_year',
-                download="Map_Load_Year.html",
-                href='',
-                target="_blank"
-            )
-        ],
-        style={'margin-left': '87%'}
-    ),
-    dcc.Markdown(
-        'Load Factor Correlation',
-        className='sub_title',
-    ),
-    dcc.Markdown(
-        md_corr,
-        className='h_comments'
-    ),
-    html.Div(
-        children=[
-            html.Div(
-                children=[
-                    dcc.Graph(
-                        id='fig_heatmap',
-                        figure={'layout': layout_ini}
-                    )
-                ],
-                style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
-            ),
-            html.Div(
-                children=[
-                    dcc.Graph(
-                        id='fig_corr_sc',
-                        figure={'layout': layout_ini}
-                    )
-                ],
-                style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
-            )
-        ]
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_heatmap',
-                download="Heatmap_Corr.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_fig_corr_sc',
-                download="Graph_Corr.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
-    ),
-    html.Div(
-        children=[
-            html.Div(
-                children=[
-                    dcc.Dropdown(
-                        id='drop_country',
-                        options=[{'label': x, 'value': x} for x in sorted(drop_country)],
-                        value='France',
-                        clearable=False
-                    )
-                ]
-            ),
-            dcc.Markdown(
-                md_map_corr,
-                id='c_map_corr',
-                className='comments'
-            )
-        ],
-        style={'width': '30%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%',
-               'float': 'left', 'margin-top': '40px'}
-    ),
-    html.Div(
-        children=[
-            html.Iframe(
-                id='map_corr',
-                srcDoc=map_ini.get_root().render(),
-                width='100%',
-                height='500'
-            )
-        ],
-        style={'width': '62%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%',
-               'margin-top': '40px'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Map',
-                id='dl_map_corr',
-                download="Map_Corr.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '87%'}
-    ),
-    dcc.Markdown(
-        'Time Statistics',
-        className='sub_title',
-    ),
-    dcc.Markdown(
-        md_time_stat,
-        className='h_comments'
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_rep_month',
-                figure={'layout': layout_ini}
-            )
-        ],
-        style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_rep_per',
-                figure={'layout': layout_ini}
-            )
-        ],
-        style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_fig_rep_month',
-                download="Graph_Rep_Month.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_fig_rep_per',
-                download="Graph_Percentage_Rep.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
-    ),
-    dcc.Markdown(
-        'Load Factor Repartition on a Hourly Basis',
-        className='sub_title',
-    ),
-    dcc.Markdown(
-        md_hour_basis,
-        className='h_comments'
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_heatmap_hour',
-                figure={'layout': layout_ini}
-            )
-        ],
-        style={'width': '50%', 'margin-left': '25%', 'margin-right': '25%'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_heatmap_hour',
-                download="Heatmap_Hour.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'margin-left': '62%'}
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_heatmap_scatter',
-                figure={'layout': layout_ini}
-            )
-        ],
-        style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_heatmap_versus',
-                figure={'layout': layout_ini}
-            )
-        ],
-        style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_heatmap_scatter',
-                download="Graph_Heatmap_Hour_Rep.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
-    ),
-    html.Div(
-        children=[
-            html.A(
-                'Download this Graph',
-                id='dl_heatmap_versus',
-                download="Graph_Heatmap_Hour_Versus.html",
-                href="",
-                target="_blank"
-            )
-        ],
-        style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
-    ),
-    html.Div(
+def serve_layout():
+    # Called on each page load, so that sliders follow the loaded years
+    return html.Div([
+        html.Div(
+            className='section',
+            children=[
+                html.H1('WIND ENERGY in EUROPE ({} - {})'.format(min(list_year), max(list_year)),
+                        className='main_title')
+            ]
+        ),
+        dcc.Markdown('---'),
         dcc.Markdown(
-            md_hour_scatter_left,
-            className='comments'
+            md_ini,
+            id='c_ini',
+            className='main_comments',
         ),
-        style={'width': '45%', 'margin-left': '2.5%', 'margin-right': '2.5%', 'display': 'inline-block'}
-    ),
-    html.Div(
         dcc.Markdown(
-            md_hour_scatter_right,
-            className='comments'
-        ),
-        style={'width': '45%', 'margin-left': '2.5%', 'display': 'inline-block'}
-    ),
-    dcc.Markdown(
-        'Build your own Graph',
-        className='sub_title',
-    ),
-    html.Div(
-        children=[
-            dcc.Markdown(
-                'Country 1:',
-                className='b_comments'
-            ),
-            dcc.Dropdown(
-                id='drop_c_1',
-                options=[{'label': x, 'value': x} for x in sorted(drop_country)],
-                value='France',
-                clearable=False
-            ),
-            dcc.Markdown(
-                'Country 2:',
-                className='b_comments'
-            ),
-            dcc.Dropdown(
-                id='drop_c_2',
-                options=[{'label': x, 'value': x} for x in sorted(drop_country)],
-                value='Germany',
-                clearable=False
-            ),
-            dcc.Markdown(
-                children=['''Time range:'''],
-                className='b_comments'
-            ),
-            dcc.RangeSlider(
-                id='sl_range',
-                min=min(df_data['Year']),
-                max=max(df_data['Year']),
-                step=1,
-                value=[max(df_data['Year']) - 1, max(df_data['Year'])],
-                marks={min(df_data['Year']): min(df_data['Year']), max(df_data['Year']): max(df_data['Year'])}
-            ),
-            dcc.Markdown(
-                id='c_sl_range',
-                children=['''{} - {}'''.format(max(df_data['Year']) - 1, max(df_data['Year']))],
-                className='h_comments'
-            ),
-            dcc.Markdown(
-                'Graph mode:',
-                className='b_comments'
-            ),
-            dcc.Dropdown(
-                id='drop_type',
-                options=[{'label': x, 'value': x} for x in ['Scatter', 'Versus', 'LF Rep.', 'Time Rep.', 'Stacked']],
-                value='Scatter',
-                clearable=False
-            ),
-            dcc.Markdown(
-                'Time filter:',
-                className='b_comments'
-            ),
-            dcc.Dropdown(
-                id='drop_filter',
-                options=[{'label': x, 'value': x} for x in ['Year', 'Month', 'Day', 'Hour']],
-                value='Year',
-                clearable=False
-            ),
-            dcc.Markdown(
-                'Provide data:',
-                className='b_comments'
-            ),
-            dcc.Dropdown(
-                id='drop_sample',
-                options=[{'label': x, 'value': x} for x in ['All', 'Mean']],
-                value='Mean',
-                clearable=False
-            ),
-            html.Div(
-                children=[
-                    html.A(
-                        'Download this Graph',
-                        id='dl_fig_cr',
-                        download="Graph_Custom.html",
-                        href="",
-                        target="_blank"
-                    )
-                ],
-                style={'margin-bottom': '75px'}
-            )
-        ],
-        style={'width': '30%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%',
-               'margin-top': '50px', 'float': 'left'}
-    ),
-    html.Div(
-        children=[
-            dcc.Graph(
-                id='fig_cr',
-                figure={'layout': layout_ini}
-            )
-        ],
-        style={'width': '62%', 'margin-left': '1.5%', 'margin-right': '2.5%', 'display': 'inline-block'}
-    )
-])
-
-
-########################################################################################################################
-# Year Selection
-########################################################################################################################
-@app.callback([Output('map_load', 'srcDoc'),
-               Output('fig_heatmap', 'figure'),
-               Output('fig_heatmap_hour', 'figure'),
-               Output('dl_heatmap', 'href'),
-               Output('dl_heatmap_hour', 'href'),
-               Output('dl_map_load_year', 'href')],
-              [Input('sl_year', 'value')])
-def year_choice(ch_year):
-    str_map_load = create_map_load(ch_year)
-    fig_heatmap = create_heatmap(ch_year)
-    fig_heatmap_hour = create_heatmap_hour(ch_year)
-
-    html_fig_heatmap = template_download_plotly(fig_heatmap)
-    html_fig_heatmap_hour = template_download_plotly(fig_heatmap_hour)
-
-    return str_map_load, fig_heatmap, fig_heatmap_hour, html_fig_heatmap, html_fig_heatmap_hour, \
-           template_download_map(str_map_load)
-
-
-def create_map_load(ch_year):
-    map_euro_load = folium.Map(location=(55, 15), zoom_start=3)
-
-    df_map_load = pd.DataFrame()
-    for country in list_country:
-        df_map_load.loc[country, 'Load_Factor'] = 100 * df_data.loc[df_data['Year'] == ch_year, country].mean()
-
-    for feature in europe_geo['features']:
-        isoa2 = feature['properties']['iso_a2']
-        if isoa2 in df_map_load.index:
-            feature['properties']['Load Factor'] = str(round(df_map_load['Load_Factor'][isoa2], 1))+  '%'
-            feature['properties']['Country'] = feature['properties']['name']
-        else:
-            feature['properties']['Load Factor'] = ''
-
-    str_ = europe_geo['features'].to_json()
-    for idx in range(0, len(europe_geo.index)):
-        str_ = str_.replace('"{}":'.format(idx), '')
-    str_ = '{"type":"FeatureCollection","features":[' + str_[1:-1] + ']}'
-
-    map_geojson = folium.Choropleth(
-        geo_data=str_,
-        name='choropleth',
-        data=df_map_load,
-        columns=[df_map_load.index, 'Load_Factor'],
-        key_on='properties.iso_a2',
-        fill_color='YlGn',
-        fill_opacity=0.7,
-        nan_fill_opacity=0.1,
-        line_opacity=0.2,
-        highlight=True,
-        legend_name='Load Factor in {} [%]'.format(ch_year)
-    )
-
-    folium.GeoJsonTooltip(
-        fields=['Country', 'Load Factor']
-    ).add_to(map_geojson.geojson)
-
-    map_geojson.add_to(map_euro_load)
-
-    return map_euro_load.get_root().render()
-
-
-def create_heatmap(ch_year):
-    # Get correlation
-    list_country_c = list_country
-    for country in list_country_c:
-        if np.isnan(df_data.loc[df_data['Year'] == ch_year, country].mean()):
-            list_country_c = list_country_c.drop(country)
-    df_data_corr = df_data.loc[df_data['Year'] == ch_year, list_country_c].corr()
-
-    z = []
-    for col in df_data_corr.columns:
-        z.append(df_data_corr[col])
-
-    # Heatmap Plot
-    data = [go.Heatmap(
-        x=df_data_corr.index,
-        y=df_data_corr.columns,
-        z=z,
-        xgap=1,
-        ygap=1,
-        showscale=True
-    )]
-
-    layout = go.Layout(
-        title='<b>Load Factor Correlation between Countries in {}</b>'.format(ch_year),
-        xaxis=dict(
-            title='Country'
+            'Overview',
+            className='sub_title',
         ),
-        yaxis=dict(
-            title='Country'
+        dcc.Markdown(
+            md_load_30,
+            className='h_comments'
         ),
-        height=700,
-        margin=dict(l=50, r=0),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#ffffff',
-        font=dict(color='#ffffff')
-    )
-
-    fig_heatmap = go.Figure(data=data, layout=layout)
-
-    return fig_heatmap
-
-
-def create_heatmap_hour(ch_year):
-    # Get correlation
-    df_data_hour = pd.DataFrame()
-    for df_gr in df_data.loc[df_data['Year'] == ch_year].groupby('Hour'):
-        for country in list_country:
-            mean_lf = 100 * df_data.loc[df_data['Year'] == ch_year, country].mean()
-            if not np.isnan(mean_lf):
-                df_data_hour.loc[df_gr[0], country] = 100 * df_gr[1][country].mean() - mean_lf
-
-    z = []
-    for col in df_data_hour.columns:
-        z.append(df_data_hour[col])
-
-    # Heatmap Plot
-    data = [go.Heatmap(
-        x=df_data_hour.index,
-        y=df_data_hour.columns,
-        z=z,
-        xgap=1,
-        ygap=1,
-        showscale=True
-    )]
-
-    layout = go.Layout(
-        title='<b>Load Factor per Hour in {}</b>'.format(ch_year),
-        xaxis=dict(
-            title='Hour'
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_load_year',
+                    figure=fig_load_year
+                )
+            ]
         ),
-        yaxis=dict(
-            title='Country'
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_fig_load_year',
+                    download="Graph_Load_Year.html",
+                    href=html_fig_load_year,
+                    target="_blank"
+                )
+            ],
+            style={'margin-left': '87%'}
         ),
-        height=700,
-        margin=dict(l=50, r=0),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#ffffff',
-        font=dict(color='#ffffff')
-    )
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_cap_year',
+                    figure=fig_cap_year
+                )
+            ]
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_fig_cap_year',
+                    download="Graph_Cap_Year.html",
+                    href=html_fig_cap_year,
+                    target="_blank"
+                )
+            ],
+            style={'margin-left': '87%'}
+        ),
+        html.Div(
+            children=[
+                dcc.Slider(
+                    id='sl_year',
+                    min=min(list_year),
+                    max=max(list_year),
+                    step=1,
+                    marks={i: '{}'.format(i) for i in range(min(list_year), max(list_year) + 1)},
+                    value=max(list_year)
+                )
+            ],
+            style={'width': '95%', 'margin': 'auto'}
+        ),
+        html.Div(
+            children=[
+                html.Div(
+                    children=[
+                        dcc.Markdown(
+                            id='c_map_load',
+                            children=[md_map_load],
+                            className='comments'
+                        ),
+                        dcc.RadioItems(
+                            id='radio_map_load',
+                            options=[{'label': x, 'value': x} for x in ['Load Factor', 'Anomaly']],
+                            value='Load Factor',
+                            labelStyle={'display': 'inline-block', 'margin-right': '20px'}
+                        )
+                    ],
+                    style={'width': '30%', 'display': 'inline-block', 'float': 'left', 'margin-left': '2.5%',
+                           'margin-right': '2%'}
+                ),
+                html.Div(
+                    children=[
+                        html.Iframe(
+                            id='map_load',
+                            srcDoc=str_map_ini,
+                            width='100%',
+                            height='500'
+                        )
+                    ],
+                    style={'width': '60%', 'display': 'inline-block', 'margin-left': '3%', 'margin-right': '2.5%'}
+                )
+            ]
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Map',
+                    id='dl_map_load_year',
+                    download="Map_Load_Year.html",
+                    href='',
+                    target="_blank"
+                )
+            ],
+            style={'margin-left': '87%'}
+        ),
+        dcc.Markdown(
+            'Load Factor Correlation',
+            className='sub_title',
+        ),
+        dcc.Markdown(
+            md_corr,
+            className='h_comments'
+        ),
+        dcc.RadioItems(
+            id='radio_heatmap',
+            options=[{'label': 'Correlation', 'value': 'Correlation'}] +
+                    [{'label': 'Both LF < {}%'.format(per), 'value': per} for per in joint_low_per],
+            value='Correlation',
+            labelStyle={'display': 'inline-block', 'margin-right': '20px'},
+            style={'margin-left': '2.5%'}
+        ),
+        html.Div(
+            children=[
+                html.Div(
+                    children=[
+                        dcc.Graph(
+                            id='fig_heatmap',
+                            figure={'layout': layout_ini}
+                        )
+                    ],
+                    style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
+                ),
+                html.Div(
+                    children=[
+                        dcc.Graph(
+                            id='fig_corr_sc',
+                            figure={'layout': layout_ini}
+                        )
+                    ],
+                    style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
+                )
+            ]
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_heatmap',
+                    download="Heatmap_Corr.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_fig_corr_sc',
+                    download="Graph_Corr.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
+        ),
+        dcc.Markdown(
+            md_lag,
+            className='h_comments'
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_heatmap_lag',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '50%', 'margin-left': '25%', 'margin-right': '25%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_heatmap_lag',
+                    download="Heatmap_Lag.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'margin-left': '62%'}
+        ),
+        html.Div(
+            children=[
+                html.Div(
+                    children=[
+                        dcc.Dropdown(
+                            id='drop_country',
+                            options=[{'label': x, 'value': x} for x in sorted(drop_country)],
+                            value='France',
+                            clearable=False
+                        )
+                    ]
+                ),
+                dcc.Markdown(
+                    md_map_corr,
+                    id='c_map_corr',
+                    className='comments'
+                )
+            ],
+            style={'width': '30%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%',
+                   'float': 'left', 'margin-top': '40px'}
+        ),
+        html.Div(
+            children=[
+                html.Iframe(
+                    id='map_corr',
+                    srcDoc=str_map_ini,
+                    width='100%',
+                    height='500'
+                )
+            ],
+            style={'width': '62%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%',
+                   'margin-top': '40px'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Map',
+                    id='dl_map_corr',
+                    download="Map_Corr.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '87%'}
+        ),
+        dcc.Markdown(
+            'Time Statistics',
+            className='sub_title',
+        ),
+        dcc.Markdown(
+            md_time_stat,
+            className='h_comments'
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_rep_month',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_rep_per',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_fig_rep_month',
+                    download="Graph_Rep_Month.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_fig_rep_per',
+                    download="Graph_Percentage_Rep.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
+        ),
+        dcc.Markdown(
+            'Load Factor Repartition on a Hourly Basis',
+            className='sub_title',
+        ),
+        dcc.Markdown(
+            md_hour_basis,
+            className='h_comments'
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_heatmap_hour',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '50%', 'margin-left': '25%', 'margin-right': '25%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_heatmap_hour',
+                    download="Heatmap_Hour.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'margin-left': '62%'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_heatmap_scatter',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_heatmap_versus',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_heatmap_scatter',
+                    download="Graph_Heatmap_Hour_Rep.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
+        ),
+        html.Div(
+            children=[
+                html.A(
+                    'Download this Graph',
+                    id='dl_heatmap_versus',
+                    download="Graph_Heatmap_Hour_Versus.html",
+                    href="",
+                    target="_blank"
+                )
+            ],
+            style={'width': '13%', 'display': 'inline-block', 'margin-left': '37%'}
+        ),
+        html.Div(
+            dcc.Markdown(
+                md_hour_scatter_left,
+                className='comments'
+            ),
+            style={'width': '45%', 'margin-left': '2.5%', 'margin-right': '2.5%', 'display': 'inline-block'}
+        ),
+        html.Div(
+            dcc.Markdown(
+                md_hour_scatter_right,
+                className='comments'
+            ),
+            style={'width': '45%', 'margin-left': '2.5%', 'display': 'inline-block'}
+        ),
+        dcc.Markdown(
+            'Build your own Graph',
+            className='sub_title',
+        ),
+        html.Div(
+            children=[
+                dcc.Markdown(
+                    'Countries:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_c_1',
+                    options=[{'label': x, 'value': x} for x in sorted(drop_country)],
+                    value=['France'],
+                    multi=True,
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Reference country:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_c_2',
+                    options=[{'label': x, 'value': x} for x in sorted(drop_country)],
+                    value='Germany',
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    children=['''Time range:'''],
+                    className='b_comments'
+                ),
+                dcc.RangeSlider(
+                    id='sl_range',
+                    min=min(list_year),
+                    max=max(list_year),
+                    step=1,
+                    value=[max(list_year) - 1, max(list_year)],
+                    marks={min(list_year): min(list_year), max(list_year): max(list_year)}
+                ),
+                dcc.Markdown(
+                    id='c_sl_range',
+                    children=['''{} - {}'''.format(max(list_year) - 1, max(list_year))],
+                    className='h_comments'
+                ),
+                dcc.Markdown(
+                    'Graph mode:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_type',
+                    options=[{'label': x, 'value': x} for x in list_type],
+                    value='Scatter',
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Time filter:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_filter',
+                    options=[{'label': x, 'value': x} for x in ['Year', 'Month', 'Day', 'Hour']],
+                    value='Year',
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Provide data:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_sample',
+                    options=[{'label': x, 'value': x} for x in ['All', 'Mean']],
+                    value='Mean',
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Optimize:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_target',
+                    options=[{'label': x, 'value': x} for x in ['Variance', 'LF < 10%', 'LF < 20%', 'LF < 30%']],
+                    value='Variance',
+                    clearable=False
+                ),
+                html.Div(
+                    children=[
+                        html.A(
+                            'Download this Graph',
+                            id='dl_fig_cr',
+                            download="Graph_Custom.html",
+                            href="",
+                            target="_blank"
+                        )
+                    ],
+                    style={'margin-bottom': '75px'}
+                )
+            ],
+            style={'width': '30%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%',
+                   'margin-top': '50px', 'float': 'left'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_cr',
+                    figure={'layout': layout_ini}
+                ),
+                dcc.Store(
+                    id='store_cr'
+                ),
+                dcc.Store(
+                    id='store_cr_filter',
+                    data='Year'
+                ),
+                dcc.Store(
+                    id='store_cr_sample',
+                    data='Mean'
+                )
+            ],
+            style={'width': '62%', 'margin-left': '1.5%', 'margin-right': '2.5%', 'display': 'inline-block'}
+        ),
+        dcc.Markdown(
+            'Low Wind Events',
+            className='sub_title',
+            style={'clear': 'both'}
+        ),
+        dcc.Markdown(
+            md_event,
+            className='h_comments'
+        ),
+        html.Div(
+            children=[
+                dcc.Markdown(
+                    'Country:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_ev_country',
+                    options=[{'label': x, 'value': x} for x in ['Europe'] + sorted(drop_country)],
+                    value='Europe',
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Threshold:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_ev_threshold',
+                    options=[{'label': 'LF < {}%'.format(x), 'value': x} for x in [5, 10, 15, 20]],
+                    value=10,
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Minimum duration:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_ev_duration',
+                    options=[{'label': '{} h'.format(x), 'value': x} for x in [6, 12, 24, 48, 72]],
+                    value=24,
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    children=['''Time range:'''],
+                    className='b_comments'
+                ),
+                dcc.RangeSlider(
+                    id='sl_ev_range',
+                    min=min(list_year),
+                    max=max(list_year),
+                    step=1,
+                    value=[min(list_year), max(list_year)],
+                    marks={min(list_year): min(list_year), max(list_year): max(list_year)}
+                ),
+                dcc.Markdown(
+                    id='c_ev',
+                    className='h_comments'
+                ),
+                html.Div(
+                    id='tab_ev'
+                )
+            ],
+            style={'width': '30%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%',
+                   'margin-top': '50px', 'float': 'left'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_ev',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '62%', 'margin-left': '1.5%', 'margin-right': '2.5%', 'display': 'inline-block'}
+        ),
+        dcc.Markdown(
+            'Capacity Scenarios',
+            className='sub_title',
+            style={'clear': 'both'}
+        ),
+        dcc.Markdown(
+            md_scenario,
+            className='h_comments'
+        ),
+        dcc.Store(
+            id='store_scenario',
+            storage_type='session'
+        ),
+        html.Div(
+            children=[
+                dcc.Markdown(
+                    'Reference year:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_sc_year',
+                    options=[{'label': x, 'value': x} for x in df_cap.columns],
+                    value=df_cap.columns.max(),
+                    clearable=False,
+                    persistence=True,
+                    persistence_type='session'
+                ),
+                dcc.Markdown(
+                    'Country:',
+                    className='b_comments'
+                ),
+                dcc.Dropdown(
+                    id='drop_sc_country',
+                    options=[{'label': x, 'value': x} for x in sorted(drop_country)],
+                    value='France',
+                    clearable=False
+                ),
+                dcc.Markdown(
+                    'Capacity [MW]:',
+                    className='b_comments'
+                ),
+                dcc.Input(
+                    id='in_sc_cap',
+                    type='number',
+                    min=0,
+                    value=1000
+                ),
+                html.Button(
+                    'Set',
+                    id='btn_sc_set'
+                ),
+                dcc.Markdown(
+                    'Scale factor:',
+                    className='b_comments'
+                ),
+                dcc.Input(
+                    id='in_sc_scale',
+                    type='number',
+                    min=0,
+                    value=2
+                ),
+                html.Button(
+                    'Scale',
+                    id='btn_sc_scale'
+                ),
+                html.Div(
+                    children=[
+                        html.Button(
+                            'Reset',
+                            id='btn_sc_reset'
+                        )
+                    ],
+                    style={'margin-top': '20px'}
+                ),
+                dcc.Markdown(
+                    id='c_sc',
+                    className='h_comments'
+                )
+            ],
+            style={'width': '30%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%',
+                   'margin-top': '50px', 'float': 'left'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_sc_day',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '62%', 'margin-left': '1.5%', 'margin-right': '2.5%', 'display': 'inline-block'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_sc_month',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '46%', 'display': 'inline-block', 'margin-left': '2.5%', 'margin-right': '1.5%'}
+        ),
+        html.Div(
+            children=[
+                dcc.Graph(
+                    id='fig_sc_per',
+                    figure={'layout': layout_ini}
+                )
+            ],
+            style={'width': '46%', 'display': 'inline-block', 'margin-left': '1.5%', 'margin-right': '2.5%'}
+        )
+    ])
+
+
+app.layout = serve_layout
+
+
+########################################################################################################################
+# Year Selection
+########################################################################################################################
+@app.callback([Output('fig_heatmap_hour', 'figure'),
+               Output('fig_heatmap_lag', 'figure'),
+               Output('dl_heatmap_hour', 'href'),
+               Output('dl_heatmap_lag', 'href')],
+              [Input('sl_year', 'value')])
+def year_choice(ch_year):
+    output = get_cached('year_choice', [ch_year], [ch_year], build_year_choice)
+    prefetcher.add('year_choice', [([year], [year]) for year in get_adjacent_years(ch_year)], build_year_choice)
+
+    return output
+
+
+@app.callback([Output('fig_heatmap', 'figure'),
+               Output('dl_heatmap', 'href')],
+              [Input('sl_year', 'value'),
+               Input('radio_heatmap', 'value')])
+def heatmap_choice(ch_year, heat_type):
+    output = get_cached('heatmap_choice', [ch_year, heat_type], [ch_year], build_heatmap_choice)
+    prefetcher.add('heatmap_choice', [([year, heat_type], [year]) for year in get_adjacent_years(ch_year)],
+                   build_heatmap_choice)
+
+    return output
+
+
+@app.callback([Output('map_load', 'srcDoc'),
+               Output('dl_map_load_year', 'href')],
+              [Input('sl_year', 'value'),
+               Input('radio_map_load', 'value')])
+def map_choice(ch_year, map_type):
+    output = get_cached('map_choice', [ch_year, map_type], get_map_years(ch_year, map_type), build_map_choice)
+    prefetcher.add('map_choice', [([year, map_type], get_map_years(year, map_type))
+                                  for year in get_adjacent_years(ch_year)], build_map_choice)
+
+    return output
+
+
+def get_map_years(ch_year, map_type):
+    # Anomalies depend on the climatology of all years
+    if map_type == 'Anomaly':
+        return list(list_year)
+
+    return [ch_year]
+
+
+def build_map_choice(ch_year, map_type):
+    str_map_load = create_map_load(ch_year, map_type)
+
+    return str_map_load, template_download_map(str_map_load)
+
+
+def get_adjacent_years(ch_year):
+
+    return [year for year in [ch_year - 1, ch_year + 1] if min(list_year) <= year <= max(list_year)]
+
+
+def build_year_choice(ch_year):
+    fig_heatmap_hour = create_heatmap_hour(ch_year)
+    fig_heatmap_lag = create_heatmap_lag(ch_year)
+
+    html_fig_heatmap_hour = template_download_plotly(fig_heatmap_hour)
+    html_fig_heatmap_lag = template_download_plotly(fig_heatmap_lag)
+
+    return fig_heatmap_hour, fig_heatmap_lag, html_fig_heatmap_hour, html_fig_heatmap_lag
+
+
+def build_heatmap_choice(ch_year, heat_type):
+    # heat_type is either 'Correlation' or a load factor threshold of joint_low_per
+    if heat_type == 'Correlation':
+        fig_heatmap = create_heatmap(ch_year)
+    else:
+        fig_heatmap = create_heatmap_joint(ch_year, heat_type)
+
+    return fig_heatmap, template_download_plotly(fig_heatmap)
+
+
+def create_map_load(ch_year, map_type='Load Factor'):
+    map_euro_load = folium.Map(location=(55, 15), zoom_start=3)
+
+    df_year = get_data([ch_year])
+    df_map_load = pd.DataFrame()
+    for country in list_country:
+        df_map_load.loc[country, 'Load_Factor'] = 100 * df_year[country].mean()
+    if map_type == 'Anomaly':
+        # Mean difference of the year to the climatology, taken from the stored anomalies
+        df_map_load['Anomaly'] = 100 * get_climatology()['year'][list_year.index(ch_year)]
+        col_map = 'Anomaly'
+        fill_color = 'RdYlGn'
+        legend_name = 'Load Factor Anomaly vs Climatology in {} [%]'.format(ch_year)
+    else:
+        col_map = 'Load_Factor'
+        fill_color = 'YlGn'
+        legend_name = 'Load Factor in {} [%]'.format(ch_year)
+
+    dict_properties = {}
+    for isoa2 in df_map_load.index:
+        dict_properties[isoa2] = {'Load Factor': str(round(df_map_load['Load_Factor'][isoa2], 1)) + '%'}
+        if map_type == 'Anomaly':
+            dict_properties[isoa2]['Anomaly'] = '{:+.1f}%'.format(df_map_load['Anomaly'][isoa2])
+    str_ = get_map_geojson(dict_properties, {'Load Factor': '', 'Anomaly': ''})
+
+    map_geojson = folium.Choropleth(
+        geo_data=str_,
+        name='choropleth',
+        data=df_map_load,
+        columns=[df_map_load.index, col_map],
+        key_on='properties.iso_a2',
+        fill_color=fill_color,
+        fill_opacity=0.7,
+        nan_fill_opacity=0.1,
+        line_opacity=0.2,
+        highlight=True,
+        legend_name=legend_name
+    )
+
+    folium.GeoJsonTooltip(
+        fields=['Country', 'Load Factor'] + (['Anomaly'] if map_type == 'Anomaly' else [])
+    ).add_to(map_geojson.geojson)
+
+    map_geojson.add_to(map_euro_load)
+
+    return map_euro_load.get_root().render()
+
+
+def create_heatmap(ch_year):
+    # Get correlation
+    list_country_c = get_year_countries(ch_year)
+    df_data_corr = get_corr([ch_year]).loc[list_country_c, list_country_c]
+
+    return create_heatmap_corr(df_data_corr, 'in {}'.format(ch_year))
+
+
+def get_year_countries(ch_year):
+    # Countries with data in the given year
+    return list_country[~np.isnan(df_mean_year.loc[ch_year, list_country].values.astype(float))]
+
+
+def create_heatmap_joint(ch_year, per):
+    list_country_c = get_year_countries(ch_year)
+    idx = list_country.get_indexer(list_country_c)
+    joint_low = get_joint_low(ch_year)[joint_low_per.index(per)][np.ix_(idx, idx)]
+
+    # Heatmap Plot, the diagonal being the time each country is below the threshold
+    data = [dict(
+        type='heatmap',
+        x=list_country_c,
+        y=list_country_c,
+        z=joint_low,
+        text=np.round(joint_low, 1),
+        hovertemplate='%{x} and %{y}: %{text}% of the time<extra></extra>',
+        xgap=1,
+        ygap=1,
+        colorscale='YlOrRd',
+        showscale=True
+    )]
+
+    layout = get_layout(
+        layout_heatmap,
+        title='<b>Time with both Load Factors below {}% in {} [%]</b>'.format(per, ch_year),
+        xaxis=dict(
+            title='Country'
+        ),
+        yaxis=dict(
+            title='Country'
+        )
+    )
+
+    fig_heatmap = get_figure(data, layout)
+
+    return fig_heatmap
+
+
+def create_heatmap_corr(df_data_corr, str_time):
+    z = []
+    for col in df_data_corr.columns:
+        z.append(df_data_corr[col])
+
+    # Heatmap Plot
+    data = [dict(
+        type='heatmap',
+        x=df_data_corr.index,
+        y=df_data_corr.columns,
+        z=z,
+        xgap=1,
+        ygap=1,
+        showscale=True
+    )]
+
+    layout = get_layout(
+        layout_heatmap,
+        title='<b>Load Factor Correlation between Countries {}</b>'.format(str_time),
+        xaxis=dict(
+            title='Country'
+        ),
+        yaxis=dict(
+            title='Country'
+        )
+    )
+
+    fig_heatmap = get_figure(data, layout)
+
+    return fig_heatmap
+
+
+def create_heatmap_hour(ch_year):
+    # Get correlation
+    df_year = get_data([ch_year])
+    df_data_hour = pd.DataFrame()
+    for df_gr in df_year.groupby('Hour'):
+        for country in list_country:
+            mean_lf = 100 * df_year[country].mean()
+            if not np.isnan(mean_lf):
+                df_data_hour.loc[df_gr[0], country] = 100 * df_gr[1][country].mean() - mean_lf
+
+    z = []
+    for col in df_data_hour.columns:
+        z.append(df_data_hour[col])
+
+    # Heatmap Plot
+    data = [dict(
+        type='heatmap',
+        x=df_data_hour.index,
+        y=df_data_hour.columns,
+        z=z,
+        xgap=1,
+        ygap=1,
+        showscale=True
+    )]
+
+    layout = get_layout(
+        layout_heatmap,
+        title='<b>Load Factor per Hour in {}</b>'.format(ch_year),
+        xaxis=dict(
+            title='Hour'
+        ),
+        yaxis=dict(
+            title='Country'
+        )
+    )
+
+    fig_heatmap_hour = get_figure(data, layout)
+
+    return fig_heatmap_hour
+
+
+def create_heatmap_lag(ch_year):
+    # Lag of the maximum correlation for each pair of countries
+    list_country_c = [country for country in list_country if has_capacity(ch_year, country)]
+    lag_corr = get_lag_corr([ch_year], list_country_c, lag_max)
+    idx_max = np.argmax(np.where(np.isnan(lag_corr), -np.inf, lag_corr), axis=0)
+    z_lag = idx_max - lag_max
+    z_corr = np.take_along_axis(lag_corr, idx_max[None], axis=0)[0]
+
+    # Heatmap Plot
+    data = [dict(
+        type='heatmap',
+        x=list_country_c,
+        y=list_country_c,
+        z=z_lag.T,
+        text=np.round(z_corr.T, 2),
+        hoverinfo='x+y+z+text',
+        colorscale='RdBu',
+        zmid=0,
+        xgap=1,
+        ygap=1,
+        showscale=True
+    )]
+
+    layout = get_layout(
+        layout_heatmap,
+        title='<b>Lag of the Maximum Load Factor Correlation in {} [h]</b>'.format(ch_year),
+        xaxis=dict(
+            title='Country'
+        ),
+        yaxis=dict(
+            title='Country'
+        )
+    )
+
+    fig_heatmap_lag = get_figure(data, layout)
+
+    return fig_heatmap_lag
+
+
+########################################################################################################################
+# Correlation Heatmap click
+########################################################################################################################
+@app.callback([Output('fig_corr_sc', 'figure'),
+               Output('dl_fig_corr_sc', 'href')],
+              [Input('fig_heatmap', 'clickData')],
+              [State('sl_year', 'value')])
+def fill_scatter(sel_pt, ch_year):
+    if sel_pt is not None:
+        country_1 = df_euro.loc[df_euro['Code'] == sel_pt['points'][0]['x'], 'Name'].item()
+        country_2 = df_euro.loc[df_euro['Code'] == sel_pt['points'][0]['y'], 'Name'].item()
+
+        df_year = get_data([ch_year])
+        df_month = pd.DataFrame()
+        for df_gr in df_year.groupby('Month'):
+            month = datetime.date(1900, df_gr[0], 1).strftime('%B')
+            df_month.loc[month, 'LF_1'] = 100 * df_gr[1][sel_pt['points'][0]['x']].mean()
+            df_month.loc[month, 'LF_2'] = 100 * df_gr[1][sel_pt['points'][0]['y']].mean()
+
+        df_data_s = df_year[list_country]
+        data = [
+            dict(
+                type='scattergl',
+                x=100 * df_data_s[sel_pt['points'][0]['x']],
+                y=100 * df_data_s[sel_pt['points'][0]['y']],
+                mode='markers',
+                marker=dict(
+                    color='green'
+                ),
+                name='Whole Period'
+            ),
+            dict(
+                type='scattergl',
+                x=df_month['LF_1'],
+                y=df_month['LF_2'],
+                text=list(df_month.index),
+                mode='markers',
+                marker=dict(
+                    color='red',
+                    size=8
+                ),
+                name='Months',
+                hoverinfo='text'
+            ),
+        ]
+
+        tab_ann = [dict(ann_arrow, x=df_month['LF_1'][month], y=df_month['LF_2'][month], text=month)
+                   for month in df_month.index]
+
+        end_sh = min(max(data[0]['x']), max(data[0]['y']))
+        layout = get_layout(
+            layout_theme,
+            title='<b>Load Factor between {} and {} in {}<b>'.format(country_1, country_2, ch_year),
+            xaxis=dict(
+                title='Load Factor {} [%]'.format(country_1)
+            ),
+            yaxis=dict(
+                title='Load Factor {} [%]'.format(country_2)
+            ),
+            height=700,
+            annotations=tab_ann,
+            hovermode='closest',
+            legend=dict(
+                x=.35,
+                y=1.02,
+                orientation="h"
+            ),
+            margin=dict(l=40, r=0),
+            shapes=[dict(type='line', xref='x', yref='y', x0=0, x1=end_sh, y0=0, y1=end_sh,
+                         line=dict(color='white'))]
+        )
+
+        fig_corr_sc = get_figure(data, layout)
+        html_fig_corr_sc = template_download_plotly(fig_corr_sc)
+
+    else:
+
+        fig_corr_sc = get_figure([], get_layout(layout_ini, title='<b>Load Factor between 2 Countries<b>'))
+        html_fig_corr_sc = ''
+
+    return fig_corr_sc, html_fig_corr_sc
+
+
+########################################################################################################################
+# Hour Heatmap click
+########################################################################################################################
+@app.callback([Output('fig_heatmap_scatter', 'figure'),
+               Output('fig_heatmap_versus', 'figure'),
+               Output('dl_heatmap_scatter', 'href'),
+               Output('dl_heatmap_versus', 'href')],
+              [Input('fig_heatmap_hour', 'clickData')],
+              [State('sl_year', 'value')])
+def fill_graph_hour(sel_pt, ch_year):
+    if sel_pt is not None:
+        country_code = sel_pt['points'][0]['y']
+        country_name = df_euro.loc[df_euro['Code'] == country_code, 'Name'].item()
+        sel_hour = sel_pt['points'][0]['x']
+
+        # EU weights of the countries with a capacity, those of a country being split between its regions
+        cap = get_base_capacity(ch_year)
+        cap = cap[cap > 0] / df_cap[ch_year].sum()
+        cap_other = cap.drop(country_code, errors='ignore')
+
+        # Hours of the selected one, only the selected and weighted countries being loaded
+        df_year = get_data([ch_year], list(cap_other.index) + [country_code])
+        df_scatter = df_year.loc[df_year['Hour'].values == sel_hour]
+        idx_month = df_scatter['Month'].values
+        time = ((df_scatter['Year'].values - 1970) * 12 + idx_month - 1).astype('M8[M]').astype('M8[D]') + \
+            (df_scatter['Day'].values - 1) + np.timedelta64(sel_hour, 'h')
+        time_index = pd.DatetimeIndex(time, name='Time')
+
+        # 'Mean' columns represents the mean load factor per month, 'Diff' the difference between the load factor at
+        # selected hour and the monthly mean value. The EU difference leaves the selected country out
+        lf_month = 100 * get_month_mean(ch_year)
+        mean = lf_month[country_code].values[idx_month - 1]
+        mean_eu = (lf_month[cap.index].values @ cap.values)[idx_month - 1]
+        diff = 100 * df_scatter[country_code].values - mean
+        diff_eu = 100 * (df_scatter[cap_other.index].values @ cap_other.values) - mean_eu
+        df_scatter = pd.DataFrame({'Month': idx_month, 'Mean': mean, 'Mean_EU': mean_eu, 'Diff': diff,
+                                   'Diff_EU': diff_eu, 'Color': np.where(diff > 0, 'green', 'red'),
+                                   'Color_EU': np.where(diff_eu > 0, 'yellow', 'magenta')}, index=time_index)
+
+        fig_scatter_hour = fill_bar_hour(ch_year, country_name, sel_hour, df_scatter)
+        fig_scatter_versus = fill_scatter_versus(ch_year, country_name, sel_hour, df_scatter)
+
+        html_fig_scatter_hour = template_download_plotly(fig_scatter_hour)
+        html_fig_scatter_versus = template_download_plotly(fig_scatter_versus)
+
+    else:
+
+        fig_scatter_hour = get_figure([], layout_ini)
+        fig_scatter_versus = get_figure([], layout_ini)
+
+        html_fig_scatter_hour = ''
+        html_fig_scatter_versus = ''
+
+    return fig_scatter_hour, fig_scatter_versus, html_fig_scatter_hour, html_fig_scatter_versus
+
+
+def fill_bar_hour(ch_year, country_name, sel_hour, df_scatter):
+
+    df_sc_pos_c = df_scatter[df_scatter['Diff'].values >= 0]
+    df_sc_neg_c = df_scatter[df_scatter['Diff'].values < 0]
+    df_sc_pos_eu = df_scatter[df_scatter['Diff_EU'].values >= 0]
+    df_sc_neg_eu = df_scatter[df_scatter['Diff_EU'].values < 0]
+
+    data = [
+        dict(
+            type='bar',
+            x=df_sc_pos_c.index,
+            y=df_sc_pos_c['Diff'],
+            name='Diff {} > 0'.format(country_name),
+            marker=dict(
+                color=df_sc_pos_c['Color']
+            ),
+            legendgroup='country'
+        ),
+        dict(
+            type='bar',
+            x=df_sc_neg_c.index,
+            y=df_sc_neg_c['Diff'],
+            name='Diff {} < 0'.format(country_name),
+            marker=dict(
+                color=df_sc_neg_c['Color']
+            ),
+            legendgroup='country'
+        ),
+        dict(
+            type='bar',
+            x=df_sc_pos_eu.index,
+            y=df_sc_pos_eu['Diff_EU'],
+            name='Diff EU > 0',
+            marker=dict(
+                color=df_sc_pos_eu['Color_EU']
+            ),
+            legendgroup='EU'
+        ),
+        dict(
+            type='bar',
+            x=df_sc_neg_eu.index,
+            y=df_sc_neg_eu['Diff_EU'],
+            name='Diff EU < 0',
+            marker=dict(
+                color=df_sc_neg_eu['Color_EU']
+            ),
+            legendgroup='EU'
+        ),
+        dict(
+            type='scattergl',
+            x=df_scatter.index,
+            y=df_scatter['Mean'],
+            name='Month Mean {}'.format(country_name),
+            mode='lines',
+            line=dict(
+                color='white'
+            ),
+            yaxis='y2',
+            legendgroup='country'
+        ),
+        dict(
+            type='scattergl',
+            x=df_scatter.index,
+            y=df_scatter['Mean_EU'],
+            name='Month Mean EU',
+            mode='lines',
+            line=dict(
+                color='aqua'
+            ),
+            yaxis='y2',
+            legendgroup='EU'
+        )
+    ]
+
+    layout = get_layout(
+        layout_theme,
+        title='<b>Load Factor Repartition at {}h in {} in {}</b>'.format(sel_hour, country_name, ch_year),
+        xaxis=dict(
+            title='Time [GMT]'
+        ),
+        yaxis=dict(
+            title='Load Factor Difference [%]'
+        ),
+        yaxis2=dict(
+            title='Mean Load Factor per Month [%]',
+            side='right',
+            overlaying='y',
+            showgrid=False,
+            rangemode='tozero'
+        ),
+        legend=dict(
+            x=.35,
+            y=1.1,
+            orientation="h"
+        ),
+        height=650,
+        margin=dict(l=40, r=40)
+    )
+
+    fig_scatter_hour = get_figure(data, layout)
+
+    return fig_scatter_hour
+
+
+def fill_scatter_versus(ch_year, country_name, sel_hour, df_scatter):
+
+    data = []
+    for df_gr in df_scatter.groupby('Month'):
+        trace = dict(
+            type='scattergl',
+            x=df_gr[1]['Diff'],
+            y=df_gr[1]['Diff_EU'],
+            mode='markers',
+            text=list(df_gr[1].index),
+            hoverinfo='text',
+            name=datetime.date(1900, df_gr[0], 1).strftime('%B'),
+        )
+        data.append(trace)
+
+    layout = get_layout(
+        layout_theme,
+        title='<b>Load Factor Points at {}h in {} in {}</b>'.format(sel_hour, country_name, ch_year),
+        xaxis=dict(
+            title='Difference {}'.format(country_name)
+        ),
+        yaxis=dict(
+            title='Difference EU'
+        ),
+        height=650,
+        margin=dict(l=40, r=40),
+        hovermode='closest'
+    )
+
+    # Share of the points on each side of the axes, NaN differences being on none of them
+    diff, diff_eu = df_scatter['Diff'].values, df_scatter['Diff_EU'].values
+    per_tr = 100 * np.count_nonzero((diff > 0) & (diff_eu > 0)) / len(diff)
+    per_br = 100 * np.count_nonzero((diff > 0) & (diff_eu < 0)) / len(diff)
+    per_cr = 100 * np.count_nonzero(diff > 0) / len(diff)
+    per_bl = 100 * np.count_nonzero((diff < 0) & (diff_eu < 0)) / len(diff)
+    per_bc = 100 * np.count_nonzero(diff_eu < 0) / len(diff)
+    per_tl = 100 * np.count_nonzero((diff < 0) & (diff_eu > 0)) / len(diff)
+    per_cl = 100 * np.count_nonzero(diff < 0) / len(diff)
+    per_tc = 100 * np.count_nonzero(diff_eu > 0) / len(diff)
+    tab_ann = [dict(ann_box, x=1, y=1, text=str(round(per_tr, 2)) + '%'),
+               dict(ann_box, x=1, y=0, text=str(round(per_br, 2)) + '%'),
+               dict(ann_box, x=0, y=0, text=str(round(per_bl, 2)) + '%'),
+               dict(ann_box, x=0, y=1, text=str(round(per_tl, 2)) + '%'),
+               dict(ann_box, xref='x', x=0, y=0, text=str(round(per_bc, 2)) + '%'),
+               dict(ann_box, yref='y', x=0, y=0, text=str(round(per_cl, 2)) + '%'),
+               dict(ann_box, yref='y', x=1, y=0, text=str(round(per_cr, 2)) + '%'),
+               dict(ann_box, xref='x', x=0, y=1, text=str(round(per_tc, 2)) + '%')]
+    layout = get_layout(layout, annotations=tab_ann)
+
+    fig_scatter_versus = get_figure(data, layout)
+
+    return fig_scatter_versus
+
+
+########################################################################################################################
+# Country Selection
+########################################################################################################################
+@app.callback([Output('map_corr', 'srcDoc'),
+               Output('fig_rep_month', 'figure'),
+               Output('fig_rep_per', 'figure'),
+               Output('dl_fig_rep_month', 'href'),
+               Output('dl_fig_rep_per', 'href'),
+               Output('dl_map_corr', 'href')],
+              [Input('drop_country', 'value'),
+               Input('sl_year', 'value')])
+def country_choice(ch_country, ch_year):
+    output = get_cached('country_choice', [ch_country, ch_year], [ch_year], build_country_choice)
+    prefetcher.add('country_choice', [([ch_country, year], [year]) for year in get_adjacent_years(ch_year)],
+                   build_country_choice)
+
+    return output
+
+
+def build_country_choice(ch_country, ch_year):
+    map_corr_str = create_map_corr(ch_year, ch_country)
+    fig_rep_month = create_fig_rep_month(ch_year, ch_country)
+    fig_rep_per = create_fig_rep_per(ch_year, ch_country)
+
+    html_fig_rep_month = template_download_plotly(fig_rep_month)
+    html_fig_rep_per = template_download_plotly(fig_rep_per)
+
+    return map_corr_str, fig_rep_month, fig_rep_per, html_fig_rep_month, html_fig_rep_per, \
+           template_download_map(map_corr_str)
+
+
+def create_map_corr(ch_year, ch_country):
+    ch_country_code = df_euro.loc[df_euro['Name'] == ch_country, 'Code'].item()
+
+    map_corr = folium.Map(location=(55, 15), zoom_start=3)
+    df_mean = df_mean_year.loc[ch_year]
+    df_data_corr = get_corr([ch_year])
+
+    dict_properties = {isoa2: {'Corr. Factor': str(round(df_data_corr[ch_country_code][isoa2], 2)),
+                               'Load Factor': str(round(100 * df_mean[isoa2], 1)) + '%'}
+                       for isoa2 in df_data_corr.columns}
+    str_ = get_map_geojson(dict_properties, {'Corr. Factor': '', 'Load Factor': ''})
+
+    map_geojson = folium.Choropleth(
+        geo_data=str_,
+        name='choropleth',
+        data=df_data_corr,
+        columns=[df_data_corr.index, ch_country_code],
+        key_on='properties.iso_a2',
+        fill_color='YlGn',
+        fill_opacity=0.7,
+        line_opacity=0.2,
+        nan_fill_opacity=0.1,
+        highlight=True,
+        legend_name='Load Factor Correlation Factor between {} and Countries in {}'.format(ch_country, ch_year)
+    )
+
+    folium.GeoJsonTooltip(
+        fields=['Country', 'Corr. Factor', 'Load Factor']
+    ).add_to(map_geojson.geojson)
+
+    map_geojson.add_to(map_corr)
+
+    lf_ch_country = 100 * df_mean[ch_country_code]
+    folium.CircleMarker(
+        location=[df_euro.loc[df_euro['Code'] == ch_country_code, 'Lat'].item(),
+                  df_euro.loc[df_euro['Code'] == ch_country_code, 'Lon'].item()],
+        radius=10,
+        color='blue',
+        fill=True,
+        fill_color='blue'
+    ).add_to(map_corr)
+
+    for country in list_country:
+        if country != ch_country_code:
+            lf_country = 100 * df_mean[country]
+            if not np.isnan(lf_country):
+                if lf_country < lf_ch_country:
+                    c_color = 'red'
+                else:
+                    c_color = 'green'
+                folium.CircleMarker(
+                    location=[df_euro.loc[df_euro['Code'] == country, 'Lat'].item(),
+                              df_euro.loc[df_euro['Code'] == country, 'Lon'].item()],
+                    radius=max(1, 10 + lf_country - lf_ch_country),
+                    color=c_color,
+                    fill=True,
+                    fill_color=c_color
+                ).add_to(map_corr)
+
+    return map_corr.get_root().render()
+
+
+def create_fig_rep_month(ch_year, ch_country):
+    ch_country_code = df_euro.loc[df_euro['Name'] == ch_country, 'Code'].item()
+
+    df_load_month = pd.DataFrame()
+    for df_gr in get_data([ch_year]).groupby('Month'):
+        month = datetime.date(1900, df_gr[0], 1).strftime('%B')
+        df_temp = df_gr[1][list_country]
+        av_eu = 0
+        for country in list_country:
+            if country in df_cap.index:
+                if not np.isnan(df_cap[ch_year][country]):
+                    av_eu += 100 * df_temp[country].mean() * df_cap[ch_year][country] / df_cap[ch_year].sum()
+        df_load_month.loc[month, 'LF_EU'] = av_eu
+        df_load_month.loc[month, 'LF_Country'] = 100 * df_gr[1][ch_country_code].mean()
+
+    data = [
+        dict(
+            type='bar',
+            x=df_load_month.index,
+            y=df_load_month['LF_EU'],
+            text=list(round(df_load_month['LF_EU'], 2)),
+            name='Europe',
+            textposition='auto',
+            hoverinfo='y',
+            marker=dict(
+                color='rgb(225, 202,158)',
+                line=dict(
+                    color='rgb(107,48,8)',
+                    width=1.5),
+            ),
+            opacity=0.8
+        ),
+        dict(
+            type='bar',
+            x=df_load_month.index,
+            y=df_load_month['LF_Country'],
+            text=list(round(df_load_month['LF_Country'], 2)),
+            name=ch_country,
+            textposition='auto',
+            hoverinfo='y',
+            marker=dict(
+                color='rgb(202, 225, 158)',
+                line=dict(
+                    color='rgb(48, 107, 8)',
+                    width=1.5),
+            ),
+            opacity=0.8
+        ),
+    ]
 
-    fig_heatmap_hour = go.Figure(data=data, layout=layout)
+    layout = get_layout(
+        layout_country,
+        title='<b>Mean Load Factor per Month in {}</b>'.format(ch_year),
+        xaxis=dict(
+            title='Month'
+        ),
+        yaxis=dict(
+            title='Load Factor [%]'
+        )
+    )
 
-    return fig_heatmap_hour
+    fig_rep_month = get_figure(data, layout)
 
+    return fig_rep_month
 
-########################################################################################################################
-# Correlation Heatmap click
-########################################################################################################################
-@app.callback([Output('fig_corr_sc', 'figure'),
-               Output('dl_fig_corr_sc', 'href')],
-              [Input('fig_heatmap', 'clickData')],
-              [State('sl_year', 'value')])
-def fill_scatter(sel_pt, ch_year):
-    if sel_pt is not None:
-        country_1 = df_euro.loc[df_euro['Code'] == sel_pt['points'][0]['x'], 'Name'].item()
-        country_2 = df_euro.loc[df_euro['Code'] == sel_pt['points'][0]['y'], 'Name'].item()
 
-        df_month = pd.DataFrame()
-        for df_gr in df_data.loc[df_data['Year'] == ch_year].groupby('Month'):
-            month = datetime.date(1900, df_gr[0], 1).strftime('%B')
-            df_month.loc[month, 'LF_1'] = 100 * df_gr[1][sel_pt['points'][0]['x']].mean()
-            df_month.loc[month, 'LF_2'] = 100 * df_gr[1][sel_pt['points'][0]['y']].mean()
+def create_fig_rep_per(ch_year, ch_country):
+    ch_country_code = df_euro.loc[df_euro['Name'] == ch_country, 'Code'].item()
 
-        df_data_s = df_data.loc[df_data['Year'] == ch_year, list_country]
-        data = [
-            go.Scattergl(
-                x=100 * df_data_s[sel_pt['points'][0]['x']],
-                y=100 * df_data_s[sel_pt['points'][0]['y']],
-                mode='markers',
-                marker=dict(
-                    color='green'
-                ),
-                name='Whole Period'
-            ),
-            go.Scattergl(
-                x=df_month['LF_1'],
-                y=df_month['LF_2'],
-                text=list(df_month.index),
-                mode='markers',
-                marker=dict(
-                    color='red',
-                    size=8
-                ),
-                name='Months',
-                hoverinfo='text'
-            ),
-        ]
+    list_per = np.linspace(10, 100, num=10)
+    df_data_rep = get_data([ch_year])[list_country]
+    # The European load factor is kept apart from the loaded data
+    lf_eu = pd.Series(0.0, index=df_data_rep.index)
+    for country in df_data_rep.columns:
+        if country in df_cap.index:
+            if not np.isnan(df_cap[ch_year][country]):
+                lf_eu += df_data_rep[country] * df_cap[ch_year][country] / df_cap[ch_year].sum()
 
-        tab_ann = []
-        for month in df_month.index:
-            ann = dict(x=df_month['LF_1'][month], y=df_month['LF_2'][month], xref='x', yref='y', text=month, showarrow=True,
-                       align='center', font=dict(color='#ffffff'), arrowhead=2, arrowsize=1, arrowwidth=2,
-                       arrowcolor='#000000', ax=-30, ay=-30,
-                       bordercolor='#c7c7c7', borderwidth=2, borderpad=4, bgcolor='#000000', opacity=0.8)
-            tab_ann.append(ann)
+    df_rep = pd.DataFrame()
+    for per in list_per:
+        df_rep.loc[per, 'EU'] = 100 * len(df_data_rep.loc[100 * lf_eu <= per]) / len(df_data_rep)
+        df_rep.loc[per, 'Country'] = 100 * len(df_data_rep.loc[100 * df_data_rep[ch_country_code] <= per]) / len(
+            df_data_rep)
 
-        end_sh = min(max(data[0]['x']), max(data[0]['y']))
-        layout = go.Layout(
-            title='<b>Load Factor between {} and {} in {}<b>'.format(country_1, country_2, ch_year),
-            xaxis=dict(
-                title='Load Factor {} [%]'.format(country_1)
-            ),
-            yaxis=dict(
-                title='Load Factor {} [%]'.format(country_2)
+    data = [
+        dict(
+            type='bar',
+            x=df_rep.index,
+            y=df_rep['EU'],
+            text=list(round(df_rep['EU'], 2)),
+            textposition='auto',
+            hoverinfo='y',
+            name='Europe',
+            marker=dict(
+                color='rgb(225, 202,158)',
+                line=dict(
+                    color='rgb(107,48,8)',
+                    width=1.5),
             ),
-            height=700,
-            annotations=tab_ann,
-            hovermode='closest',
-            legend=dict(
-                x=.35,
-                y=1.02,
-                orientation="h"
+            opacity=0.8
+        ),
+        dict(
+            type='bar',
+            x=df_rep.index,
+            y=df_rep['Country'],
+            text=list(round(df_rep['Country'], 2)),
+            textposition='auto',
+            hoverinfo='y',
+            name=ch_country,
+            marker=dict(
+                color='rgb(202, 225, 158)',
+                line=dict(
+                    color='rgb(48, 107, 8)',
+                    width=1.5),
             ),
-            margin=dict(l=40, r=0),
-            paper_bgcolor='#01053c',
-            plot_bgcolor='#01053c',
-            shapes=[dict(type='line', xref='x', yref='y', x0=0, x1=end_sh, y0=0, y1=end_sh,
-                         line=dict(color='white'))],
-            font=dict(color='#ffffff')
+            opacity=0.8
+        ),
+    ]
+
+    layout = get_layout(
+        layout_country,
+        title='<b>Load Factor Repartition in {}</b>'.format(ch_year),
+        xaxis=dict(
+            title='Load Factor [%]'
+        ),
+        yaxis=dict(
+            title='Time Percentage [%]'
         )
+    )
 
-        fig_corr_sc = go.Figure(data=data, layout=layout)
-        html_fig_corr_sc = template_download_plotly(fig_corr_sc)
+    fig_rep_per = get_figure(data, layout)
+
+    return fig_rep_per
+
+
+########################################################################################################################
+# Custom Graph Creation
+########################################################################################################################
+# Scatter and Time Rep. graphs are regrouped and sampled in the browser from a daily cube of the selected countries.
+# The filter and sample dropdowns only reach the server through stores, which are not updated in these modes
+list_type_client = ['Scatter', 'Time Rep.']
+
+app.clientside_callback(
+    '''
+    function(gr_type, gr_filter, gr_sample) {
+        if (%s.indexOf(gr_type) >= 0) {
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+        }
+        return [gr_filter, gr_sample];
+    }
+    ''' % json.dumps(list_type_client),
+    [Output('store_cr_filter', 'data'),
+     Output('store_cr_sample', 'data')],
+    [Input('drop_type', 'value'),
+     Input('drop_filter', 'value'),
+     Input('drop_sample', 'value')]
+)
+
+
+@app.callback([Output('store_cr', 'data')],
+              [Input('drop_c_1', 'value'),
+               Input('drop_c_2', 'value'),
+               Input('sl_range', 'value'),
+               Input('drop_type', 'value'),
+               Input('store_cr_filter', 'data'),
+               Input('store_cr_sample', 'data'),
+               Input('drop_target', 'value')])
+def create_custom_graph(country_1, country_2, time_range, gr_type, gr_filter, gr_sample, gr_target):
+    if gr_type in list_type_client:
+        # Same cube for both modes, with the reference country after the selected ones
+        key = ('Cube', tuple(dict.fromkeys(list(country_1 or []) + [country_2])), None,
+               (time_range[0], time_range[1]), None, None, None)
+        cube = cache_graph.get(key)
+        if cube is None:
+            cube = get_cached('custom_graph_cube', [key[1], key[3]], get_custom_graph_years(key), build_custom_cube)
+            cache_graph.set(key, cube)
+
+        return [{'type': gr_type, 'cube': cube}]
+
+    key = normalize_custom_graph(country_1, country_2, time_range, gr_type, gr_filter, gr_sample, gr_target)
+    output = cache_graph.get(key)
+    if output is None:
+        output = get_cached('create_custom_graph', key, get_custom_graph_years(key), build_custom_graph)
+        cache_graph.set(key, output)
+
+    return [{'figure': output[0], 'href': output[1]}]
+
+
+app.clientside_callback(
+    '''
+    function(store, gr_filter, gr_sample) {
+        if (!store) {
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+        }
+        if (!store.cube) {
+            return [store.figure, store.href];
+        }
+
+        var cube = store.cube;
+        var decode = function(str, Type) {
+            var bin = atob(str);
+            var bytes = new Uint8Array(bin.length);
+            for (var i = 0; i < bin.length; i++) {
+                bytes[i] = bin.charCodeAt(i);
+            }
+            return new Type(bytes.buffer);
+        };
+        var mean = decode(cube.mean, Float32Array);
+        var count = decode(cube.count, Uint8Array);
+        var hours = decode(cube.hours, Uint8Array);
+        var pad = function(n) {
+            return (n < 10 ? '0' : '') + n;
+        };
+        var month_name = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September',
+                          'October', 'November', 'December'];
+        var by_time = store.type === 'Scatter' || gr_sample === 'All';
+
+        // Period of every day, as the labels of pandas resample or groupby
+        var list_x = [];
+        var idx_period = new Int32Array(cube.n_day);
+        var dict_period = {};
+        for (var d = 0; d < cube.n_day; d++) {
+            var date = new Date(cube.start + d * 86400000);
+            var y = date.getUTCFullYear(), m = date.getUTCMonth() + 1;
+            var label;
+            if (by_time && gr_filter === 'Year') {
+                label = y + '-12-31';
+            } else if (by_time && gr_filter === 'Month') {
+                label = y + '-' + pad(m) + '-' + pad(new Date(Date.UTC(y, m, 0)).getUTCDate());
+            } else if (by_time) {
+                label = y + '-' + pad(m) + '-' + pad(date.getUTCDate());
+            } else if (gr_filter === 'Year') {
+                label = y;
+            } else if (gr_filter === 'Month') {
+                label = m;
+            } else {
+                label = date.getUTCDate();
+            }
+            // Groups only exist where there is data, bins cover the whole range
+            if (!(label in dict_period) && (by_time || hours[d] > 0)) {
+                dict_period[label] = list_x.length;
+                list_x.push(label);
+            }
+            idx_period[d] = label in dict_period ? dict_period[label] : -1;
+        }
+        if (!by_time) {
+            var order = list_x.slice().sort(function(a, b) { return a - b; });
+            order.forEach(function(label, idx) { dict_period[label] = idx; });
+            for (var d = 0; d < cube.n_day; d++) {
+                idx_period[d] = idx_period[d] >= 0 ? dict_period[list_x[idx_period[d]]] : -1;
+            }
+            list_x = gr_filter === 'Month' ? order.map(function(m) { return month_name[m - 1]; }) : order;
+        }
+
+        var data = cube.names.map(function(name, idx) {
+            var y;
+            if (!by_time && gr_filter === 'Hour') {
+                list_x = cube.hour;
+                y = cube.hour_mean[idx].map(function(v) { return v === null ? null : 100 * v; });
+            } else {
+                var sum = new Float64Array(list_x.length), n = new Float64Array(list_x.length);
+                for (var d = 0; d < cube.n_day; d++) {
+                    var c = count[idx * cube.n_day + d];
+                    if (c > 0 && idx_period[d] >= 0) {
+                        sum[idx_period[d]] += mean[idx * cube.n_day + d] * c;
+                        n[idx_period[d]] += c;
+                    }
+                }
+                y = Array.prototype.map.call(sum, function(v, p) { return n[p] > 0 ? 100 * v / n[p] : null; });
+            }
+            if (store.type === 'Scatter') {
+                return {type: 'scattergl', x: list_x, y: y, mode: 'lines', name: name};
+            }
+            return {type: 'bar', x: list_x, y: y, textposition: 'auto', legendgroup: 'Country_' + (idx + 1),
+                    hoverinfo: 'x+y', name: name, marker: cube.markers[idx], opacity: 0.8,
+                    text: y.map(function(v) { return v === null ? '' : Math.round(100 * v) / 100; })};
+        });
+
+        var layout = JSON.parse(JSON.stringify(cube.layout));
+        if (store.type === 'Scatter') {
+            layout.title = {text: '<b>Mean Load Factor per ' + gr_filter + ' for ' + cube.names_str + ' from ' +
+                                  cube.range[0] + ' to ' + cube.range[1] + '</b>'};
+            layout.xaxis = {title: {text: 'Time'}};
+        } else {
+            layout.title = {text: '<b>Mean Load Factor per ' + gr_filter + ' from ' + cube.range[0] + ' to ' +
+                                  cube.range[1] + '</b>'};
+            layout.xaxis = {title: {text: gr_filter}};
+        }
+
+        // Download with the colors of template_download_plotly
+        var layout_dl = JSON.parse(JSON.stringify(layout));
+        layout_dl.paper_bgcolor = '#ffffff';
+        layout_dl.plot_bgcolor = '#ffffff';
+        layout_dl.font = {color: '#000000'};
+        var html = '<html><head><script src="https://cdn.plot.ly/plotly-latest.min.js"></script></head><body>' +
+                   '<div id="fig_cr"></div><script>Plotly.newPlot("fig_cr", ' + JSON.stringify(data) + ', ' +
+                   JSON.stringify(layout_dl) + ');</script></body></html>';
+
+        // Base64 data URI, the page being encoded to UTF-8 bytes first
+        return [{data: data, layout: layout},
+                'data:text/html;charset=utf-8;base64,' + btoa(unescape(encodeURIComponent(html)))];
+    }
+    ''',
+    [Output('fig_cr', 'figure'),
+     Output('dl_fig_cr', 'href')],
+    [Input('store_cr', 'data'),
+     Input('drop_filter', 'value'),
+     Input('drop_sample', 'value')]
+)
+
+
+def build_custom_cube(list_name, time_range):
+    # Daily means and valid hours of every day from the first to the last one, as base64 float32 and uint8 arrays,
+    # with the number of hours of each day and the means per hour of the day
+    list_code = get_country_codes(list_name)
+    df_cube = get_data(range(time_range[0], time_range[1] + 1), list_code)
+    day = pd.to_datetime(df_cube[['Year', 'Month', 'Day']])
+    df_day = df_cube[list_code].groupby(day)
+    index = pd.date_range(day.min(), day.max(), freq='D') if len(day) else pd.DatetimeIndex([])
+    mean = df_day.mean().reindex(index).values.T.astype('<f4')
+    count = df_day.count().reindex(index, fill_value=0).values.T.astype(np.uint8)
+    hours = day.value_counts().reindex(index, fill_value=0).values.astype(np.uint8)
+    df_hour = df_cube.groupby('Hour')[list_code].mean()
+
+    layout = get_layout(
+        layout_graph,
+        yaxis=dict(
+            title='Load Factor [%]'
+        )
+    )
+
+    return {'names': list(list_name), 'names_str': get_names_str(list(list_name)), 'range': list(time_range),
+            'markers': [get_bar_marker(idx) for idx in range(len(list_name))], 'layout': layout,
+            'start': int(index[0].value // 10 ** 6) if len(index) else 0, 'n_day': len(index),
+            'mean': base64.b64encode(np.ascontiguousarray(mean).tobytes()).decode(),
+            'count': base64.b64encode(np.ascontiguousarray(count).tobytes()).decode(),
+            'hours': base64.b64encode(hours.tobytes()).decode(),
+            'hour': [int(hour) for hour in df_hour.index],
+            'hour_mean': [[None if np.isnan(lf) else float(lf) for lf in df_hour[code]] for code in list_code]}
+
+
+def get_range_years(time_range):
+    if time_range is None:
+        return []
+
+    return list(range(time_range[0], time_range[1] + 1))
+
+
+def get_country_codes(list_name):
+
+    return [df_euro.loc[df_euro['Name'] == name, 'Code'].item() for name in list_name]
+
+
+def get_names_str(list_name):
+    if len(list_name) == 1:
+        return list_name[0]
+
+    return '{} and {}'.format(', '.join(list_name[:-1]), list_name[-1])
+
+
+def get_line_color(idx):
+    # The first two countries keep their colors, the next ones follow the plotly ones
+    if idx < 2:
+        return ['rgb(202, 225, 158)', 'rgb(225, 202,158)'][idx]
+
+    return None
 
+
+def get_bar_marker(idx):
+    if idx < 2:
+        return dict(color=['rgb(225, 202,158)', 'rgb(202, 225, 158)'][idx],
+                    line=dict(color=['rgb(107,48,8)', 'rgb(48, 107, 8)'][idx], width=1.5))
+
+    return dict(line=dict(width=1.5))
+
+
+def get_custom_graph_years(key):
+    years = get_range_years(key[3])
+    if key[0] == 'Anomaly':
+        # Anomalies depend on the climatology of all years
+        years = list(list_year)
+    elif key[0] == 'Optimal Mix':
+        # The optimal mix is compared to the latest capacities
+        years.append(df_cap.columns.max())
+    elif key[0] in ['Production', 'Prod. Share']:
+        # Capacities are interpolated from the end of the previous year
+        years.insert(0, years[0] - 1)
+
+    return years
+
+
+def normalize_custom_graph(country_1, country_2, time_range, gr_type, gr_filter, gr_sample, gr_target):
+    # Inputs ignored by the selected mode are removed from the key, country_1 being the list of selected countries
+    time_range = (time_range[0], time_range[1])
+    country_1 = tuple(dict.fromkeys(country_1 or []))
+    if gr_type in ['Versus', 'Lag Corr.'] and not [country for country in country_1 if country != country_2]:
+        return None, None, None, None, None, None, None
+    elif gr_type in ['Stacked'] and not country_1:
+        return None, None, None, None, None, None, None
+
+    if gr_type == 'Scatter':
+        return gr_type, country_1, country_2, time_range, gr_filter, None, None
+    elif gr_type in ['Versus', 'Time Rep.']:
+        return gr_type, country_1, country_2, time_range, gr_filter, gr_sample, None
+    elif gr_type in ['LF Rep.', 'Lag Corr.', 'Ramp Rep.', 'Ramp Extremes']:
+        return gr_type, country_1, country_2, time_range, None, None, None
+    elif gr_type == 'Stacked':
+        return gr_type, country_1[:1], None, time_range, gr_filter, gr_sample, None
+    elif gr_type == 'Anomaly':
+        return gr_type, country_1, country_2, time_range, gr_filter, None, None
+    elif gr_type == 'LF Percentiles':
+        # Histograms are kept per month, shorter filters fall back to the months
+        return gr_type, country_1, country_2, time_range, gr_filter if gr_filter == 'Year' else 'Month', None, None
+    elif gr_type in ['Correlation', 'Corr. Distance', 'Ramp Div.']:
+        return gr_type, None, None, time_range, None, None, None
+    elif gr_type == 'Production':
+        return gr_type, None, None, time_range, gr_filter, None, None
+    elif gr_type == 'Prod. Share':
+        return gr_type, None, None, time_range, None, None, None
+    elif gr_type == 'Optimal Mix':
+        return gr_type, None, None, time_range, None, None, gr_target
     else:
+        return None, None, None, None, None, None, None
 
-        fig_corr_sc = go.Figure(layout=layout_ini)
-        fig_corr_sc.layout.title.text = '<b>Load Factor between 2 Countries<b>'
-        html_fig_corr_sc = ''
 
-    return fig_corr_sc, html_fig_corr_sc
+def build_custom_graph(gr_type, country_1, country_2, time_range, gr_filter, gr_sample, gr_target):
+    # Selected countries followed by the reference one
+    list_name = list(dict.fromkeys(list(country_1 or ()) + [country_2]))
 
+    if gr_type == 'Scatter':
+        fig_cr = create_scatter(list_name, time_range, gr_filter)
+    elif gr_type == 'Versus':
+        fig_cr = create_versus(country_1, country_2, time_range, gr_filter, gr_sample)
+    elif gr_type == 'LF Rep.':
+        fig_cr = create_lfrep(list_name, time_range)
+    elif gr_type == 'LF Percentiles':
+        fig_cr = create_lf_band(list_name, time_range, gr_filter)
+    elif gr_type == 'Time Rep.':
+        fig_cr = create_trep(list_name, time_range, gr_filter, gr_sample)
+    elif gr_type == 'Stacked':
+        fig_cr = create_stacked(country_1[0], time_range, gr_filter, gr_sample)
+    elif gr_type == 'Lag Corr.':
+        fig_cr = create_lagcorr(country_1, country_2, time_range)
+    elif gr_type == 'Correlation':
+        fig_cr = create_corr(time_range)
+    elif gr_type == 'Corr. Distance':
+        fig_cr = create_corr_distance(time_range)
+    elif gr_type == 'Anomaly':
+        fig_cr = create_anomaly(list_name, time_range, gr_filter)
+    elif gr_type == 'Ramp Rep.':
+        fig_cr = create_ramp_rep(list_name, time_range)
+    elif gr_type == 'Ramp Extremes':
+        fig_cr = create_ramp_extremes(list_name, time_range)
+    elif gr_type == 'Ramp Div.':
+        fig_cr = create_ramp_div(time_range)
+    elif gr_type == 'Production':
+        fig_cr = create_production(time_range, gr_filter)
+    elif gr_type == 'Prod. Share':
+        fig_cr = create_prod_share(time_range)
+    elif gr_type == 'Optimal Mix':
+        fig_cr = create_optimal_mix(time_range, gr_target)
+    else:
+        fig_cr = get_figure([], layout_ini)
 
-########################################################################################################################
-# Hour Heatmap click
-########################################################################################################################
-@app.callback([Output('fig_heatmap_scatter', 'figure'),
-               Output('fig_heatmap_versus', 'figure'),
-               Output('dl_heatmap_scatter', 'href'),
-               Output('dl_heatmap_versus', 'href')],
-              [Input('fig_heatmap_hour', 'clickData')],
-              [State('sl_year', 'value')])
-def fill_graph_hour(sel_pt, ch_year):
-    if sel_pt is not None:
-        country_code = sel_pt['points'][0]['y']
-        country_name = df_euro.loc[df_euro['Code'] == country_code, 'Name'].item()
-        sel_hour = sel_pt['points'][0]['x']
+    html_fig = template_download_plotly(fig_cr)
+
+    return fig_cr, html_fig
+
+
+def create_scatter(list_name, time_range, gr_filter):
+
+    if gr_filter == 'Year':
+        sample = 'A'
+    elif gr_filter == 'Month':
+        sample = 'M'
+    else:
+        sample = 'D'
+
+    list_code = get_country_codes(list_name)
+
+    # One resample for all the selected countries
+    df_scatter = get_data(range(time_range[0], time_range[1] + 1), list_code)
+    df_scatter.index = pd.to_datetime(df_scatter[['Year', 'Month', 'Day']])
+    df_scatter = df_scatter[list_code].resample(sample).mean()
+
+    data = []
+    for country, name in zip(list_code, list_name):
+        trace = dict(
+            type='scattergl',
+            x=df_scatter.index,
+            y=100 * df_scatter[country],
+            mode='lines',
+            name=name
+        )
+        data.append(trace)
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>Mean Load Factor per {} for {} from {} to {}</b>'.format(gr_filter, get_names_str(list_name),
+                                                                         time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Time'
+        ),
+        yaxis=dict(
+            title='Load Factor [%]'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_versus(country_1, country_2, time_range, gr_filter, gr_sample):
+    # Every selected country against the reference one
+    list_name = [country for country in country_1 if country != country_2]
+    list_code = get_country_codes(list_name)
+    country_2_code = get_country_codes([country_2])[0]
+    single = len(list_name) == 1
+
+    if gr_filter == 'Year':
+        sample = 'A'
+    elif gr_filter == 'Month':
+        sample = 'M'
+    else:
+        sample = 'D'
+
+    df_vs = get_data(range(time_range[0], time_range[1] + 1), list_code + [country_2_code])
+    df_vs.index = pd.to_datetime(df_vs[['Year', 'Month', 'Day']])
+    if gr_sample == 'All':
+        df_vs_s = df_vs
+    else:
+        df_vs_s = df_vs.resample(sample).mean()
+
+    # One groupby for all the selected countries
+    df_filter = 100 * df_vs.groupby(gr_filter)[list_code + [country_2_code]].mean()
+    if gr_filter == 'Month':
+        df_filter.index = [datetime.date(1900, month, 1).strftime('%B') for month in df_filter.index]
+
+    # Hover texts are shared by all the countries
+    text_vs = df_vs_s.index.strftime('%Y-%m-%d %H:%M:%S')
+    data = []
+    for country, name in zip(list_code, list_name):
+        data.append(
+            dict(
+                type='scattergl',
+                x=100 * df_vs_s[country],
+                y=100 * df_vs_s[country_2_code],
+                name='Whole Period' if single else name,
+                text=text_vs,
+                mode='markers',
+                marker=dict(
+                    color='green' if single else None,
+                    size=5
+                ),
+                legendgroup=None if single else country,
+                hoverinfo='text'
+            )
+        )
+    for country, name in zip(list_code, list_name):
+        data.append(
+            dict(
+                type='scattergl',
+                x=df_filter[country],
+                y=df_filter[country_2_code],
+                mode='markers',
+                text=list(df_filter.index),
+                marker=dict(
+                    color='red' if single else None,
+                    size=8
+                ),
+                name=gr_filter if single else '{} per {}'.format(name, gr_filter),
+                legendgroup=None if single else country,
+                hoverinfo='text'
+            )
+        )
 
-        # Set Time as index
-        df_scatter = df_data.loc[(df_data['Year'] == ch_year) & (df_data['Hour'] == sel_hour), df_data.columns]
-        df_scatter['Time'] = df_scatter['Year'].apply(str) + '/' + df_scatter['Month'].apply(str) + '/' + df_scatter[
-            'Day'].apply(str) + ' ' + str(sel_hour) + ':00:00'
-        df_scatter['Time'] = pd.to_datetime(df_scatter['Time'], format='%Y/%m/%d %H:%M:%S')
-        df_scatter.set_index('Time', inplace=True)
-
-        # 'Mean' columns represents the mean load factor per month for each country
-        for df_gr in df_data.loc[df_data['Year'] == ch_year, df_data.columns].groupby('Month'):
-            month = df_gr[0]
-            df_scatter.loc[df_scatter['Month'] == month, 'Mean'] = 100 * df_gr[1][country_code].mean()
-            av_eu = 0
-            for country in list_country:
-                if country in df_cap.index:
-                    if not np.isnan(df_cap[ch_year][country]):
-                        av_eu += 100 * df_gr[1][country].mean() * df_cap[ch_year][country] / df_cap[ch_year].sum()
-            df_scatter.loc[df_scatter['Month'] == month, 'Mean_EU'] = av_eu
-
-        # 'Diff' represents the difference between the load factor at selected hour and the monthly mean value
-        df_scatter['Diff'] = 100 * df_scatter[country_code] - df_scatter['Mean']
-        av_eu = 0
-        for country in list_country.drop(country_code):
-            if country in df_cap.index:
-                if not np.isnan(df_cap[ch_year][country]):
-                    av_eu += df_scatter[country] * df_cap[ch_year][country] / df_cap[ch_year].sum()
-        df_scatter['Diff_EU'] = 100 * av_eu - df_scatter['Mean_EU']
-        df_scatter['Color'] = np.where(df_scatter['Diff'] > 0, 'green', 'red')
-        df_scatter['Color_EU'] = np.where(df_scatter['Diff_EU'] > 0, 'yellow', 'magenta')
+    # Annotations are only readable for a single country
+    tab_ann = []
+    if single:
+        tab_ann = [dict(ann_arrow, x=df_filter[list_code[0]][filter], y=df_filter[country_2_code][filter], text=filter)
+                   for filter in df_filter.index]
+
+    end_sh = min(100 * df_vs_s[list_code].max().max(), 100 * df_vs_s[country_2_code].max())
+    layout = get_layout(
+        layout_graph,
+        title='<b>Load Factor between {} and {} from {} to {}<b>'.format(get_names_str(list_name), country_2,
+                                                                         time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Load Factor {} [%]'.format(list_name[0] if single else '')
+        ),
+        yaxis=dict(
+            title='Load Factor {} [%]'.format(country_2)
+        ),
+        annotations=tab_ann,
+        hovermode='closest',
+        shapes=[dict(type='line', xref='x', yref='y', x0=0, x1=end_sh, y0=0, y1=end_sh,
+                     line=dict(color='white'))]
+    )
 
-        fig_scatter_hour = fill_bar_hour(ch_year, country_name, sel_hour, df_scatter)
-        fig_scatter_versus = fill_scatter_versus(ch_year, country_name, sel_hour, df_scatter)
+    fig_cr = get_figure(data, layout)
 
-        html_fig_scatter_hour = template_download_plotly(fig_scatter_hour)
-        html_fig_scatter_versus = template_download_plotly(fig_scatter_versus)
+    return fig_cr
 
-    else:
 
-        fig_scatter_hour = go.Figure(layout=layout_ini)
-        fig_scatter_versus = go.Figure(layout=layout_ini)
+def create_lfrep(list_name, time_range):
+    list_code = get_country_codes(list_name)
 
-        html_fig_scatter_hour = ''
-        html_fig_scatter_versus = ''
+    df_rep_ini = get_data(range(time_range[0], time_range[1] + 1), list_code)[list_code]
 
-    return fig_scatter_hour, fig_scatter_versus, html_fig_scatter_hour, html_fig_scatter_versus
+    # Percentages of all the countries for each load factor at once
+    list_per = np.linspace(10, 100, num=10)
+    df_lfrep = pd.DataFrame([100 * (100 * df_rep_ini <= per).sum() / len(df_rep_ini) for per in list_per],
+                            index=list_per)
 
+    data = []
+    for idx, (country, name) in enumerate(zip(list_code, list_name)):
+        data.append(dict(
+            type='bar',
+            x=df_lfrep.index,
+            y=df_lfrep[country],
+            text=list(round(df_lfrep[country], 2)),
+            textposition='auto',
+            hoverinfo='y',
+            name=name,
+            marker=get_bar_marker(idx),
+            opacity=0.8
+        ))
 
-def fill_bar_hour(ch_year, country_name, sel_hour, df_scatter):
+    layout = get_layout(
+        layout_graph,
+        title='<b>Load Factor Repartition from {} to {}</b>'.format(time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Load Factor [%]'
+        ),
+        yaxis=dict(
+            title='Time Percentage [%]'
+        )
+    )
 
-    df_sc_pos_c = df_scatter.loc[df_scatter['Diff'] >= 0, df_scatter.columns]
-    df_sc_neg_c = df_scatter.loc[df_scatter['Diff'] < 0, df_scatter.columns]
-    df_sc_pos_eu = df_scatter.loc[df_scatter['Diff_EU'] >= 0, df_scatter.columns]
-    df_sc_neg_eu = df_scatter.loc[df_scatter['Diff_EU'] < 0, df_scatter.columns]
+    fig_cr = get_figure(data, layout)
 
-    data = [
-        go.Bar(
-            x=df_sc_pos_c.index,
-            y=df_sc_pos_c['Diff'],
-            name='Diff {} > 0'.format(country_name),
-            marker=dict(
-                color=df_sc_pos_c['Color']
-            ),
-            legendgroup='country'
-        ),
-        go.Bar(
-            x=df_sc_neg_c.index,
-            y=df_sc_neg_c['Diff'],
-            name='Diff {} < 0'.format(country_name),
-            marker=dict(
-                color=df_sc_neg_c['Color']
-            ),
-            legendgroup='country'
-        ),
-        go.Bar(
-            x=df_sc_pos_eu.index,
-            y=df_sc_pos_eu['Diff_EU'],
-            name='Diff EU > 0',
-            marker=dict(
-                color=df_sc_pos_eu['Color_EU']
-            ),
-            legendgroup='EU'
-        ),
-        go.Bar(
-            x=df_sc_neg_eu.index,
-            y=df_sc_neg_eu['Diff_EU'],
-            name='Diff EU < 0',
-            marker=dict(
-                color=df_sc_neg_eu['Color_EU']
-            ),
-            legendgroup='EU'
-        ),
-        go.Scattergl(
-            x=df_scatter.index,
-            y=df_scatter['Mean'],
-            name='Month Mean {}'.format(country_name),
-            mode='lines',
-            line=dict(
-                color='white'
-            ),
-            yaxis='y2',
-            legendgroup='country'
-        ),
-        go.Scattergl(
-            x=df_scatter.index,
-            y=df_scatter['Mean_EU'],
-            name='Month Mean EU',
+    return fig_cr
+
+
+def create_lf_band(list_name, time_range, gr_filter):
+    # Percentile bands of every selected country and Europe per year, or per month over the period, from the merged
+    # histograms
+    years = [year for year in range(time_range[0], time_range[1] + 1) if year in list_year]
+    hist = get_lf_stats(years, get_country_codes(list_name) + ['EU'])
+    if not hist.any():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+    if gr_filter == 'Year':
+        hist = hist.sum(axis=1)
+        list_x = years
+    else:
+        hist = hist.sum(axis=0)
+        list_x = [datetime.date(1900, month, 1).strftime('%B') for month in range(1, 13)]
+    dict_per = {per: 100 * get_lf_percentile(hist, per) for per in band_per}
+    share_low = get_lf_share(hist.sum(axis=0), band_low)
+
+    data = []
+    for idx, name in enumerate(list_name + ['Europe']):
+        if name == 'Europe':
+            color = 'rgb(99, 181, 255)'
+        else:
+            color = get_line_color(idx) or DEFAULT_PLOTLY_COLORS[idx % len(DEFAULT_PLOTLY_COLORS)]
+        # Outer and inner bands, each upper percentile being filled down to the lower one
+        for per_low, per_high in [(band_per[0], band_per[-1]), (band_per[1], band_per[-2])]:
+            for per in [per_low, per_high]:
+                data.append(dict(
+                    type='scatter',
+                    x=list_x,
+                    y=dict_per[per][:, idx],
+                    mode='lines',
+                    line=dict(
+                        color=color,
+                        width=0
+                    ),
+                    fill='tonexty' if per == per_high else None,
+                    fillcolor='rgba' + color[3:-1] + ', 0.2)',
+                    name='{} P{}'.format(name, per),
+                    legendgroup=name,
+                    showlegend=False
+                ))
+        data.append(dict(
+            type='scatter',
+            x=list_x,
+            y=dict_per[50][:, idx],
             mode='lines',
             line=dict(
-                color='aqua'
+                color=color
             ),
-            yaxis='y2',
-            legendgroup='EU'
-        )
-    ]
-
-    layout = go.Layout(
-        title='<b>Load Factor Repartition at {}h in {} in {}</b>'.format(sel_hour, country_name, ch_year),
+            name='{} ({}% of the time below {}%)'.format(name, round(share_low[idx], 1), round(100 * band_low)),
+            legendgroup=name
+        ))
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>Load Factor Median, P{}-P{} and P{}-P{} Bands per {} from {} to {}</b>'.format(
+            band_per[1], band_per[-2], band_per[0], band_per[-1], gr_filter, time_range[0], time_range[1]),
         xaxis=dict(
-            title='Time [GMT]'
+            title=gr_filter
         ),
         yaxis=dict(
-            title='Load Factor Difference [%]'
-        ),
-        yaxis2=dict(
-            title='Mean Load Factor per Month [%]',
-            side='right',
-            overlaying='y',
-            showgrid=False,
-            rangemode='tozero'
-        ),
-        legend=dict(
-            x=.35,
-            y=1.1,
-            orientation="h"
-        ),
-        height=650,
-        margin=dict(l=40, r=40),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+            title='Load Factor [%]'
+        )
     )
 
-    fig_scatter_hour = go.Figure(data=data, layout=layout)
+    fig_cr = get_figure(data, layout)
 
-    return fig_scatter_hour
+    return fig_cr
 
 
-def fill_scatter_versus(ch_year, country_name, sel_hour, df_scatter):
+def create_trep(list_name, time_range, gr_filter, gr_sample):
+    list_code = get_country_codes(list_name)
+
+    df_trep_ini = get_data(range(time_range[0], time_range[1] + 1), list_code)
+
+    if gr_sample == 'Mean':
+        df_trep = df_trep_ini.groupby(gr_filter)[list_code].mean()
+        if gr_filter == 'Month':
+            df_trep.index = [datetime.date(1900, month, 1).strftime('%B') for month in df_trep.index]
+    else:
+        if gr_filter == 'Year':
+            sample = 'A'
+        elif gr_filter == 'Month':
+            sample = 'M'
+        else:
+            sample = 'D'
+        df_trep_ini.index = pd.to_datetime(df_trep_ini[['Year', 'Month', 'Day']])
+        df_trep = df_trep_ini[list_code].resample(sample).mean()
 
     data = []
-    for df_gr in df_scatter.groupby('Month'):
-        trace = go.Scattergl(
-            x=df_gr[1]['Diff'],
-            y=df_gr[1]['Diff_EU'],
-            mode='markers',
-            text=list(df_gr[1].index),
-            hoverinfo='text',
-            name=datetime.date(1900, df_gr[0], 1).strftime('%B'),
-        )
-        data.append(trace)
+    for idx, (country, name) in enumerate(zip(list_code, list_name)):
+        data.append(dict(
+            type='bar',
+            x=df_trep.index,
+            y=100 * df_trep[country],
+            text=list(round(100 * df_trep[country], 2)),
+            textposition='auto',
+            legendgroup='Country_{}'.format(idx + 1),
+            hoverinfo='x+y',
+            name=name,
+            marker=get_bar_marker(idx),
+            opacity=0.8
+        ))
 
-    layout = go.Layout(
-        title='<b>Load Factor Points at {}h in {} in {}</b>'.format(sel_hour, country_name, ch_year),
+    layout = get_layout(
+        layout_graph,
+        title='<b>Mean Load Factor per {} from {} to {}</b>'.format(gr_filter, time_range[0], time_range[1]),
         xaxis=dict(
-            title='Difference {}'.format(country_name)
+            title=gr_filter,
         ),
         yaxis=dict(
-            title='Difference EU'
-        ),
-        height=650,
-        margin=dict(l=40, r=40),
-        hovermode='closest',
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+            title='Load Factor [%]'
+        )
     )
 
-    per_tr = 100 * len(df_scatter.loc[(df_scatter['Diff'] > 0) & (df_scatter['Diff_EU'] > 0)]) / len(df_scatter)
-    per_br = 100 * len(df_scatter.loc[(df_scatter['Diff'] > 0) & (df_scatter['Diff_EU'] < 0)]) / len(df_scatter)
-    per_cr = 100 * len(df_scatter.loc[df_scatter['Diff'] > 0]) / len(df_scatter)
-    per_bl = 100 * len(df_scatter.loc[(df_scatter['Diff'] < 0) & (df_scatter['Diff_EU'] < 0)]) / len(df_scatter)
-    per_bc = 100 * len(df_scatter.loc[df_scatter['Diff_EU'] < 0]) / len(df_scatter)
-    per_tl = 100 * len(df_scatter.loc[(df_scatter['Diff'] < 0) & (df_scatter['Diff_EU'] > 0)]) / len(df_scatter)
-    per_cl = 100 * len(df_scatter.loc[df_scatter['Diff'] < 0]) / len(df_scatter)
-    per_tc = 100 * len(df_scatter.loc[df_scatter['Diff_EU'] > 0]) / len(df_scatter)
-    ann_tr = dict(xref='paper', yref='paper', showarrow=False, x=1, y=1, text=str(round(per_tr, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_br = dict(xref='paper', yref='paper', showarrow=False, x=1, y=0, text=str(round(per_br, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_bl = dict(xref='paper', yref='paper', showarrow=False, x=0, y=0, text=str(round(per_bl, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_tl = dict(xref='paper', yref='paper', showarrow=False, x=0, y=1, text=str(round(per_tl, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_cr = dict(xref='paper', yref='y', showarrow=False, x=1, y=0, text=str(round(per_cr, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_bc = dict(xref='x', yref='paper', showarrow=False, x=0, y=0, text=str(round(per_bc, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_cl = dict(xref='paper', yref='y', showarrow=False, x=0, y=0, text=str(round(per_cl, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    ann_tc = dict(xref='x', yref='paper', showarrow=False, x=0, y=1, text=str(round(per_tc, 2)) + '%',
-                  align='center', font=dict(color='#ffffff'), bordercolor='#c7c7c7', borderwidth=2, borderpad=4,
-                  bgcolor='#000000', opacity=0.8)
-    layout.annotations = [ann_tr, ann_br, ann_bl, ann_tl, ann_bc, ann_cl, ann_cr, ann_tc]
-
-    fig_scatter_versus = go.Figure(data=data, layout=layout)
-
-    return fig_scatter_versus
-
-
-########################################################################################################################
-# Country Selection
-########################################################################################################################
-@app.callback([Output('map_corr', 'srcDoc'),
-               Output('fig_rep_month', 'figure'),
-               Output('fig_rep_per', 'figure'),
-               Output('dl_fig_rep_month', 'href'),
-               Output('dl_fig_rep_per', 'href'),
-               Output('dl_map_corr', 'href')],
-              [Input('drop_country', 'value'),
-               Input('sl_year', 'value')])
-def country_choice(ch_country, ch_year):
-
-    map_corr_str = create_map_corr(ch_year, ch_country)
-    fig_rep_month = create_fig_rep_month(ch_year, ch_country)
-    fig_rep_per = create_fig_rep_per(ch_year, ch_country)
-
-    html_fig_rep_month = template_download_plotly(fig_rep_month)
-    html_fig_rep_per = template_download_plotly(fig_rep_per)
+    fig_cr = get_figure(data, layout)
 
-    return map_corr_str, fig_rep_month, fig_rep_per, html_fig_rep_month, html_fig_rep_per, \
-           template_download_map(map_corr_str)
+    return fig_cr
 
 
-def create_map_corr(ch_year, ch_country):
-    ch_country_code = df_euro.loc[df_euro['Name'] == ch_country, 'Code'].item()
+def create_stacked(country_1, time_range, gr_filter, gr_sample):
+    country_1_code = df_euro.loc[df_euro['Name'] == country_1, 'Code'].item()
 
-    map_corr = folium.Map(location=(55, 15), zoom_start=3)
-    df_data_corr = df_data.loc[df_data['Year'] == ch_year, list_country].corr()
+    df_st_ini = get_data(range(time_range[0], time_range[1] + 1), [country_1_code])
 
-    for feature in europe_geo['features']:
-        isoa2 = feature['properties']['iso_a2']
-        if isoa2 in df_data_corr.columns:
-            feature['properties']['Corr. Factor'] = str(round(df_data_corr[ch_country_code][isoa2], 2))
-            feature['properties']['Load Factor'] = str(round(100 * df_data.loc[df_data['Year'] == ch_year,
-                                                                               isoa2].mean(), 1)) + '%'
-            feature['properties']['Country'] = feature['properties']['name']
+    list_per = np.linspace(10, 100, num=10)
+    df_st = pd.DataFrame()
+    if gr_sample == 'Mean':
+        for df_gr in df_st_ini.groupby(gr_filter):
+            if gr_filter == 'Month':
+                idx = datetime.date(1900, df_gr[0], 1).strftime('%B')
+            else:
+                idx = df_gr[0]
+            for per in list_per:
+                df_st.loc[idx, per] = 100 * len(df_gr[1].loc[(100 * df_gr[1][country_1_code] <= per) &
+                                                             (100 * df_gr[1][country_1_code] > per - 10)]) / len(df_gr[1])
+    elif gr_sample == 'All':
+        if gr_filter == 'Year':
+            groupby_f = 'Year'
+        elif gr_filter == 'Month':
+            groupby_f = ['Year', 'Month']
         else:
-            feature['properties']['Corr. Factor'] = ''
-            feature['properties']['Load Factor'] = ''
-            feature['properties']['Country'] = feature['properties']['name']
+            if time_range[1] == time_range[0]:
+                groupby_f = ['Year', 'Month', 'Day']
+            else:
+                groupby_f = ['Year', 'Month']
+        for df_gr in df_st_ini.groupby(groupby_f):
+            idx = [str(i) for i in df_gr[0]]
+            idx = pd.to_datetime('/'.join(idx), format='%Y/%m/%d')
+            for per in list_per:
+                df_st.loc[idx, per] = 100 * len(df_gr[1].loc[(100 * df_gr[1][country_1_code] <= per) &
+                                                             (100 * df_gr[1][country_1_code] > per - 10)]) / len(df_gr[1])
 
-    str_ = europe_geo['features'].to_json()
-    for idx in range(0, len(europe_geo.index)):
-        str_ = str_.replace('"{}":'.format(idx), '')
-    str_ = '{"type":"FeatureCollection","features":[' + str_[1:-1] + ']}'
+    data = []
+    for per in list_per:
+        trace = dict(
+            type='scatter',
+            x=df_st.index,
+            y=df_st[per],
+            name='LF < {}%'.format(round(per, 0)),
+            stackgroup='st_gr',
+            groupnorm='percent'
+        )
+        data.append(trace)
 
-    map_geojson = folium.Choropleth(
-        geo_data=str_,
-        name='choropleth',
-        data=df_data_corr,
-        columns=[df_data_corr.index, ch_country_code],
-        key_on='properties.iso_a2',
-        fill_color='YlGn',
-        fill_opacity=0.7,
-        line_opacity=0.2,
-        nan_fill_opacity=0.1,
-        highlight=True,
-        legend_name='Load Factor Correlation Factor between {} and Countries in {}'.format(ch_country, ch_year)
+    layout = get_layout(
+        layout_theme,
+        title='<b>Load Factor Repartition in {} per {} from {} to {}</b>'.format(country_1, gr_filter, time_range[0],
+                                                                                time_range[1]),
+        xaxis=dict(
+            title=gr_filter
+        ),
+        yaxis=dict(
+            title='Time Percentage [%]'
+        ),
+        margin=dict(l=40, r=0),
+        height=650
     )
 
-    folium.GeoJsonTooltip(
-        fields=['Country', 'Corr. Factor', 'Load Factor']
-    ).add_to(map_geojson.geojson)
+    fig_cr = get_figure(data, layout)
 
-    map_geojson.add_to(map_corr)
+    return fig_cr
 
-    lf_ch_country = 100 * df_data.loc[df_data['Year'] == ch_year, ch_country_code].mean()
-    folium.CircleMarker(
-        location=[df_euro.loc[df_euro['Code'] == ch_country_code, 'Lat'].item(),
-                  df_euro.loc[df_euro['Code'] == ch_country_code, 'Lon'].item()],
-        radius=10,
-        color='blue',
-        fill=True,
-        fill_color='blue'
-    ).add_to(map_corr)
 
-    for country in list_country:
-        if country != ch_country_code:
-            lf_country = 100 * df_data.loc[df_data['Year'] == ch_year, country].mean()
-            if not np.isnan(lf_country):
-                if lf_country < lf_ch_country:
-                    c_color = 'red'
-                else:
-                    c_color = 'green'
-                folium.CircleMarker(
-                    location=[df_euro.loc[df_euro['Code'] == country, 'Lat'].item(),
-                              df_euro.loc[df_euro['Code'] == country, 'Lon'].item()],
-                    radius=max(1, 10 + lf_country - lf_ch_country),
-                    color=c_color,
-                    fill=True,
-                    fill_color=c_color
-                ).add_to(map_corr)
+def create_corr(time_range):
+    df_data_corr = get_corr(range(time_range[0], time_range[1] + 1))
+    df_data_corr = df_data_corr.dropna(how='all').dropna(axis=1, how='all')
 
-    return map_corr.get_root().render()
+    fig_cr = create_heatmap_corr(df_data_corr, 'from {} to {}'.format(time_range[0], time_range[1]))
+    fig_cr['layout']['height'] = 650
 
+    return fig_cr
 
-def create_fig_rep_month(ch_year, ch_country):
-    ch_country_code = df_euro.loc[df_euro['Name'] == ch_country, 'Code'].item()
 
-    df_load_month = pd.DataFrame()
-    for df_gr in df_data.loc[df_data['Year'] == ch_year].groupby('Month'):
-        month = datetime.date(1900, df_gr[0], 1).strftime('%B')
-        df_temp = df_gr[1][list_country]
-        av_eu = 0
-        for country in list_country:
-            if country in df_cap.index:
-                if not np.isnan(df_cap[ch_year][country]):
-                    av_eu += 100 * df_temp[country].mean() * df_cap[ch_year][country] / df_cap[ch_year].sum()
-        df_load_month.loc[month, 'LF_EU'] = av_eu
-        df_load_month.loc[month, 'LF_Country'] = 100 * df_gr[1][ch_country_code].mean()
+def create_corr_distance(time_range):
+    years = range(time_range[0], time_range[1] + 1)
+    list_color = ['rgb(99, 181, 255)', 'rgb(202, 225, 158)', 'rgb(255, 202, 58)', 'rgb(225, 112, 58)']
+    list_dist = np.linspace(0, arr_distance.max(), num=50)
 
-    data = [
-        go.Bar(
-            x=df_load_month.index,
-            y=df_load_month['LF_EU'],
-            text=list(round(df_load_month['LF_EU'], 2)),
-            name='Europe',
-            textposition='auto',
-            hoverinfo='y',
+    data = []
+    for season, color in zip(dict_season, list_color):
+        # Pairs and fit on the whole range
+        distance, corr = get_corr_distance(get_corr(years, dict_season[season]))
+        if not distance.size:
+            continue
+        length = get_decay_length(distance, corr)
+        data.append(dict(
+            type='scattergl',
+            x=distance,
+            y=corr,
+            mode='markers',
             marker=dict(
-                color='rgb(225, 202,158)',
+                size=3,
+                color=color
+            ),
+            opacity=0.5,
+            legendgroup=season,
+            name=season,
+            hoverinfo='x+y'
+        ))
+        # No fit when the correlations do not decrease with distance
+        if np.isfinite(length):
+            data.append(dict(
+                type='scatter',
+                x=list_dist,
+                y=np.exp(-list_dist / length),
+                mode='lines',
                 line=dict(
-                    color='rgb(107,48,8)',
-                    width=1.5),
+                    color=color
+                ),
+                legendgroup=season,
+                showlegend=False,
+                name='{} ({} km)'.format(season, round(length))
+            ))
+
+        # Decay length of each year
+        list_length = [get_decay_length(*get_corr_distance(get_corr([year], dict_season[season]))) for year in years]
+        data.append(dict(
+            type='scatter',
+            x=list(years),
+            y=list_length,
+            mode='lines+markers',
+            line=dict(
+                color=color
             ),
-            opacity=0.8
+            legendgroup=season,
+            showlegend=False,
+            name=season,
+            xaxis='x2',
+            yaxis='y2'
+        ))
+    if not data:
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>Load Factor Correlation against Distance from {} to {}</b>'.format(time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Distance [km]',
+            domain=[0, 0.55]
         ),
-        go.Bar(
-            x=df_load_month.index,
-            y=df_load_month['LF_Country'],
-            text=list(round(df_load_month['LF_Country'], 2)),
-            name=ch_country,
-            textposition='auto',
-            hoverinfo='y',
-            marker=dict(
-                color='rgb(202, 225, 158)',
-                line=dict(
-                    color='rgb(48, 107, 8)',
-                    width=1.5),
+        yaxis=dict(
+            title='Correlation Factor'
+        ),
+        xaxis2=dict(
+            title='Year',
+            domain=[0.65, 1]
+        ),
+        yaxis2=dict(
+            title='Decay Length [km]',
+            anchor='x2'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_anomaly(list_name, time_range, gr_filter):
+    list_idx = [list_country.get_loc(country) for country in get_country_codes(list_name)]
+    idx_1 = list_idx[0]
+
+    matrix = get_lf_matrix()
+    clim = get_climatology()
+    rows = np.flatnonzero((matrix['idx_year'] >= list_year.index(time_range[0])) &
+                          (matrix['idx_year'] <= list_year.index(time_range[1])))
+    time_rows = matrix['time'][rows]
+    if gr_filter == 'Year':
+        time_rows = time_rows.to_period('Y').to_timestamp()
+    elif gr_filter == 'Month':
+        time_rows = time_rows.to_period('M').to_timestamp()
+    elif gr_filter == 'Day':
+        time_rows = time_rows.floor('D')
+
+    # Anomalies in percent, with the climatological 10% - 90% band of the first country around its mean
+    anomaly = clim['anomaly'][rows][:, list_idx].astype(float)
+    anomaly[anomaly == -32768] = np.nan
+    if np.isnan(anomaly).all():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+    group = clim['group'][rows]
+    df_anomaly = pd.DataFrame(anomaly / 100, columns=list_name, index=time_rows)
+    df_anomaly['Low'] = 100 * (clim['per'][0][group, idx_1] - clim['mean'][group, idx_1])
+    df_anomaly['High'] = 100 * (clim['per'][-1][group, idx_1] - clim['mean'][group, idx_1])
+    if gr_filter != 'Hour':
+        df_anomaly = df_anomaly.groupby(level=0).mean()
+
+    data = [
+        dict(
+            type='scattergl',
+            x=df_anomaly.index,
+            y=df_anomaly['Low'],
+            mode='lines',
+            line=dict(
+                width=0
             ),
-            opacity=0.8
+            hoverinfo='skip',
+            showlegend=False
         ),
+        dict(
+            type='scattergl',
+            x=df_anomaly.index,
+            y=df_anomaly['High'],
+            mode='lines',
+            line=dict(
+                width=0
+            ),
+            fill='tonexty',
+            fillcolor='rgba(202, 225, 158, 0.2)',
+            hoverinfo='skip',
+            name='{} {}% - {}%'.format(list_name[0], clim_per[0], clim_per[-1])
+        )
     ]
+    for idx, name in enumerate(list_name):
+        data.append(dict(
+            type='scattergl',
+            x=df_anomaly.index,
+            y=df_anomaly[name],
+            mode='lines',
+            line=dict(
+                color=get_line_color(idx)
+            ),
+            name=name
+        ))
 
-    layout = go.Layout(
-        title='<b>Mean Load Factor per Month in {}</b>'.format(ch_year),
+    layout = get_layout(
+        layout_theme,
+        title='<b>Load Factor Anomaly vs Climatology per {} from {} to {}</b>'.format(gr_filter, time_range[0],
+                                                                                    time_range[1]),
         xaxis=dict(
-            title='Month'
+            title='Time'
         ),
         yaxis=dict(
-            title='Load Factor [%]'
+            title='Anomaly [%]'
         ),
         legend=dict(
-            x=.35,
+            x=.2,
             y=1.1,
             orientation="h"
         ),
-        height=500,
         margin=dict(l=40, r=0),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+        height=650
     )
 
-    fig_rep_month = go.Figure(data=data, layout=layout)
+    fig_cr = get_figure(data, layout)
 
-    return fig_rep_month
+    return fig_cr
 
 
-def create_fig_rep_per(ch_year, ch_country):
-    ch_country_code = df_euro.loc[df_euro['Name'] == ch_country, 'Code'].item()
+def create_ramp_rep(list_name, time_range):
+    hist = get_ramp_stats(range(time_range[0], time_range[1] + 1), get_country_codes(list_name) + ['EU']).sum(axis=0)
+    if not hist.any():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+    list_ramp = 100 * (ramp_bins[:-1] + ramp_bins[1:]) / 2
+    ramp_range = 100 * np.nanmax(get_ramp_percentile(hist, 99.9)) + 1
 
-    list_per = np.linspace(10, 100, num=10)
-    df_data_rep = df_data.loc[df_data['Year'] == ch_year, list_country]
-    df_data_rep['Mean'] = 0
-    for country in df_data_rep.columns:
-        if country in df_cap.index:
-            if not np.isnan(df_cap[ch_year][country]):
-                df_data_rep['Mean'] += df_data_rep[country] * df_cap[ch_year][country] / df_cap[ch_year].sum()
+    data = []
+    for idx, (name, hist_c) in enumerate(zip(list_name + ['Europe'], hist)):
+        color = 'rgb(99, 181, 255)' if name == 'Europe' else get_line_color(idx)
+        per_99 = get_ramp_percentile(hist_c, 99)
+        data.append(dict(
+            type='scatter',
+            x=list_ramp,
+            y=100 * hist_c / max(hist_c.sum(), 1),
+            mode='lines',
+            line=dict(
+                color=color,
+                shape='hvh'
+            ),
+            name='{} (99% of |changes| < {}%)'.format(name, round(100 * per_99, 1))
+        ))
 
-    df_rep = pd.DataFrame()
-    for per in list_per:
-        df_rep.loc[per, 'EU'] = 100 * len(df_data_rep.loc[100 * df_data_rep['Mean'] <= per]) / len(df_data_rep)
-        df_rep.loc[per, 'Country'] = 100 * len(df_data_rep.loc[100 * df_data_rep[ch_country_code] <= per]) / len(
-            df_data_rep)
+    layout = get_layout(
+        layout_theme,
+        title='<b>Hourly Load Factor Change Repartition from {} to {}</b>'.format(time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Load Factor Change [%/h]',
+            range=[-ramp_range, ramp_range]
+        ),
+        yaxis=dict(
+            title='Time Percentage [%]'
+        ),
+        legend=dict(
+            x=0,
+            y=1.1,
+            orientation="h"
+        ),
+        margin=dict(l=40, r=0),
+        height=650
+    )
 
-    data = [
-        go.Bar(
-            x=df_rep.index,
-            y=df_rep['EU'],
-            text=list(round(df_rep['EU'], 2)),
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_ramp_extremes(list_name, time_range):
+    # Mean count per year of the changes above ramp_extreme, per month
+    years = range(time_range[0], time_range[1] + 1)
+    hist = get_ramp_stats(years, get_country_codes(list_name) + ['EU'])
+    if not hist.any():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+    extreme = np.abs(ramp_bins[:-1] + ramp_step / 2) > ramp_extreme
+    list_count = hist[..., extreme].sum(axis=-1) / len(years)
+    list_month = [datetime.date(1900, month, 1).strftime('%B') for month in range(1, 13)]
+
+    data = []
+    for idx, name in enumerate(list_name + ['Europe']):
+        color = 'rgb(99, 181, 255)' if name == 'Europe' else get_line_color(idx)
+        data.append(dict(
+            type='bar',
+            x=list_month,
+            y=list_count[:, idx],
+            text=list(np.round(list_count[:, idx], 1)),
             textposition='auto',
             hoverinfo='y',
-            name='Europe',
+            name=name,
             marker=dict(
-                color='rgb(225, 202,158)',
-                line=dict(
-                    color='rgb(107,48,8)',
-                    width=1.5),
+                color=color
             ),
             opacity=0.8
+        ))
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>Hours with a Load Factor Change above {}%/h per Month from {} to {}</b>'.format(
+            round(100 * ramp_extreme), time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Month'
         ),
-        go.Bar(
-            x=df_rep.index,
-            y=df_rep['Country'],
-            text=list(round(df_rep['Country'], 2)),
+        yaxis=dict(
+            title='Hours per Year'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_ramp_div(time_range):
+    # 99th percentile of the absolute changes of every country against the European one
+    hist = get_ramp_stats(range(time_range[0], time_range[1] + 1), list(list_country) + ['EU']).sum(axis=0)
+    if not hist.any():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+    list_per = 100 * get_ramp_percentile(hist, 99)
+    df_per = pd.Series(list_per[:-1], index=list_country).dropna().sort_values()
+    per_eu = list_per[-1]
+
+    data = [
+        dict(
+            type='bar',
+            x=[df_euro.loc[df_euro['Code'] == country, 'Name'].item() for country in df_per.index],
+            y=df_per.values,
+            text=list(np.round(df_per.values, 1)),
             textposition='auto',
-            hoverinfo='y',
-            name=ch_country,
+            hoverinfo='x+y',
+            name='Countries',
             marker=dict(
-                color='rgb(202, 225, 158)',
-                line=dict(
-                    color='rgb(48, 107, 8)',
-                    width=1.5),
+                color='rgb(202, 225, 158)'
             ),
             opacity=0.8
         ),
+        dict(
+            type='scatter',
+            x=[df_euro.loc[df_euro['Code'] == country, 'Name'].item() for country in df_per.index],
+            y=[per_eu] * len(df_per),
+            mode='lines',
+            line=dict(
+                color='rgb(99, 181, 255)',
+                dash='dash'
+            ),
+            name='Europe ({}%/h)'.format(round(per_eu, 1))
+        )
     ]
 
-    layout = go.Layout(
-        title='<b>Load Factor Repartition in {}</b>'.format(ch_year),
+    layout = get_layout(
+        layout_graph,
+        title='<b>99th Percentile of the Hourly Load Factor Change from {} to {}</b>'.format(time_range[0],
+                                                                                          time_range[1]),
         xaxis=dict(
-            title='Load Factor [%]'
+            title='Country'
         ),
         yaxis=dict(
-            title='Time Percentage [%]'
+            title='Load Factor Change [%/h]'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_optimal_mix(time_range, gr_target):
+    years = range(time_range[0], time_range[1] + 1)
+    if gr_target == 'Variance':
+        lf_min = None
+        lf_ref = 0.1
+    else:
+        lf_min = float(gr_target[5:-1]) / 100
+        lf_ref = lf_min
+
+    mean, df_cov = get_moments(years)
+    if mean.empty:
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+    cap_year = df_cap.columns.max()
+    dict_mix = OrderedDict()
+    dict_mix['Optimal'] = get_optimal_mix(years, lf_min)
+    dict_mix['Actual {}'.format(cap_year)] = df_cap[cap_year].reindex(mean.index).fillna(0)
+
+    data = []
+    for mix_name, color in zip(dict_mix, ['rgb(202, 225, 158)', 'rgb(225, 202,158)']):
+        mix = dict_mix[mix_name]
+        if mix.sum() == 0:
+            continue
+        mean_mix, std_mix, below = get_mix_stats(mix, mean, df_cov, lf_ref)
+        mix = 100 * mix / mix.sum()
+        data.append(dict(
+            type='bar',
+            x=[df_euro.loc[df_euro['Code'] == country, 'Name'].item() for country in mix.index],
+            y=mix.values,
+            text=list(round(mix, 1)),
+            textposition='auto',
+            hoverinfo='x+y',
+            name='{} (LF {}%, Std {}%, LF < {}% {}% of time)'.format(
+                mix_name, round(100 * mean_mix, 1), round(100 * std_mix, 1), round(100 * lf_ref), round(below, 1)),
+            marker=dict(
+                color=color
+            ),
+            opacity=0.8
+        ))
+
+    layout = get_layout(
+        layout_theme,
+        title='<b>Capacity Mix minimizing {} from {} to {}</b>'.format(
+            'the Variance' if lf_min is None else 'the Time with ' + gr_target, time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Country'
+        ),
+        yaxis=dict(
+            title='Capacity Share [%]'
         ),
         legend=dict(
-            x=.35,
+            x=0,
             y=1.1,
             orientation="h"
         ),
         margin=dict(l=40, r=0),
-        height=500,
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+        height=650
     )
 
-    fig_rep_per = go.Figure(data=data, layout=layout)
-
-    return fig_rep_per
+    fig_cr = get_figure(data, layout)
 
+    return fig_cr
 
-########################################################################################################################
-# Custom Graph Creation
-########################################################################################################################
-@app.callback([Output('fig_cr', 'figure'),
-               Output('dl_fig_cr', 'href')],
-              [Input('drop_c_1', 'value'),
-               Input('drop_c_2', 'value'),
-               Input('sl_range', 'value'),
-               Input('drop_type', 'value'),
-               Input('drop_filter', 'value'),
-               Input('drop_sample', 'value')])
-def create_custom_graph(country_1, country_2, time_range, gr_type, gr_filter, gr_sample):
-    if gr_type == 'Scatter':
-        fig_cr = create_scatter(country_1, country_2, time_range, gr_filter)
-    elif gr_type == 'Versus':
-        fig_cr = create_versus(country_1, country_2, time_range, gr_filter, gr_sample)
-    elif gr_type == 'LF Rep.':
-        fig_cr = create_lfrep(country_1, country_2, time_range)
-    elif gr_type == 'Time Rep.':
-        fig_cr = create_trep(country_1, country_2, time_range, gr_filter, gr_sample)
-    elif gr_type == 'Stacked':
-        fig_cr = create_stacked(country_1, time_range, gr_filter, gr_sample)
-    else:
-        fig_cr = go.Figure(layout=layout_ini)
 
-    html_fig = template_download_plotly(fig_cr)
+def get_prod_rows(time_range):
+    # Hours of the period whose year has capacities
+    idx_year = [list_year.index(year) for year in range(time_range[0], time_range[1] + 1) if year in list_year]
 
-    return fig_cr, html_fig
+    return np.isin(get_lf_matrix()['idx_year'], idx_year) & ~np.isnan(get_prod_matrix()['eu'])
 
 
-def create_scatter(country_1, country_2, time_range, gr_filter):
+def create_production(time_range, gr_filter):
+    matrix = get_lf_matrix()
+    sel = get_prod_rows(time_range)
+    if not sel.any():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
 
     if gr_filter == 'Year':
-        sample = 'A'
+        group = matrix['idx_year']
     elif gr_filter == 'Month':
-        sample = 'M'
+        group = matrix['idx_year'] * 12 + matrix['month']
+    elif gr_filter == 'Day':
+        group = matrix['idx_day']
+    else:
+        group = np.arange(len(sel))
+    df_prod = pd.DataFrame({'Time': matrix['time'][sel], 'GW': get_prod_matrix()['eu'][sel] / 1000,
+                            'Group': group[sel]})
+    df_gr = df_prod.groupby('Group').agg(Time=('Time', 'first'), Mean=('GW', 'mean'), Peak=('GW', 'max'),
+                                         Min=('GW', 'min'))
+
+    data = [dict(
+        type='scattergl',
+        x=df_gr['Time'],
+        y=df_gr['Mean'],
+        mode='lines',
+        line=dict(
+            color='rgb(99, 181, 255)'
+        ),
+        name='Mean per {}'.format(gr_filter) if gr_filter != 'Hour' else 'Production'
+    )]
+    if gr_filter != 'Hour':
+        for col, color in [('Peak', 'rgb(202, 225, 158)'), ('Min', 'rgb(225, 202,158)')]:
+            data.append(dict(
+                type='scattergl',
+                x=df_gr['Time'],
+                y=df_gr[col],
+                mode='lines',
+                line=dict(
+                    color=color,
+                    dash='dot'
+                ),
+                name='Hourly {} per {}'.format('Peak' if col == 'Peak' else 'Minimum', gr_filter)
+            ))
+    # Peak and minimum hours of the whole period
+    for idx, label, color in [(df_prod['GW'].idxmax(), 'Peak', 'rgb(202, 225, 158)'),
+                              (df_prod['GW'].idxmin(), 'Minimum', 'rgb(225, 202,158)')]:
+        data.append(dict(
+            type='scattergl',
+            x=[df_prod['Time'][idx]],
+            y=[df_prod['GW'][idx]],
+            mode='markers',
+            marker=dict(
+                color=color,
+                size=12
+            ),
+            name='{}: {} GW on {}'.format(label, round(float(df_prod['GW'][idx]), 1),
+                                          df_prod['Time'][idx].strftime('%Y/%m/%d %H:00'))
+        ))
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>European Wind Production per {} from {} to {}</b>'.format(gr_filter, time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Time [GMT]'
+        ),
+        yaxis=dict(
+            title='Production [GW]'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_prod_share(time_range):
+    sel = get_prod_rows(time_range)
+    if not sel.any():
+        return get_figure([], get_layout(layout_ini, title='<b>No Capacities from {} to {}</b>'.format(*time_range)))
+
+    # Hourly MW summed into MWh
+    energy = pd.Series(np.nansum(get_prod_matrix()['values'][sel], axis=0, dtype=np.float64), index=list_country)
+    energy = energy[energy > 0].sort_values(ascending=False)
+    share = 100 * energy / energy.sum()
+
+    data = [dict(
+        type='bar',
+        x=[df_euro.loc[df_euro['Code'] == country, 'Name'].item() for country in share.index],
+        y=share.values,
+        text=list(round(share, 1)),
+        textposition='auto',
+        hovertext=['{} TWh'.format(round(value / 1e6, 2)) for value in energy],
+        hoverinfo='x+y+text',
+        name='Share of the {} TWh produced in Europe'.format(round(energy.sum() / 1e6, 1)),
+        marker=dict(
+            color='rgb(99, 181, 255)'
+        ),
+        opacity=0.8
+    )]
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>Country Shares of the European Wind Production from {} to {}</b>'.format(time_range[0],
+                                                                                          time_range[1]),
+        xaxis=dict(
+            title='Country'
+        ),
+        yaxis=dict(
+            title='Production Share [%]'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+def create_lagcorr(country_1, country_2, time_range):
+    # Every selected country against the reference one, autocorrelations are hidden when several are selected
+    list_name = [country for country in country_1 if country != country_2] + [country_2]
+
+    # Only the correlations with the reference and the autocorrelations are computed
+    n_name = len(list_name)
+    pairs = [(idx, n_name - 1) for idx in range(n_name - 1)] + [(idx, idx) for idx in range(n_name)]
+    lag_corr = get_lag_corr(range(time_range[0], time_range[1] + 1), get_country_codes(list_name), lag_max, pairs)
+    list_lag = np.arange(-lag_max, lag_max + 1)
+
+    data = []
+    for idx, name in enumerate(list_name[:-1]):
+        data.append(dict(
+            type='scattergl',
+            x=list_lag,
+            y=lag_corr[:, idx],
+            mode='lines',
+            name='{} - {}'.format(name, country_2)
+        ))
+    for idx, name in enumerate(list_name):
+        data.append(dict(
+            type='scattergl',
+            x=list_lag,
+            y=lag_corr[:, n_name - 1 + idx],
+            mode='lines',
+            line=dict(
+                dash='dot'
+            ),
+            visible=True if len(list_name) == 2 else 'legendonly',
+            name='{} - {}'.format(name, name)
+        ))
+
+    layout = get_layout(
+        layout_graph,
+        title='<b>Load Factor Correlation per Lag between {} and {} from {} to {}</b>'.format(
+            get_names_str(list_name[:-1]), country_2, time_range[0], time_range[1]),
+        xaxis=dict(
+            title='Lag of {} [h]'.format(country_2)
+        ),
+        yaxis=dict(
+            title='Correlation Factor'
+        )
+    )
+
+    fig_cr = get_figure(data, layout)
+
+    return fig_cr
+
+
+########################################################################################################################
+# Low Wind Events
+########################################################################################################################
+@app.callback([Output('fig_ev', 'figure'),
+               Output('tab_ev', 'children'),
+               Output('c_ev', 'children')],
+              [Input('drop_ev_country', 'value'),
+               Input('drop_ev_threshold', 'value'),
+               Input('drop_ev_duration', 'value'),
+               Input('sl_ev_range', 'value')])
+def fill_events(ev_country, ev_threshold, ev_duration, time_range):
+    if ev_country == 'Europe':
+        ev_code = 'EU'
     else:
-        sample = 'D'
+        ev_code = df_euro.loc[df_euro['Name'] == ev_country, 'Code'].item()
+    df_event = get_events(ev_threshold / 100, ev_code, time_range, ev_duration)
 
-    country_1_code = df_euro.loc[df_euro['Name'] == country_1, 'Code'].item()
-    country_2_code = df_euro.loc[df_euro['Name'] == country_2, 'Code'].item()
+    md_ev = '{} events, {} hours in total, from {} to {}'.format(len(df_event), df_event['Duration'].sum(),
+                                                                 time_range[0], time_range[1])
 
-    df_scatter = df_data.loc[(df_data['Year'] >= time_range[0]) & (df_data['Year'] <= time_range[1]),
-                             [country_1_code, country_2_code, 'Year', 'Month', 'Day']]
-    df_scatter['Time'] = df_scatter['Year'].apply(str) + '/' + df_scatter['Month'].apply(str) + '/' + \
-                         df_scatter['Day'].apply(str)
-    df_scatter['Time'] = pd.to_datetime(df_scatter['Time'], format='%Y/%m/%d')
-    df_scatter.set_index('Time', inplace=True)
-    df_scatter = df_scatter.resample(sample).mean()
+    return create_fig_ev(ev_country, ev_threshold, time_range, df_event), create_tab_ev(df_event), md_ev
 
-    data = []
-    for country in [country_1_code, country_2_code]:
-        trace = go.Scattergl(
-            x=df_scatter.index,
-            y=100 * df_scatter[country],
-            mode='lines',
-            name=df_euro.loc[df_euro['Code'] == country, 'Name'].item()
+
+def create_fig_ev(ev_country, ev_threshold, time_range, df_event):
+    data = [
+        dict(
+            type='scattergl',
+            x=df_event['Start'],
+            y=df_event['Duration'],
+            mode='markers',
+            text=['Start: {}<br>Duration: {} h<br>Mean: {}%<br>Min: {}%'.format(
+                start.strftime('%Y/%m/%d %H:00'), duration, round(mean, 1), round(lf_min, 1))
+                for start, duration, mean, lf_min in zip(df_event['Start'], df_event['Duration'], df_event['Mean'],
+                                                         df_event['Min'])],
+            hoverinfo='text',
+            marker=dict(
+                size=8,
+                color=df_event['Mean'],
+                colorscale='YlOrRd',
+                reversescale=True,
+                colorbar=dict(
+                    title='Mean LF [%]'
+                )
+            )
         )
-        data.append(trace)
+    ]
 
-    layout = go.Layout(
-        title='<b>Mean Load Factor per {} for {} and {} from {} to {}</b>'.format(gr_filter, country_1, country_2,
-                                                                                time_range[0], time_range[1]),
+    layout = get_layout(
+        layout_theme,
+        title='<b>Low Wind Events (LF < {}%) in {} from {} to {}</b>'.format(ev_threshold, ev_country, time_range[0],
+                                                                           time_range[1]),
         xaxis=dict(
-            title='Time'
+            title='Start'
         ),
         yaxis=dict(
-            title='Load Factor [%]'
-        ),
-        legend=dict(
-            x=.35,
-            y=1.1,
-            orientation="h"
+            title='Duration [h]'
         ),
         margin=dict(l=40, r=0),
-        height=650,
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+        height=650
     )
 
-    fig_cr = go.Figure(data=data, layout=layout)
+    fig_ev = get_figure(data, layout)
 
-    return fig_cr
+    return fig_ev
 
 
-def create_versus(country_1, country_2, time_range, gr_filter, gr_sample):
-    country_1_code = df_euro.loc[df_euro['Name'] == country_1, 'Code'].item()
-    country_2_code = df_euro.loc[df_euro['Name'] == country_2, 'Code'].item()
+def create_tab_ev(df_event):
+    df_tab = df_event.sort_values('Duration', ascending=False).head(15)
 
-    if gr_filter == 'Year':
-        sample = 'A'
-    elif gr_filter == 'Month':
-        sample = 'M'
-    else:
-        sample = 'D'
+    tab_ev = html.Table(
+        [html.Tr([html.Th(col) for col in ['Start', 'Duration [h]', 'Mean LF [%]', 'Min LF [%]']])] +
+        [html.Tr([html.Td(row['Start'].strftime('%Y/%m/%d %H:00')), html.Td(row['Duration']),
+                  html.Td(round(row['Mean'], 1)), html.Td(round(row['Min'], 1))]) for _, row in df_tab.iterrows()],
+        style={'width': '100%', 'color': '#ffffff'}
+    )
 
-    df_vs = df_data.loc[(df_data['Year'] >= time_range[0]) & (df_data['Year'] <= time_range[1]),
-                        [country_1_code, country_2_code, 'Year', 'Month', 'Day', 'Hour']]
+    return tab_ev
 
-    df_vs['Time'] = df_vs['Year'].apply(str) + '/' + df_vs['Month'].apply(str) + '/' + df_vs['Day'].apply(str)
-    df_vs['Time'] = pd.to_datetime(df_vs['Time'], format='%Y/%m/%d')
-    df_vs.set_index('Time', inplace=True)
-    if gr_sample == 'All':
-        df_vs_s = df_vs
-    else:
-        df_vs_s = df_vs.resample(sample).mean()
 
+########################################################################################################################
+# Capacity Scenarios
+########################################################################################################################
+@app.callback([Output('store_scenario', 'data')],
+              [Input('drop_sc_year', 'value'),
+               Input('btn_sc_set', 'n_clicks'),
+               Input('btn_sc_scale', 'n_clicks'),
+               Input('btn_sc_reset', 'n_clicks')],
+              [State('drop_sc_country', 'value'),
+               State('in_sc_cap', 'value'),
+               State('in_sc_scale', 'value'),
+               State('store_scenario', 'data')])
+def update_scenario(ref_year, n_set, n_scale, n_reset, sc_country, sc_cap, sc_scale, scenario):
+    # Clicks are compared to the ones already applied, so that the output only depends on the inputs. Buttons start
+    # from None again when the page is reloaded, which must not apply anything
+    list_click = [n_set or 0, n_scale or 0, n_reset or 0]
+    if scenario is None or scenario['year'] != ref_year or (n_reset and n_reset != scenario['clicks'][2]):
+        cap = get_base_capacity(ref_year)
+    else:
+        cap = pd.Series(scenario['cap'])
+        sc_code = df_euro.loc[df_euro['Name'] == sc_country, 'Code'].item()
+        if n_set and n_set != scenario['clicks'][0] and sc_cap is not None:
+            cap[sc_code] = sc_cap
+        elif n_scale and n_scale != scenario['clicks'][1] and sc_scale is not None:
+            cap[sc_code] *= sc_scale
+
+    return [{'year': ref_year, 'cap': cap.round(3).to_dict(), 'clicks': list_click}]
+
+
+@app.callback([Output('fig_sc_day', 'figure'),
+               Output('fig_sc_month', 'figure'),
+               Output('fig_sc_per', 'figure'),
+               Output('c_sc', 'children')],
+              [Input('store_scenario', 'data')])
+def fill_scenario(scenario):
+    if scenario is None or sum(scenario['cap'].values()) <= 0:
+        return get_figure([], layout_ini), get_figure([], layout_ini), get_figure([], layout_ini), ''
+
+    ref_year = scenario['year']
+    cap_ref = get_base_capacity(ref_year)
+    cap_sc = pd.Series(scenario['cap']).reindex(list_country).fillna(0)
+    sc_ref = get_scenario_stats(cap_ref)
+    sc_new = get_scenario_stats(cap_sc)
+
+    # Only the countries changed by the scenario are listed
+    list_ch = [country for country in list_country if abs(cap_sc[country] - cap_ref[country]) > 1e-3]
+    md_sc = 'Installed capacity: {} GW ({} GW in {})'.format(round(cap_sc.sum() / 1000, 1),
+                                                             round(cap_ref.sum() / 1000, 1), ref_year)
+    for country in list_ch:
+        md_sc += '  \n{}: {} MW'.format(df_euro.loc[df_euro['Code'] == country, 'Name'].item(), round(cap_sc[country]))
+
+    return create_fig_sc_day(ref_year, sc_ref, sc_new), create_fig_sc_month(ref_year, sc_ref, sc_new), \
+        create_fig_sc_per(ref_year, sc_ref, sc_new), md_sc
+
+
+def create_fig_sc_day(ref_year, sc_ref, sc_new):
     data = [
-        go.Scattergl(
-            x=100 * df_vs_s[country_1_code],
-            y=100 * df_vs_s[country_2_code],
-            name='Whole Period',
-            text=list(df_vs_s.index),
-            mode='markers',
-            marker=dict(
-                color='green',
-                size=5
+        dict(
+            type='scattergl',
+            x=sc_ref['day'].index,
+            y=sc_ref['day'].values,
+            mode='lines',
+            name='Capacities of {} (mean {}%)'.format(ref_year, round(sc_ref['mean'], 1)),
+            line=dict(
+                color='rgb(225, 202,158)'
+            )
+        ),
+        dict(
+            type='scattergl',
+            x=sc_new['day'].index,
+            y=sc_new['day'].values,
+            mode='lines',
+            name='Scenario (mean {}%)'.format(round(sc_new['mean'], 1)),
+            line=dict(
+                color='rgb(202, 225, 158)'
             ),
-            hoverinfo='text'
+            opacity=0.8
         )
     ]
 
-    df_filter = pd.DataFrame()
-    for df_gr in df_vs.groupby(gr_filter):
-        for country in [country_1_code, country_2_code]:
-            if gr_filter == 'Month':
-                idx = datetime.date(1900, df_gr[0], 1).strftime('%B')
-            else:
-                idx = df_gr[0]
-            df_filter.loc[idx, country] = 100 * df_gr[1][country].mean()
-
-    data.append(
-        go.Scattergl(
-            x=df_filter[country_1_code],
-            y=df_filter[country_2_code],
-            mode='markers',
-            text=list(df_filter.index),
-            marker=dict(
-                color='red',
-                size=8
-            ),
-            name=gr_filter,
-            hoverinfo='text'
-        )
-    )
-
-    tab_ann = []
-    for filter in df_filter.index:
-        ann = dict(x=df_filter[country_1_code][filter], y=df_filter[country_2_code][filter], xref='x', yref='y',
-                   text=filter, showarrow=True, align='center', font=dict(color='#ffffff'), arrowhead=2, arrowsize=1,
-                   arrowwidth=2, arrowcolor='#000000', ax=-30, ay=-30, bordercolor='#c7c7c7', borderwidth=2,
-                   borderpad=4, bgcolor='#000000', opacity=0.8)
-        tab_ann.append(ann)
-
-    end_sh = min(max(data[0]['x']), max(data[0]['y']))
-    layout = go.Layout(
-        title='<b>Load Factor between {} and {} from {} to {}<b>'.format(country_1, country_2, time_range[0],
-                                                                         time_range[1]),
+    layout = get_layout(
+        layout_theme,
+        title='<b>Daily Mean Load Factor in Europe</b>',
         xaxis=dict(
-            title='Load Factor {} [%]'.format(country_1)
+            title='Time'
         ),
         yaxis=dict(
-            title='Load Factor {} [%]'.format(country_2)
+            title='Load Factor [%]'
         ),
-        height=650,
-        annotations=tab_ann,
-        hovermode='closest',
         legend=dict(
-            x=.35,
+            x=.2,
             y=1.1,
             orientation="h"
         ),
         margin=dict(l=40, r=0),
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        shapes=[dict(type='line', xref='x', yref='y', x0=0, x1=end_sh, y0=0, y1=end_sh,
-                     line=dict(color='white'))],
-        font=dict(color='#ffffff')
+        height=650
     )
 
-    fig_cr = go.Figure(data=data, layout=layout)
-
-    return fig_cr
-
+    fig_sc_day = get_figure(data, layout)
 
-def create_lfrep(country_1, country_2, time_range):
-    country_1_code = df_euro.loc[df_euro['Name'] == country_1, 'Code'].item()
-    country_2_code = df_euro.loc[df_euro['Name'] == country_2, 'Code'].item()
+    return fig_sc_day
 
-    df_rep_ini = df_data.loc[(df_data['Year'] >= time_range[0]) & (df_data['Year'] <= time_range[1]),
-                             [country_1_code, country_2_code]]
 
-    df_lfrep = pd.DataFrame()
-    list_per = np.linspace(10, 100, num=10)
-    for per in list_per:
-        for country in [country_1_code, country_2_code]:
-            df_lfrep.loc[per, country] = 100 * len(df_rep_ini.loc[100 * df_rep_ini[country] <= per, country]) / len(
-                df_rep_ini)
+def create_fig_sc_month(ref_year, sc_ref, sc_new):
+    list_month = [datetime.date(1900, month, 1).strftime('%B') for month in range(1, 13)]
 
     data = [
-        go.Bar(
-            x=df_lfrep.index,
-            y=df_lfrep[country_1_code],
-            text=list(round(df_lfrep[country_1_code], 2)),
+        dict(
+            type='bar',
+            x=list_month,
+            y=sc_ref['month'],
+            text=list(np.round(sc_ref['month'], 2)),
+            name='Capacities of {}'.format(ref_year),
             textposition='auto',
             hoverinfo='y',
-            name=country_1,
             marker=dict(
                 color='rgb(225, 202,158)',
                 line=dict(
@@ -1646,13 +4382,14 @@ def create_lfrep(country_1, country_2, time_range):
             ),
             opacity=0.8
         ),
-        go.Bar(
-            x=df_lfrep.index,
-            y=df_lfrep[country_2_code],
-            text=list(round(df_lfrep[country_2_code], 2)),
+        dict(
+            type='bar',
+            x=list_month,
+            y=sc_new['month'],
+            text=list(np.round(sc_new['month'], 2)),
+            name='Scenario',
             textposition='auto',
             hoverinfo='y',
-            name=country_2,
             marker=dict(
                 color='rgb(202, 225, 158)',
                 line=dict(
@@ -1663,69 +4400,32 @@ def create_lfrep(country_1, country_2, time_range):
         ),
     ]
 
-    layout = go.Layout(
-        title='<b>Load Factor Repartition from {} to {}</b>'.format(time_range[0], time_range[1]),
+    layout = get_layout(
+        layout_country,
+        title='<b>Mean Load Factor per Month in Europe</b>',
         xaxis=dict(
-            title='Load Factor [%]'
+            title='Month'
         ),
         yaxis=dict(
-            title='Time Percentage [%]'
-        ),
-        legend=dict(
-            x=.35,
-            y=1.1,
-            orientation="h"
-        ),
-        margin=dict(l=40, r=0),
-        height=650,
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+            title='Load Factor [%]'
+        )
     )
 
-    fig_cr = go.Figure(data=data, layout=layout)
-
-    return fig_cr
-
+    fig_sc_month = get_figure(data, layout)
 
-def create_trep(country_1, country_2, time_range, gr_filter, gr_sample):
-    country_1_code = df_euro.loc[df_euro['Name'] == country_1, 'Code'].item()
-    country_2_code = df_euro.loc[df_euro['Name'] == country_2, 'Code'].item()
-
-    df_trep_ini = df_data.loc[(df_data['Year'] >= time_range[0]) & (df_data['Year'] <= time_range[1]),
-                              [country_1_code, country_2_code, 'Year', 'Month', 'Day', 'Hour']]
+    return fig_sc_month
 
-    df_trep = pd.DataFrame()
-    if gr_sample == 'Mean':
-        for df_gr in df_trep_ini.groupby(gr_filter):
-            if gr_filter == 'Month':
-                idx = datetime.date(1900, df_gr[0], 1).strftime('%B')
-            else:
-                idx = df_gr[0]
-            for country in [country_1_code, country_2_code]:
-                df_trep.loc[idx, country] = df_gr[1][country].mean()
-    else:
-        if gr_filter == 'Year':
-            sample = 'A'
-        elif gr_filter == 'Month':
-            sample = 'M'
-        else:
-            sample = 'D'
-        df_trep_ini['Time'] = df_trep_ini['Year'].apply(str) + '/' + df_trep_ini['Month'].apply(str) + '/' + \
-                              df_trep_ini['Day'].apply(str)
-        df_trep_ini['Time'] = pd.to_datetime(df_trep_ini['Time'], format='%Y/%m/%d')
-        df_trep_ini.set_index('Time', inplace=True)
-        df_trep = df_trep_ini.resample(sample).mean()
 
+def create_fig_sc_per(ref_year, sc_ref, sc_new):
     data = [
-        go.Bar(
-            x=df_trep.index,
-            y=100 * df_trep[country_1_code],
-            text=list(round(100 * df_trep[country_1_code], 2)),
+        dict(
+            type='bar',
+            x=sc_ref['per'].index,
+            y=sc_ref['per'].values,
+            text=list(round(sc_ref['per'], 2)),
             textposition='auto',
-            legendgroup='Country_1',
-            hoverinfo='x+y',
-            name=country_1,
+            hoverinfo='y',
+            name='Capacities of {}'.format(ref_year),
             marker=dict(
                 color='rgb(225, 202,158)',
                 line=dict(
@@ -1734,14 +4434,14 @@ def create_trep(country_1, country_2, time_range, gr_filter, gr_sample):
             ),
             opacity=0.8
         ),
-        go.Bar(
-            x=df_trep.index,
-            y=100 * df_trep[country_2_code],
-            text=list(round(100 * df_trep[country_2_code], 2)),
+        dict(
+            type='bar',
+            x=sc_new['per'].index,
+            y=sc_new['per'].values,
+            text=list(round(sc_new['per'], 2)),
             textposition='auto',
-            legendgroup='Country_2',
-            hoverinfo='x+y',
-            name=country_2,
+            hoverinfo='y',
+            name='Scenario',
             marker=dict(
                 color='rgb(202, 225, 158)',
                 line=dict(
@@ -1752,110 +4452,600 @@ def create_trep(country_1, country_2, time_range, gr_filter, gr_sample):
         ),
     ]
 
-    layout = go.Layout(
-        title='<b>Mean Load Factor per {} from {} to {}</b>'.format(gr_filter, time_range[0], time_range[1]),
+    layout = get_layout(
+        layout_country,
+        title='<b>Load Factor Repartition in Europe</b>',
         xaxis=dict(
-            title=gr_filter,
-        ),
-        yaxis=dict(
             title='Load Factor [%]'
         ),
-        legend=dict(
-            x=.35,
-            y=1.1,
-            orientation="h"
-        ),
-        margin=dict(l=40, r=0),
-        height=650,
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
+        yaxis=dict(
+            title='Time Percentage [%]'
+        )
     )
 
-    fig_cr = go.Figure(data=data, layout=layout)
+    fig_sc_per = get_figure(data, layout)
 
-    return fig_cr
+    return fig_sc_per
 
 
-def create_stacked(country_1, time_range, gr_filter, gr_sample):
-    country_1_code = df_euro.loc[df_euro['Name'] == country_1, 'Code'].item()
+########################################################################################################################
+# Refresh Slider Range
+########################################################################################################################
+@app.callback([Output('c_sl_range', 'children')],
+              [Input('sl_range', 'value')])
+def refresh_slider_range(range_value):
+    str_range = [str(range_value[0]) + ' - ' + str(range_value[1])]
 
-    df_st_ini = df_data.loc[(df_data['Year'] >= time_range[0]) & (df_data['Year'] <= time_range[1]),
-                              [country_1_code, 'Year', 'Month', 'Day', 'Hour']]
+    return str_range
 
-    list_per = np.linspace(10, 100, num=10)
-    df_st = pd.DataFrame()
-    if gr_sample == 'Mean':
-        for df_gr in df_st_ini.groupby(gr_filter):
-            if gr_filter == 'Month':
-                idx = datetime.date(1900, df_gr[0], 1).strftime('%B')
+
+########################################################################################################################
+# Data Update
+########################################################################################################################
+# New years are appended with 'python Wind_Energy_Europe_Dash.py ingest <file>'. Workers check the stored years and the
+# capacity file, compute only the changed years and swap in the new state
+def get_data_stamp():
+
+    return os.stat(os.path.join(data_store.path, 'meta.json')).st_mtime_ns, os.stat('Capacity_EU_Wind.csv').st_mtime_ns
+
+
+def reload_data():
+    global data_store, list_year, df_cap, has_capacity, dict_year_hash, dict_year_mean, dict_year_stats, \
+        df_mean_year, fig_load_year, fig_cap_year, html_fig_load_year, html_fig_cap_year, lf_matrix, climatology, \
+        ramp_hist, lf_hist, prod_matrix, data_stamp, data_hash
+    stamp = get_data_stamp()
+    store = PartitionedData(data_store.path)
+    df_capacity = read_capacity('Capacity_EU_Wind.csv')
+    mask = get_capacity_mask(df_capacity)
+    year_hash = get_year_hash(store, df_capacity)
+
+    list_year_ch = [year for year in year_hash if year_hash[year] != dict_year_hash.get(year)]
+    if list_year_ch:
+        year_mean = dict(dict_year_mean)
+        for year in list_year_ch:
+            if year in store.years:
+                year_mean[year] = build_year_mean(year, store, mask)
             else:
-                idx = df_gr[0]
-            for per in list_per:
-                df_st.loc[idx, per] = 100 * len(df_gr[1].loc[(100 * df_gr[1][country_1_code] <= per) &
-                                                             (100 * df_gr[1][country_1_code] > per - 10)]) / len(df_gr[1])
-    elif gr_sample == 'All':
-        if gr_filter == 'Year':
-            groupby_f = 'Year'
-        elif gr_filter == 'Month':
-            groupby_f = ['Year', 'Month']
-        else:
-            if time_range[1] == time_range[0]:
-                groupby_f = ['Year', 'Month', 'Day']
+                year_mean.pop(year, None)
+        df_mean = get_mean_year(year_mean)
+        fig_load = create_fig_load_year(df_mean)
+        fig_cap = create_fig_cap_year(df_capacity)
+        html_fig_load = template_download_plotly(fig_load)
+        html_fig_cap = template_download_plotly(fig_cap)
+
+        # Lazy data being built from the previous state is waited for, then dropped in the same swap, so that it is
+        # never built from a partly updated state
+        with lazy_lock:
+            data_store, list_year, df_cap, has_capacity, dict_year_hash, dict_year_mean, df_mean_year, \
+                fig_load_year, fig_cap_year, html_fig_load_year, html_fig_cap_year = store, store.years, df_capacity, \
+                mask, year_hash, year_mean, df_mean, fig_load, fig_cap, html_fig_load, html_fig_cap
+            # Pairwise statistics of the unchanged years are kept, the others are built again on use
+            dict_year_stats = {year: stats for year, stats in dict_year_stats.items() if year not in list_year_ch}
+            lf_matrix = None
+            climatology = None
+            ramp_hist = None
+            lf_hist = None
+            prod_matrix = None
+            dict_joint_low.clear()
+            dict_rep_count.clear()
+            dict_event_index.clear()
+            data_hash = get_data_hash(year_hash)
+
+        # Disk cache keys follow the year hashes, in-process values of the changed years are removed
+        cache_response.clear()
+        cache_graph.discard(lambda key: any(year in list_year_ch for year in get_custom_graph_years(key)))
+    data_stamp = stamp
+
+
+data_stamp = get_data_stamp()
+reload_interval = float(os.environ.get('reload_interval', 30))
+reload_time = time.time()
+reload_lock = threading.Lock()
+
+
+@server.before_request
+def check_data_update():
+    global reload_time
+    if time.time() - reload_time > reload_interval:
+        reload_time = time.time()
+        # Other threads keep serving the current state during the reload
+        if get_data_stamp() != data_stamp and reload_lock.acquire(blocking=False):
+            try:
+                reload_data()
+            finally:
+                reload_lock.release()
+
+
+########################################################################################################################
+# Data Export
+########################################################################################################################
+# Hourly or resampled load factors of the selected countries and years, streamed one year at a time as CSV or Arrow
+# IPC, optionally gzipped, e.g. /export?countries=FR,DE&start=2000&end=2015&sample=Day&format=csv&compress=gzip
+@server.route('/export')
+def export_data():
+    list_code = request.args.get('countries', ','.join(list_country)).split(',')
+    sample = request.args.get('sample', 'Hour')
+    file_format = request.args.get('format', 'csv')
+    compress = request.args.get('compress')
+    try:
+        start = int(request.args.get('start', min(list_year)))
+        end = int(request.args.get('end', max(list_year)))
+    except ValueError:
+        return jsonify({'error': 'start and end must be years'}), 400
+    list_unknown = [code for code in list_code if code not in list_country]
+    if list_unknown:
+        return jsonify({'error': 'unknown countries: {}'.format(', '.join(list_unknown))}), 400
+    if sample not in list_time or file_format not in ['csv', 'arrow'] or compress not in [None, 'gzip']:
+        return jsonify({'error': 'sample must be one of {}, format csv or arrow and compress gzip'.format(
+            ', '.join(list_time))}), 400
+    if file_format == 'arrow' and pa is None:
+        return jsonify({'error': 'Arrow export requires pyarrow'}), 501
+
+    years = [year for year in list_year if start <= year <= end]
+    if file_format == 'csv':
+        chunks = get_export_csv(data_store, has_capacity, years, list_code, sample)
+        file_name, mimetype = 'Load_Factor.csv', 'text/csv'
+    else:
+        chunks = get_export_arrow(data_store, has_capacity, years, list_code, sample)
+        file_name, mimetype = 'Load_Factor.arrow', 'application/vnd.apache.arrow.stream'
+    if compress == 'gzip':
+        chunks = get_gzip_chunks(chunks)
+        file_name, mimetype = file_name + '.gz', 'application/gzip'
+
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename={}'.format(file_name)})
+
+
+def get_export_year(store, mask, year, list_code, sample):
+    # A year always contains whole days, months and itself, so each one can be resampled alone
+    df_year = store.load([year], list_code, mask)
+    list_col = list_time[:list_time.index(sample) + 1]
+    if sample == 'Hour':
+        return df_year[list_col + list_code]
+
+    return df_year.groupby(list_col)[list_code].mean().reset_index()
+
+
+def get_export_csv(store, mask, years, list_code, sample):
+    for idx, year in enumerate(years):
+        yield get_export_year(store, mask, year, list_code, sample).to_csv(header=idx == 0, index=False)
+
+
+def get_export_arrow(store, mask, years, list_code, sample):
+    # The stream writer fills a buffer which is emptied after each year
+    sink = io.BytesIO()
+    writer = None
+    for year in years:
+        table = pa.Table.from_pandas(get_export_year(store, mask, year, list_code, sample), preserve_index=False)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        yield get_sink_chunk(sink)
+    if writer is not None:
+        writer.close()
+        yield get_sink_chunk(sink)
+
+
+def get_sink_chunk(sink):
+    chunk = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+
+    return chunk
+
+
+def get_gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+########################################################################################################################
+# Statistics API
+########################################################################################################################
+# Read-only JSON API answering from the cached aggregates, for many countries and years per call, e.g.
+# /api/v1/monthly?countries=FR,DE&years=2000-2015. Responses are tagged with the query and the data version, so that
+# clients can send If-None-Match
+def get_api_args():
+    list_code = request.args.get('countries', ','.join(list_country)).split(',')
+    list_unknown = [code for code in list_code if code not in list_country]
+    if list_unknown:
+        raise ValueError('unknown countries: {}'.format(', '.join(list_unknown)))
+
+    years = []
+    for str_year in request.args.get('years', '{}-{}'.format(min(list_year), max(list_year))).split(','):
+        list_bound = [int(year) for year in str_year.split('-')]
+        years += [year for year in list_year if list_bound[0] <= year <= list_bound[-1]]
+    if not years:
+        raise ValueError('no data for the given years')
+
+    return list_code, sorted(set(years))
+
+
+def get_api_value(value):
+    # NaN is not valid JSON
+    return None if np.isnan(value) else float(value)
+
+
+def get_api_response(func):
+    key = hashlib.sha1('{} {}'.format(request.full_path, data_hash).encode()).hexdigest()
+    if any(tag.split(':')[0] == key for tag in request.if_none_match.as_set()):
+        response = server.response_class(status=304)
+    else:
+        try:
+            list_code, years = get_api_args()
+            dict_result = func(list_code, years)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = jsonify(dict(dict_result, countries=list_code, years=years))
+    response.set_etag(key)
+
+    return response
+
+
+def get_rep_count(year):
+    # Hours below each load factor step for every country and Europe as in create_fig_rep_per, kept per year hash
+    key = (year, dict_year_hash[year])
+    rep_count = dict_rep_count.get(key)
+    if rep_count is None:
+        df_data_rep = get_data([year])[list_country]
+        lf_eu = np.nan if year not in df_cap.columns else 0
+        for country in list_country if year in df_cap.columns else []:
+            if country in df_cap.index and not np.isnan(df_cap[year][country]):
+                lf_eu += df_data_rep[country] * df_cap[year][country] / df_cap[year].sum()
+        df_data_rep['EU'] = lf_eu
+        rep_count = {'count': np.array([(100 * df_data_rep <= per).sum().values for per in rep_per]),
+                     'hours': len(df_data_rep)}
+        dict_rep_count[key] = rep_count
+
+    return rep_count
+
+
+rep_per = np.linspace(10, 100, num=10)
+dict_rep_count = {}
+
+
+@server.route('/api/v1/')
+def get_api_index():
+    return jsonify({'endpoints': ['/api/v1/mean', '/api/v1/monthly', '/api/v1/corr', '/api/v1/repartition',
+                                  '/api/v1/percentile'],
+                    'arguments': {'countries': 'comma separated codes, all by default',
+                                  'years': 'comma separated years or ranges as 2000-2015, all by default',
+                                  'percentiles': 'percentile only, comma separated, 5,50,95 by default',
+                                  'below': 'percentile only, comma separated load factors in %, 10 by default'}})
+
+
+@server.route('/api/v1/mean')
+def get_api_mean():
+    # Yearly mean load factor, as in create_fig_load_year
+    def get_mean(list_code, years):
+        return {'mean': {code: {year: get_api_value(df_mean_year.loc[year, code]) for year in years}
+                         for code in list_code}}
+
+    return get_api_response(get_mean)
+
+
+@server.route('/api/v1/monthly')
+def get_api_monthly():
+    # Monthly mean load factor of each country and the capacity-weighted European one, as in create_fig_rep_month
+    def get_monthly(list_code, years):
+        dict_monthly = {code: {} for code in list_code + ['EU']}
+        for year in years:
+            lf_month = get_month_mean(year)
+            if year in df_cap.columns:
+                cap = df_cap[year].reindex(list_country)
+                lf_eu = (lf_month[cap.dropna().index] * cap.dropna()).sum(axis=1, min_count=1) / df_cap[year].sum()
             else:
-                groupby_f = ['Year', 'Month']
-        for df_gr in df_st_ini.groupby(groupby_f):
-            idx = [str(i) for i in df_gr[0]]
-            idx = pd.to_datetime('/'.join(idx), format='%Y/%m/%d')
-            for per in list_per:
-                df_st.loc[idx, per] = 100 * len(df_gr[1].loc[(100 * df_gr[1][country_1_code] <= per) &
-                                                             (100 * df_gr[1][country_1_code] > per - 10)]) / len(df_gr[1])
+                lf_eu = pd.Series(np.nan, index=lf_month.index)
+            for code in list_code:
+                dict_monthly[code][year] = [get_api_value(lf) for lf in lf_month[code]]
+            dict_monthly['EU'][year] = [get_api_value(lf) for lf in lf_eu]
 
-    data = []
-    for per in list_per:
-        trace = go.Scatter(
-            x=df_st.index,
-            y=df_st[per],
-            name='LF < {}%'.format(round(per, 0)),
-            stackgroup='st_gr',
-            groupnorm='percent'
-        )
-        data.append(trace)
+        return {'monthly': dict_monthly}
 
-    layout = go.Layout(
-        title='<b>Load Factor Repartition in {} per {} from {} to {}</b>'.format(country_1, gr_filter, time_range[0],
-                                                                                time_range[1]),
-        xaxis=dict(
-            title=gr_filter
-        ),
-        yaxis=dict(
-            title='Time Percentage [%]'
-        ),
-        margin=dict(l=40, r=0),
-        height=650,
-        paper_bgcolor='#01053c',
-        plot_bgcolor='#01053c',
-        font=dict(color='#ffffff')
-    )
+    return get_api_response(get_monthly)
 
-    fig_cr = go.Figure(data=data, layout=layout)
 
-    return fig_cr
+@server.route('/api/v1/corr')
+def get_api_corr():
+    # Correlation between every pair of the given countries over the given years
+    def get_api_corr_matrix(list_code, years):
+        df_data_corr = get_corr(years).loc[list_code, list_code]
+
+        return {'corr': {code: {code_2: get_api_value(df_data_corr.loc[code, code_2]) for code_2 in list_code}
+                         for code in list_code}}
+
+    return get_api_response(get_api_corr_matrix)
+
+
+@server.route('/api/v1/repartition')
+def get_api_repartition():
+    # Percentage of hours with a load factor below 10%, 20% ... 100%, as in create_fig_rep_per
+    def get_repartition(list_code, years):
+        list_idx = [list_country.get_loc(code) for code in list_code] + [len(list_country)]
+        dict_rep = {code: {} for code in list_code + ['EU']}
+        for year in years:
+            rep_count = get_rep_count(year)
+            for code, idx in zip(list_code + ['EU'], list_idx):
+                dict_rep[code][year] = [100 * count / rep_count['hours'] for count in rep_count['count'][:, idx]]
+
+        return {'load_factor': list(rep_per), 'repartition': dict_rep}
+
+    return get_api_response(get_repartition)
+
+
+@server.route('/api/v1/percentile')
+def get_api_percentile():
+    # Load factor percentiles and percentages of the time below given load factors over all the years, merged from the
+    # histograms of create_lf_band
+    def get_percentile(list_code, years):
+        list_per = [float(per) for per in request.args.get('percentiles', '5,50,95').split(',')]
+        list_below = [float(lf) for lf in request.args.get('below', '10').split(',')]
+        if not all(0 <= value <= 100 for value in list_per + list_below):
+            raise ValueError('percentiles and load factors must be between 0 and 100')
+
+        hist = get_lf_stats(years, list_code + ['EU']).sum(axis=(0, 1))
+        return {'percentile': {code: {str(per): get_api_value(100 * get_lf_percentile(hist[idx], per))
+                                      for per in list_per} for idx, code in enumerate(list_code + ['EU'])},
+                'below': {code: {str(lf): get_api_value(get_lf_share(hist[idx], lf / 100)) for lf in list_below}
+                          for idx, code in enumerate(list_code + ['EU'])},
+                'resolution': 100 * lf_step}
+
+    return get_api_response(get_percentile)
 
 
 ########################################################################################################################
-# Refresh Slider Range
+# Callback Response Cache
 ########################################################################################################################
-@app.callback([Output('c_sl_range', 'children')],
-              [Input('sl_range', 'value')])
-def refresh_slider_range(range_value):
-    str_range = [str(range_value[0]) + ' - ' + str(range_value[1])]
+# Callbacks only depend on their inputs and states (sl_year, drop_country, custom graph dropdowns), so the response of
+# a callback request is kept by input hash. This hash is also sent as ETag.
+def get_request_key():
+    body = json.loads(request.get_data())
+    body.pop('changedPropIds', None)
+    body['data_hash'] = data_hash
 
-    return str_range
+    return hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()
+
+
+@server.before_request
+def get_cached_response():
+    if request.method == 'POST' and request.path.endswith('_dash-update-component'):
+        key = get_request_key()
+        g.cache_key = key
+        prefetcher.start_request()
+        g.prefetch_paused = True
+
+        # Dash never sends conditional requests, cached responses are returned whole
+        data = cache_response.get(key)
+        if data is not None:
+            g.cache_hit = True
+            return server.response_class(data, mimetype='application/json')
+
+
+@server.after_request
+def set_cached_response(response):
+    if response.status_code != 200 or response.is_streamed:
+        return response
+
+    key = g.get('cache_key')
+    if key is not None:
+        if not g.get('cache_hit'):
+            data = response.get_data()
+            cache_response.set(key, data, len(data))
+        response.set_etag(key)
+    elif request.method == 'GET' and response.mimetype == 'application/json':
+        response.add_etag()
+
+    return response
+
+
+@server.teardown_request
+def end_callback_request(exc):
+    if g.get('prefetch_paused'):
+        prefetcher.end_request()
+
+
+@server.route('/_cache-stats')
+def get_cache_stats():
+    return jsonify({'graph': cache_graph.stats(), 'response': cache_response.stats()})
+
+
+########################################################################################################################
+# Static Export
+########################################################################################################################
+# Every year and country selection, and a grid of custom graphs, written to static files with
+# 'python Wind_Energy_Europe_Dash.py export <dir> [grid.json]'. The grid gives the values of each custom graph input,
+# e.g. {"gr_type": ["Scatter", "Versus"], "country_1": [["France", "Spain"]], "time_range": [[2010, 2015]]}, missing
+# inputs take the layout values. Figures are written as JSON and downloads as HTML, maps being the same document as
+# their download. Outputs whose cache key, which follows the year hashes, is unchanged in the manifest are skipped
+dict_export_output = {
+    'year_choice': ['fig_heatmap_hour', 'fig_heatmap_lag', 'dl_heatmap_hour', 'dl_heatmap_lag'],
+    'heatmap_choice': ['fig_heatmap', 'dl_heatmap'],
+    'map_choice': ['map_load', 'dl_map_load_year'],
+    'country_choice': ['map_corr', 'fig_rep_month', 'fig_rep_per', 'dl_fig_rep_month', 'dl_fig_rep_per',
+                       'dl_map_corr'],
+    'create_custom_graph': ['fig_cr', 'dl_fig_cr']
+}
+dict_export_func = {'year_choice': build_year_choice, 'heatmap_choice': build_heatmap_choice,
+                    'map_choice': build_map_choice, 'country_choice': build_country_choice,
+                    'create_custom_graph': build_custom_graph}
+dict_export_grid = OrderedDict([('country_1', [['France']]), ('country_2', ['Germany']), ('time_range', [[2014, 2015]]),
+                                ('gr_type', ['Scatter']), ('gr_filter', ['Month']), ('gr_sample', ['All']),
+                                ('gr_target', ['Variance'])])
+
+
+def get_export_tasks(grid):
+    list_task = [('year_choice', [year], [year]) for year in list_year]
+    list_task += [('heatmap_choice', [year, heat_type], [year])
+                  for year in list_year for heat_type in ['Correlation'] + joint_low_per]
+    list_task += [('map_choice', [year, map_type], get_map_years(year, map_type))
+                  for year in list_year for map_type in ['Load Factor', 'Anomaly']]
+    list_task += [('country_choice', [country, year], [year])
+                  for year in list_year for country in sorted(set(drop_country))]
+
+    # Combinations giving the same graph are exported once
+    list_key = []
+    for values in itertools.product(*[grid.get(arg, default) for arg, default in dict_export_grid.items()]):
+        key = normalize_custom_graph(*values)
+        if key[0] is not None and key not in list_key:
+            list_key.append(key)
+    list_task += [('create_custom_graph', key, get_custom_graph_years(key)) for key in list_key]
+
+    return list_task
+
+
+def get_export_label(name, args):
+    if name == 'create_custom_graph':
+        return hashlib.sha1(json.dumps(list(args)).encode()).hexdigest()[:12]
+
+    return '_'.join(str(arg).replace(' ', '_') for arg in args)
+
+
+def export_task(task):
+    name, args, years, path = task
+    time_start = time.time()
+    try:
+        output = get_cached(name, args, years, dict_export_func[name])
+    except Exception as e:
+        # Selections the dashboard cannot show, as countries of years without capacities, are reported in the manifest
+        return [], time.time() - time_start, '{}: {}'.format(type(e).__name__, e)
+
+    os.makedirs(path, exist_ok=True)
+    list_file = []
+    for output_id, value in zip(dict_export_output[name], output):
+        if isinstance(value, str) and value.startswith('data:text/html'):
+            file, content = output_id + '.html', unquote(value.split(',', 1)[1])
+        elif isinstance(value, dict):
+            file, content = output_id + '.json', to_json_plotly(value)
+        else:
+            continue
+        with open(os.path.join(path, file), 'w') as f:
+            f.write(content)
+        list_file.append(file)
+
+    return list_file, time.time() - time_start, None
+
+
+def export_static(path, grid, processes=None):
+    time_start = time.time()
+    file_manifest = os.path.join(path, 'manifest.json')
+    dict_done = {}
+    if os.path.exists(file_manifest):
+        with open(file_manifest) as f:
+            dict_done = json.load(f)['outputs']
+
+    list_todo = []
+    dict_output = {}
+    for name, args, years in get_export_tasks(grid):
+        label = '{}/{}'.format(name, get_export_label(name, args))
+        key = get_cache_key(name, args, years)
+        done = dict_done.get(label)
+        if done is not None and done['key'] == key and done.get('error') is None and \
+                all(os.path.exists(os.path.join(path, label, file)) for file in done['files']):
+            dict_output[label] = dict(done, skipped=True)
+        else:
+            list_todo.append((label, key, (name, args, years, os.path.join(path, label))))
+
+    # Lazy data is loaded before forking, so that every process shares it
+    if list_todo:
+        get_lf_matrix()
+        get_climatology()
+        get_ramp_hist()
+        get_lf_hist()
+        get_prod_matrix()
+
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        for (label, key, task), (list_file, seconds, error) in zip(list_todo, pool.imap(
+                export_task, [task for _, _, task in list_todo])):
+            dict_output[label] = {'name': task[0], 'args': list(task[1]), 'key': key, 'files': list_file,
+                                  'seconds': round(seconds, 3), 'error': error, 'skipped': False}
+
+    manifest = {'static_hash': static_hash, 'year_hash': dict_year_hash, 'grid': grid,
+                'processes': processes or os.cpu_count(), 'seconds': round(time.time() - time_start, 3),
+                'outputs': dict_output}
+    path_tmp = '{}.tmp{}'.format(file_manifest, os.getpid())
+    with open(path_tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path_tmp, file_manifest)
+
+    list_error = [label for label in dict_output if dict_output[label]['error'] is not None]
+
+    return len(list_todo) - len(list_error), len(dict_output) - len(list_todo), len(list_error)
+
+
+########################################################################################################################
+# Benchmark
+########################################################################################################################
+# Build times of every figure and of its download, without the callback caches, printed with
+# 'python Wind_Energy_Europe_Dash.py benchmark [repeat]'. The first build also fills the intermediate caches, the mean
+# time of a new selection lying between the minimum and the mean
+def get_benchmark_tasks():
+    year = max(list_year)
+    time_range = [max(min(list_year), year - 1), year]
+    country_1 = 'France' if 'France' in drop_country else drop_country[0]
+    country_2 = 'Germany' if 'Germany' in drop_country else drop_country[-1]
+
+    list_task = [(func.__name__, func, [year]) for func in [create_heatmap, create_heatmap_hour, create_heatmap_lag]]
+    list_task += [(create_heatmap_joint.__name__, create_heatmap_joint, [year, joint_low_per[0]])]
+    list_task += [(func.__name__, func, [year, country_1]) for func in [create_fig_rep_month, create_fig_rep_per]]
+    list_task += [(gr_type, lambda *args: build_custom_graph(*normalize_custom_graph(*args))[0],
+                   [[country_1], country_2, time_range, gr_type, 'Month', 'All', 'Variance']) for gr_type in list_type]
+
+    return list_task
+
+
+def get_timing(func, args, repeat):
+    list_time = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        output = func(*args)
+        list_time.append((time.perf_counter() - time_start) * 1000)
+
+    return output, min(list_time), sum(list_time) / repeat
+
+
+def benchmark_figures(repeat):
+    get_lf_matrix()
+    get_climatology()
+    get_ramp_hist()
+    get_lf_hist()
+    get_prod_matrix()
+
+    list_line = ['{:<25}{:>12}{:>12}{:>16}'.format('Figure', 'Min [ms]', 'Mean [ms]', 'Download [ms]')]
+    for name, func, args in get_benchmark_tasks():
+        try:
+            fig, time_min, time_mean = get_timing(func, args, repeat)
+            _, time_dl, _ = get_timing(template_download_plotly, [fig], repeat)
+        except Exception as e:
+            list_line.append('{:<25}{}: {}'.format(name, type(e).__name__, e))
+            continue
+        list_line.append('{:<25}{:>12.1f}{:>12.1f}{:>16.1f}'.format(name, time_min, time_mean, time_dl))
+
+    return list_line
 
 
 ########################################################################################################################
 # Deployment
 ########################################################################################################################
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    if len(sys.argv) == 3 and sys.argv[1] == 'ingest':
+        print('Years added: {}'.format(append_partitions(sys.argv[2], data_store.path)))
+        # Climatologies of the previous data are not used anymore, workers reading one meanwhile compute it again
+        for file_clim in os.listdir(data_store.path):
+            if file_clim.startswith('climatology_') and '.tmp' not in file_clim:
+                os.remove(os.path.join(data_store.path, file_clim))
+    elif len(sys.argv) in [3, 4] and sys.argv[1] == 'export':
+        grid_export = {}
+        if len(sys.argv) == 4:
+            with open(sys.argv[3]) as f:
+                grid_export = json.load(f)
+        processes_export = int(os.environ.get('export_processes', 0)) or None
+        print('Outputs written: {}, skipped: {}, failed: {}'.format(
+            *export_static(sys.argv[2], grid_export, processes_export)))
+    elif len(sys.argv) in [2, 3] and sys.argv[1] == 'benchmark':
+        print('\n'.join(benchmark_figures(int(sys.argv[2]) if len(sys.argv) == 3 else 5)))
+    else:
+        app.run_server(debug=True)
@@ -0,0 +1,65 @@
+import base64
+import json
+import os
+import random
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import plotly
+
+# Outputs are computed by the callbacks themselves, not taken from the prefetcher
+os.environ['prefetch_cpu'] = '0'
+import Wind_Energy_Europe_Dash as app
+
+
+def get_calls():
+    list_call = []
+    for year in [2014, 2015]:
+        list_call.append(('year_choice', app.build_year_choice, (year,)))
+        list_call.append(('heatmap_choice', app.build_heatmap_choice, (year, 'Correlation')))
+        list_call.append(('heatmap_choice', app.build_heatmap_choice, (year, app.joint_low_per[0])))
+        for map_type in ['Load Factor', 'Anomaly']:
+            list_call.append(('map_choice', app.build_map_choice, (year, map_type)))
+        for country in ['France', 'Germany', 'Spain']:
+            list_call.append(('country_choice', app.build_country_choice, (country, year)))
+        list_call.append(('fill_scatter', app.fill_scatter, ({'points': [{'x': 'FR', 'y': 'DE'}]}, year)))
+        list_call.append(('fill_graph_hour', app.fill_graph_hour, ({'points': [{'x': 13, 'y': 'FR'}]}, year)))
+    for gr_type in app.list_type:
+        for gr_filter in ['Year', 'Hour']:
+            key = app.normalize_custom_graph(['France', 'Spain'], 'Germany', [2010, 2015], gr_type, gr_filter, 'Mean',
+                                             'LF < 20%')
+            if key[0] is not None:
+                list_call.append(('custom_graph', app.build_custom_graph, key))
+    list_call.append(('fill_events', app.fill_events, ('Europe', 10, 12, [2010, 2015])))
+    list_call.append(('fill_events', app.fill_events, ('France', 15, 24, [1990, 2015])))
+
+    return list_call
+
+
+def get_output(func, args):
+    # Plotly and folium give random ids to their elements, also found in the base64 downloads
+    output = json.dumps(func(*args), cls=plotly.utils.PlotlyJSONEncoder, sort_keys=True)
+    output = re.sub(r'data:text/html;charset=utf-8;base64,([A-Za-z0-9+/=]+)',
+                    lambda match: base64.b64decode(match.group(1)).decode('utf-8'), output)
+    output = re.sub(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', 'uuid', output)
+
+    return re.sub(r'[0-9a-f]{32}', 'uuid', output)
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    list_call = get_calls()
+
+    # Parallel runs first, so that the lazily built matrices are also requested by several threads at once
+    list_task = [idx for idx in range(len(list_call)) for _ in range(repeat)]
+    random.shuffle(list_task)
+    with ThreadPoolExecutor(threads) as executor:
+        list_parallel = list(executor.map(lambda idx: (idx, get_output(*list_call[idx][1:])), list_task))
+    list_serial = [get_output(func, args) for name, func, args in list_call]
+
+    list_error = ['{} {}'.format(list_call[idx][0], list_call[idx][2]) for idx, output in list_parallel
+                  if output != list_serial[idx]]
+    assert not list_error, 'Outputs differing from the serial run:\n' + '\n'.join(sorted(set(list_error)))
+    print('{} calls on {} threads match the serial run'.format(len(list_task), threads))